@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the BLAST6 file parsing in blast_file_processor.GetBLAST6Scores against the line-by-line
+lil_matrix parser it replaced (GetBLAST6Scores_ByRow).
+
+Usage: python benchmark_blast_file_processor.py [nHits]
+"""
+
+import os
+import sys
+import gzip
+import time
+import shutil
+import tempfile
+import numpy as np
+
+baseDir = os.path.dirname(os.path.realpath(__file__)) + os.sep
+sys.path.append(baseDir + "../orthofinder/scripts")
+import util
+import parallel_task_manager
+import blast_file_processor as BlastFileProcessor
+
+def WriteSyntheticBlastFile(fn, nHits, nSeqs_i, nSeqs_j, iSpecies, jSpecies, qGzip):
+    np.random.seed(1)
+    q = np.random.randint(0, nSeqs_i, nHits)
+    h = np.random.randint(0, nSeqs_j, nHits)
+    s = np.round(np.random.exponential(100., nHits), 1)
+    with (gzip.open(fn + ".gz", 'wb') if qGzip else open(fn, 'wb')) as outfile:
+        for qq, hh, ss in zip(q, h, s):
+            outfile.write("%d_%d\t%d_%d\t45.2\t210\t110\t3\t1\t210\t5\t214\t1e-30\t%s\n" % (iSpecies, qq, jSpecies, hh, repr(ss)))
+
+def Time(f, nRepeats=3):
+    best = None
+    for _ in xrange(nRepeats):
+        start = time.time()
+        result = f()
+        t = time.time() - start
+        best = t if best is None else min(best, t)
+    return best, result
+
+def main(nHits):
+    nSeqs_i, nSeqs_j = 5000, 6000
+    seqsInfo = util.SequencesInfo(nSeqs=nSeqs_i+nSeqs_j, nSpecies=2, speciesToUse=[0,1], seqStartingIndices=[0, nSeqs_i], nSeqsPerSpecies={0:nSeqs_i, 1:nSeqs_j})
+    d = tempfile.mkdtemp() + os.sep
+    try:
+        for qGzip in (False, True):
+            WriteSyntheticBlastFile(d + "Blast0_1.txt", nHits, nSeqs_i, nSeqs_j, 0, 1, qGzip)
+            fn = d + "Blast0_1.txt" + (".gz" if qGzip else "")
+            print("%d hits, %s (%.1f MB)" % (nHits, "gzip" if qGzip else "plain text", os.path.getsize(fn)/1e6))
+            t_new, B_new = Time(lambda : BlastFileProcessor.GetBLAST6Scores(seqsInfo, [d], 0, 1))
+            with (gzip.open(fn, 'rb') if qGzip else open(fn, 'rb')) as infile:
+                lines = infile.readlines()
+            t_old, B_old = Time(lambda : BlastFileProcessor.GetBLAST6Scores_ByRow(lines, d, 0, 1, 0, 1, nSeqs_i, nSeqs_j, False), 1)
+            qSame = (B_new != B_old.tocsr()).nnz == 0
+            print("  vectorised: %.3fs" % t_new)
+            print("  by row:     %.3fs" % t_old)
+            print("  speed-up:   %.1fx, identical matrices: %s" % (t_old/t_new, qSame))
+            os.remove(fn)
+    finally:
+        shutil.rmtree(d)
+
+if __name__ == "__main__":
+    try:
+        main(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
+    finally:
+        parallel_task_manager.ParallelTaskManager_singleton().Stop()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Benchmark of reading newick trees: trees and nodes per second for the single-pass reader used for formats 0, 1, 2, 3
+& 5 compared to the general regex-based reader, on large random trees and on a directory of gene trees.
+
+Usage: python benchmark_newick.py [trees_directory]
+(defaults to the gene trees for the ExampleDataset in Input/FromTrees)
+"""
+
+import os
+import sys
+import glob
+import time
+import random
+
+baseDir = os.path.dirname(os.path.realpath(__file__)) + os.sep
+sys.path.append(baseDir + "../orthofinder/scripts")
+import newick
+import tree as tree_lib
+
+def Time(f, nRepeats=3):
+    best = None
+    for _ in xrange(nRepeats):
+        start = time.time()
+        f()
+        t = time.time() - start
+        best = t if best is None else min(best, t)
+    return best
+
+def RandomTree(nLeaves, nSpecies=20):
+    """ Newick string (format 0) of a random tree with OrthoFinder gene IDs, support values and branch lengths """
+    stack = ["%d_%d:%.6f" % (i % nSpecies, i, random.random()) for i in xrange(nLeaves)]
+    while len(stack) > 1:
+        i = random.randrange(len(stack) - 1)
+        stack[i:i+2] = ["(%s,%s)%.6f:%.6f" % (stack[i], stack[i+1], random.random(), random.random())]
+    return stack[0] + ";"
+
+def TimeReaders(texts, format):
+    fastFormats = dict(newick._FAST_FORMATS)
+    newick._FAST_FORMATS.clear()
+    try:
+        t_regex = Time(lambda : [tree_lib.Tree(text, format=format) for text in texts])
+    finally:
+        newick._FAST_FORMATS.update(fastFormats)
+    t_fast = Time(lambda : [tree_lib.Tree(text, format=format) for text in texts])
+    return t_regex, t_fast
+
+def Report(name, texts, format=0):
+    nNodes = sum(1 for text in texts for _ in tree_lib.Tree(text, format=format).traverse())
+    nBytes = sum(len(text) for text in texts)
+    t_regex, t_fast = TimeReaders(texts, format)
+    print("%s: %d trees, %d nodes, %.1f MB" % (name, len(texts), nNodes, nBytes/1e6))
+    for reader, t in [("regex", t_regex), ("single-pass", t_fast)]:
+        print("  %-12s %.3fs, %.1f trees/s, %.0f nodes/s, %.1f MB/s" % (reader, t, len(texts)/t, nNodes/t, nBytes/1e6/t))
+    print("  speed-up:    %.2fx" % (t_regex/t_fast))
+
+def main(d):
+    random.seed(1)
+    Report("Random trees, 1000 leaves", [RandomTree(1000) for _ in xrange(20)])
+    Report("Random tree, 100000 leaves", [RandomTree(100000)])
+    fns = sorted(glob.glob(d + "*"))
+    if fns:
+        Report(d, [open(fn, 'rb').read() for fn in fns], format=1)
+
+if __name__ == "__main__":
+    main(os.path.abspath(sys.argv[1]) + os.sep if len(sys.argv) > 1 else baseDir + "Input/FromTrees/Orthologues_Oct27/WorkingDirectory/Trees_ids/")
@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Benchmark of parsing and traversing gene trees with tree.TreeNode: trees parsed per second, nodes visited per second
+in a postorder traversal and the memory used per node.
+
+Usage: python benchmark_tree.py [trees_directory]
+(defaults to the gene trees for the ExampleDataset in Input/FromTrees)
+"""
+
+import os
+import sys
+import glob
+import time
+import resource
+
+baseDir = os.path.dirname(os.path.realpath(__file__)) + os.sep
+sys.path.append(baseDir + "../orthofinder/scripts")
+import tree as tree_lib
+
+def Time(f, nRepeats=3):
+    best = None
+    for _ in xrange(nRepeats):
+        start = time.time()
+        result = f()
+        t = time.time() - start
+        best = t if best is None else min(best, t)
+    return best, result
+
+def MaxRSS():
+    """ Peak resident memory of the process in bytes """
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def main(d):
+    fns = sorted(glob.glob(d + "*"))
+    texts = [open(fn, 'rb').read() for fn in fns]
+    print("%d trees in %s" % (len(texts), d))
+    trees = [tree_lib.Tree(text, format=1) for text in texts]
+    nNodes = sum(1 for t in trees for _ in t.traverse())
+    # memory: hold enough copies of the trees for the change in peak memory to be measurable
+    nCopies = max(1, 500000 // nNodes)
+    rss = MaxRSS()
+    copies = [[tree_lib.Tree(text, format=1) for text in texts] for _ in xrange(nCopies)]
+    bytesPerNode = (MaxRSS() - rss)/float(nNodes*nCopies)
+    del copies
+    t_parse, trees = Time(lambda : [tree_lib.Tree(text, format=1) for text in texts])
+    t_traverse, _ = Time(lambda : [n.name for t in trees for n in t.traverse('postorder')])
+    t_leaves, _ = Time(lambda : [t.get_leaf_names() for t in trees])
+    print("  %d nodes" % nNodes)
+    print("  parse:              %.3fs, %.0f trees/s, %.0f nodes/s" % (t_parse, len(trees)/t_parse, nNodes/t_parse))
+    print("  postorder traverse: %.3fs, %.0f nodes/s" % (t_traverse, nNodes/t_traverse))
+    print("  get_leaf_names:     %.3fs" % t_leaves)
+    print("  memory per node:    %.0f bytes" % bytesPerNode)
+
+if __name__ == "__main__":
+    main(os.path.abspath(sys.argv[1]) + os.sep if len(sys.argv) > 1 else baseDir + "Input/FromTrees/Orthologues_Oct27/WorkingDirectory/Trees_ids/")
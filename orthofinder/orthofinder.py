@@ -54,6 +54,8 @@ import scripts.blast_file_processor as BlastFileProcessor
 from scripts import util, matrices, orthologues
 from scripts import program_caller as pcs
 import scripts.files
+import scripts.og_archive
+import scripts.markov_clustering
 
 # Get directory containing script/bundle
 if getattr(sys, 'frozen', False):
@@ -295,37 +297,30 @@ class scnorm:
     
     @staticmethod
     def GetLengthArraysForMatrix(m, len_i, len_j):
-        I, J = m.nonzero()
-        scores = [v for row in m.data for v in row]     # use fact that it's lil
-        Li = np.array(len_i[I])
-        Lj = np.array(len_j[J])
+        m = m.tocoo()       # row-major order for a csr_matrix with sorted indices
+        scores = m.data
+        Li = np.array(len_i[m.row])
+        Lj = np.array(len_j[m.col])
         return Li, Lj, scores
         
     @staticmethod
     def GetTopPercentileOfScores(L, S, percentileToKeep):
         # Get the top x% of hits at each length
         nScores = len(S)
-        t_sort = sorted(zip(L, range(nScores)))
-        indices = [j for i, j in t_sort]
-        s_sorted = [S[i] for i in indices]
-        l_sorted = [L[i] for i in indices]
+        indices = np.argsort(L, kind='mergesort')   # stable, ties are kept in the original order
+        s_sorted = np.asarray(S)[indices]
+        l_sorted = np.asarray(L)[indices]
         if nScores < 100:
             # then we can't split them into bins, return all for fitting
             return l_sorted, s_sorted
         nInBins = 1000 if nScores > 5000 else (200 if nScores > 1000 else 20)
         nBins, remainder = divmod(nScores, nInBins)
-        topScores = []
-        topLengths = []
-        for i in xrange(nBins):
-            first = i*nInBins
-            last = min((i+1)*nInBins-1, nScores - 1)
-            theseLengths = l_sorted[first:last+1]
-            theseScores = s_sorted[first:last+1]
-            cutOff = np.percentile(theseScores, percentileToKeep)
-            lengthsToKeep = [thisL for thisL, thisScore in zip(theseLengths, theseScores) if thisScore >= cutOff]
-            topLengths.extend(lengthsToKeep)
-            topScores.extend([thisScore for thisL, thisScore in zip(theseLengths, theseScores) if thisScore >= cutOff])
-        return topLengths, topScores
+        # one bin per row, the incomplete final bin is not used
+        theseLengths = l_sorted[:nBins*nInBins].reshape((nBins, nInBins))
+        theseScores = s_sorted[:nBins*nInBins].reshape((nBins, nInBins))
+        cutOff = np.percentile(theseScores, percentileToKeep, axis=1)
+        qKeep = theseScores >= cutOff[:, np.newaxis]
+        return theseLengths[qKeep], theseScores[qKeep]
         
     @staticmethod
     def CalculateFittingParameters(Lf, S):
@@ -340,7 +335,9 @@ class scnorm:
         lj_vals = Lh**(-params[0])
         li_matrix = sparse.csr_matrix((li_vals, (rangeq, rangeq)))
         lj_matrix = sparse.csr_matrix((lj_vals, (rangeh, rangeh)))
-        return sparse.lil_matrix(10**(-params[1]) * li_matrix * b * lj_matrix)
+        m = 10**(-params[1]) * li_matrix * b * lj_matrix
+        m.sort_indices()
+        return m
 
 """
 RunInfo
@@ -402,6 +399,24 @@ Matrices
 -------------------------------------------------------------------------------
 """ 
             
+def GetRowOfEachEntry(M):
+    """ Returns the row index of each stored entry of the csr_matrix M """
+    return np.repeat(np.arange(M.shape[0]), np.diff(M.indptr))
+    
+def GetRowMax(M, default):
+    """ Returns the maximum stored value in each row of the csr_matrix M, default for empty rows """
+    rowMax = default*np.ones(M.shape[0])
+    iRows = np.flatnonzero(np.diff(M.indptr))
+    if len(iRows) > 0:
+        rowMax[iRows] = np.maximum.reduceat(M.data, M.indptr[iRows])
+    return rowMax
+    
+def SelectEntries(M, rows, qSelect):
+    """ Returns a csr_matrix of ones at the stored entries of the csr_matrix M for which qSelect is True """
+    indptr = np.zeros(M.shape[0] + 1, dtype=M.indptr.dtype)
+    np.cumsum(np.bincount(rows[qSelect], minlength=M.shape[0]), out=indptr[1:])
+    return sparse.csr_matrix((np.ones(np.count_nonzero(qSelect)), M.indices[qSelect], indptr), shape=M.shape)
+                
 def GetBH_s(pairwiseScoresMatrices, seqsInfo, iSpecies, tol=1e-3):
     nSeqs_i = seqsInfo.nSeqsPerSpecies[seqsInfo.speciesToUse[iSpecies]]
     bestHitForSequence = -1*np.ones(nSeqs_i)
@@ -410,32 +425,16 @@ def GetBH_s(pairwiseScoresMatrices, seqsInfo, iSpecies, tol=1e-3):
         if iSpecies == j:
             # identify orthologs then come back to paralogs
             continue
-        W = pairwiseScoresMatrices[j]
-        I = []
-        J = []
-        for kRow in xrange(nSeqs_i):
-            values=W.getrowview(kRow)
-            if values.nnz == 0:
-                continue
-            m = max(values.data[0])
-            bestHitForSequence[kRow] = m if m > bestHitForSequence[kRow] else bestHitForSequence[kRow]
-            # get all above this value with tolerance
-            temp = [index for index, value in zip(values.rows[0], values.data[0]) if value > m - tol]
-            J.extend(temp)
-            I.extend(kRow * np.ones(len(temp), dtype=np.dtype(int)))
-        H[j] = sparse.csr_matrix((np.ones(len(I)), (I, J)), shape=W.get_shape())
+        W = pairwiseScoresMatrices[j].tocsr()
+        m = GetRowMax(W, -1)
+        bestHitForSequence = np.maximum(m, bestHitForSequence)
+        # get all above this value with tolerance
+        rows = GetRowOfEachEntry(W)
+        H[j] = SelectEntries(W, rows, W.data > (m - tol)[rows])
     # now look for paralogs
-    I = []
-    J = []
-    W = pairwiseScoresMatrices[iSpecies]
-    for kRow in xrange(nSeqs_i):
-        values=W.getrowview(kRow)
-        if values.nnz == 0:
-            continue
-        temp = [index for index, value in zip(values.rows[0], values.data[0]) if value > bestHitForSequence[kRow] - tol]
-        J.extend(temp)
-        I.extend(kRow * np.ones(len(temp), dtype=np.dtype(int)))
-    H[iSpecies] = sparse.csr_matrix((np.ones(len(I)), (I, J)), shape=W.get_shape())
+    W = pairwiseScoresMatrices[iSpecies].tocsr()
+    rows = GetRowOfEachEntry(W)
+    H[iSpecies] = SelectEntries(W, rows, W.data > (bestHitForSequence - tol)[rows])
     return H
     
     
@@ -444,30 +443,70 @@ WaterfallMethod
 -------------------------------------------------------------------------------
 """ 
 
+def GetGraphRows_perSpecies(seqsInfo, iSpec):
+    """
+    Returns the graph rows for the sequences of one query species as CSR arrays (indptr, cols, values), 
+    with the hits given by their single sequence IDs
+    """
+    # calculate the 2-way connections for one query species
+    connect2 = []
+    for jSpec in xrange(seqsInfo.nSpecies):
+        m1 = matrices.LoadMatrix("connect", iSpec, jSpec)
+        m2tr = numeric.transpose(matrices.LoadMatrix("connect", jSpec, iSpec))
+        connect2.append(m1 + m2tr)
+    B = matrices.LoadMatrixArray("B", seqsInfo, iSpec)
+    B_connect = matrices.MatricesAnd_s(connect2, B)
+    
+    W = [b.sorted_indices().tocoo() for b in B_connect]
+    # All edges for the query species in graph order: by query, then by species, then by hit
+    rows = np.concatenate([w.row for w in W])
+    order = np.argsort(rows, kind='mergesort')
+    rows = rows[order]
+    cols = np.concatenate([w.col + seqsInfo.seqStartingIndices[jSpec] for jSpec, w in enumerate(W)])[order]
+    values = np.concatenate([w.data for w in W])[order]
+    nQuery = seqsInfo.nSeqsPerSpecies[seqsInfo.speciesToUse[iSpec]]
+    indptr = np.searchsorted(rows, np.arange(nQuery + 1))
+    return indptr, cols, values
+
 def WriteGraph_perSpecies(args):
     seqsInfo, graphFN, iSpec = args            
-    # calculate the 2-way connections for one query species
     with open(graphFN + "_%d" % iSpec, 'wb') as graphFile:
-        connect2 = []
-        for jSpec in xrange(seqsInfo.nSpecies):
-            m1 = matrices.LoadMatrix("connect", iSpec, jSpec)
-            m2tr = numeric.transpose(matrices.LoadMatrix("connect", jSpec, iSpec))
-            connect2.append(m1 + m2tr)
-        B = matrices.LoadMatrixArray("B", seqsInfo, iSpec)
-        B_connect = matrices.MatricesAnd_s(connect2, B)
-        
-        W = [b.sorted_indices().tolil() for b in B_connect]
-        for query in xrange(seqsInfo.nSeqsPerSpecies[seqsInfo.speciesToUse[iSpec]]):
-            offset = seqsInfo.seqStartingIndices[iSpec]
-            graphFile.write("%d    " % (offset + query))
-            for jSpec in xrange(seqsInfo.nSpecies):
-                row = W[jSpec].getrowview(query)
-                jOffset = seqsInfo.seqStartingIndices[jSpec]
-                for j, value in zip(row.rows[0], row.data[0]):
-                    graphFile.write("%d:%.3f " % (j + jOffset, value))
-            graphFile.write("$\n")
+        indptr, cols, values = GetGraphRows_perSpecies(seqsInfo, iSpec)
+        WriteGraphRows(graphFile, seqsInfo.seqStartingIndices[iSpec], indptr, cols, values)
         if iSpec == (seqsInfo.nSpecies - 1): graphFile.write(")\n")
         util.PrintTime("Written final scores for species %d to graph file" % iSpec)
+
+def GetGraphRows_perSpecies_Rounded(args):
+    seqsInfo, iSpec = args
+    indptr, cols, values = GetGraphRows_perSpecies(seqsInfo, iSpec)
+    return indptr, cols, np.round(values, 3)    # the precision of the graph file
+        
+def WriteGraphRows(graphFile, offset, indptr, cols, values, nEdgesPerChunk=1000000):
+    """
+    Write the rows of the MCL graph, "query    hit:score hit:score ... $", a chunk of rows at a time. Each chunk is 
+    formatted by a single string formatting operation.
+    Args:
+        offset - the ID of the first query sequence
+        indptr, cols, values - CSR representation of the graph rows with hits given by their sequence IDs
+    """
+    nRows = len(indptr) - 1
+    iRow = 0
+    while iRow < nRows:
+        iEnd = max(iRow + 1, np.searchsorted(indptr, indptr[iRow] + nEdgesPerChunk, side='right') - 1)
+        iEnd = min(iEnd, nRows)
+        nEdges = indptr[iRow:iEnd+1] - indptr[iRow]
+        # interleave: query, hit, score, hit, score, ..., query, hit, score ...
+        items = np.empty(iEnd - iRow + 2*nEdges[-1], dtype=object)
+        iQueryPositions = 2*nEdges[:-1] + np.arange(iEnd - iRow)
+        items[iQueryPositions] = (offset + np.arange(iRow, iEnd)).tolist()
+        iHitPositions = np.ones(len(items), dtype=np.bool_)
+        iHitPositions[iQueryPositions] = False
+        iHitPositions = np.flatnonzero(iHitPositions)[::2]
+        items[iHitPositions] = cols[indptr[iRow]:indptr[iEnd]].tolist()
+        items[iHitPositions + 1] = values[indptr[iRow]:indptr[iEnd]].tolist()
+        fmt = "".join(["%d    " + "%d:%.3f "*n + "$\n" for n in np.diff(nEdges).tolist()])
+        graphFile.write(fmt % tuple(items))
+        iRow = iEnd
             
             
 class WaterfallMethod:    
@@ -481,7 +520,7 @@ class WaterfallMethod:
             return scnorm.NormaliseScoresByLogLengthProduct(B, Lengths[iSpecies], Lengths[jSpecies], fittingParameters)
         else:
             print("WARNING: Too few hits between species %d and species %d to normalise the scores, these hits will be ignored" % (iSpecies, jSpecies))
-            return sparse.lil_matrix(B.get_shape())
+            return sparse.csr_matrix(B.get_shape())
             
     @staticmethod
     def ProcessBlastHits(seqsInfo, blastDir_list, Lengths, iSpecies, qDoubleBlast):
@@ -538,13 +577,31 @@ class WaterfallMethod:
             pool = mp.Pool(nProcess)
             graphFN = scripts.files.FileHandler.GetGraphFilename()
             pool.map(WriteGraph_perSpecies, [(seqsInfo, graphFN, iSpec) for iSpec in xrange(seqsInfo.nSpecies)])
-            for iSp in xrange(seqsInfo.nSpecies):
-                subprocess.call("cat " + graphFN + "_%d" % iSp + " >> " + graphFN, shell=True)
-                os.remove(graphFN + "_%d" % iSp)
+            with open(graphFN, 'ab') as graphFile:
+                for iSp in xrange(seqsInfo.nSpecies):
+                    with open(graphFN + "_%d" % iSp, 'rb') as partFile:
+                        shutil.copyfileobj(partFile, graphFile, 16*1024*1024)
+                    os.remove(graphFN + "_%d" % iSp)
             # Cleanup
             matrices.DeleteMatrices("B") 
             matrices.DeleteMatrices("connect") 
             
+    @staticmethod
+    def GetGraphParallel(seqsInfo, nProcess):
+        """ Returns the graph as a nSeqs x nSeqs csr_matrix, the in-memory equivalent of the graph file """
+        with warnings.catch_warnings():         
+            warnings.simplefilter("ignore")
+            pool = mp.Pool(nProcess)
+            parts = pool.map(GetGraphRows_perSpecies_Rounded, [(seqsInfo, iSpec) for iSpec in xrange(seqsInfo.nSpecies)])
+            pool.close()
+            matrices.DeleteMatrices("B") 
+            matrices.DeleteMatrices("connect") 
+        offsets = np.cumsum([0] + [len(p[1]) for p in parts[:-1]])
+        indptr = np.concatenate([[0]] + [p[0][1:] + offset for p, offset in zip(parts, offsets)])
+        cols = np.concatenate([p[1] for p in parts])
+        values = np.concatenate([p[2] for p in parts])
+        return sparse.csr_matrix((values, cols, indptr), shape=(seqsInfo.nSeqs, seqsInfo.nSeqs))
+            
     @staticmethod
     def GetMostDistant_s(RBH, B, seqsInfo, iSpec):
         mostDistant = numeric.transpose(np.ones(seqsInfo.nSeqsPerSpecies[seqsInfo.speciesToUse[iSpec]])*1e9)
@@ -560,17 +617,13 @@ class WaterfallMethod:
     @staticmethod
     def ConnectAllBetterThanCutoff_s(B, mostDistant, seqsInfo, iSpec):
         connect = []
-        nSeqs_i = seqsInfo.nSeqsPerSpecies[seqsInfo.speciesToUse[iSpec]]
         for jSpec in xrange(seqsInfo.nSpecies):
-            M=B[jSpec].tolil()
-            if iSpec != jSpec:
-                IIJJ = [(i,j) for i, (valueRow, indexRow) in enumerate(zip(M.data, M.rows)) for j, v in zip(indexRow, valueRow) if v >= mostDistant[i]]
-            else:
-                IIJJ = [(i,j) for i, (valueRow, indexRow) in enumerate(zip(M.data, M.rows)) for j, v in zip(indexRow, valueRow) if (i != j) and v >= mostDistant[i]]
-            II = [i for (i, j) in IIJJ]
-            JJ = [j for (i, j) in IIJJ]
-            onesArray = np.ones(len(IIJJ))
-            mat = sparse.csr_matrix( (onesArray,  (II, JJ)), shape=(nSeqs_i,  seqsInfo.nSeqsPerSpecies[seqsInfo.speciesToUse[jSpec]]))
+            M = B[jSpec].tocsr()
+            rows = GetRowOfEachEntry(M)
+            qConnect = M.data >= mostDistant[rows]
+            if iSpec == jSpec:
+                qConnect &= (rows != M.indices)
+            mat = SelectEntries(M, rows, qConnect)
             connect.append(mat)
         return connect
     
@@ -739,12 +792,12 @@ def Stats(ogs, speciesNamesDict, iSpecies, iResultsVersion):
         with open(filename_single_copy, 'wb') as outfile_singlecopy:
             outfile_singlecopy.write("\n".join(["OG%07d" % i_ for i_ in singleCopyOGs]))
         # Link single-copy orthologues
-        f =  scripts.files.FileHandler.GetOGsSeqFN
-        in_fn = [f(i, True) for i in singleCopyOGs]
-        g_fmt = scripts.files.FileHandler.GetResultsSeqsDir_SingleCopy() + scripts.files.FileHandler.baseOgFormat + ".fa"
-        out_fn =[g_fmt % i for i in singleCopyOGs]
-        for i, o in zip(in_fn, out_fn):
-            shutil.copy(i, o)
+        reader = scripts.og_archive.OGFileReader(scripts.files.FileHandler.GetResultsSeqsDir())
+        with scripts.files.FileHandler.OGFileWriter(scripts.files.FileHandler.GetResultsSeqsDir_SingleCopy()) as writer:
+            for i in singleCopyOGs:
+                fn = os.path.basename(scripts.files.FileHandler.GetOGsSeqFN(i, True))
+                writer.Write(fn, reader.Read(fn))
+        reader.Close()
             
         # Results filenames
         writer_sum.writerow(["Date", str(datetime.datetime.now()).split()[0]])
@@ -824,6 +877,11 @@ def PrintHelp(program_caller):
 #    print("                   Options: of_recon, dlcpar, dlcpar_convergedsearch")
     print(" -s <file>         User-specified rooted species tree")
     print(" -I <int>          MCL inflation parameter [Default = %0.1f]" % g_mclInflation)
+    print(" -C                Cluster with the built-in MCL implementation rather than mcl")
+    print(" -z                Also write the orthologues to a single binary file, Orthologues.npz")
+    print(" -j                Infer the STAG species trees with the built-in BIONJ rather than fastme")
+    print(" -P                Pack the per-orthogroup sequence, alignment & tree files into a zip file")
+    print("                   for each directory")
     print(" -x <file>         Info for outputting results in OrthoXML format")
     print(" -p <dir>          Write the temporary pickle files to <dir>")
     print(" -1                Only perform one-way sequence search ")
@@ -911,6 +969,10 @@ class Options(object):#
         self.speciesXMLInfoFN = None
         self.speciesTreeFN = None
         self.mclInflation = g_mclInflation
+        self.qBuiltinMCL = False
+        self.qOrthologueStore = False
+        self.qSTAG_BIONJ = False
+        self.qPackOGFiles = False
     
     def what(self):
         for k, v in self.__dict__.items():
@@ -1011,6 +1073,14 @@ def ProcessArgs(program_caller):
             except:
                 print("Incorrect argument for MCL inflation parameter: %s\n" % arg)
                 util.Fail()    
+        elif arg == "-C" or arg == "--builtin_mcl":
+            options.qBuiltinMCL = True
+        elif arg == "-z" or arg == "--orthologue_store":
+            options.qOrthologueStore = True
+        elif arg == "-j" or arg == "--stag_bionj":
+            options.qSTAG_BIONJ = True
+        elif arg == "-P" or arg == "--pack":
+            options.qPackOGFiles = True
         elif arg == "-x" or arg == "--orthoxml":  
             if options.speciesXMLInfoFN:
                 print("Repeated argument: -x/--orthoxml")
@@ -1260,7 +1330,7 @@ def CheckDependencies(options, program_caller, dirForTempFiles):
             print("  " + program_caller.GetSearchMethodCommand_Search(options.search_program, "INPUT", "DATABASE", "OUTPUT"))
             print("Please check %s is installed and that the executables are in the system path\n" % options.search_program)
             util.Fail()
-    if (options.qStartFromFasta or options.qStartFromBlast) and not CanRunMCL():
+    if (options.qStartFromFasta or options.qStartFromBlast) and not options.qBuiltinMCL and not CanRunMCL():
         util.Fail()
     if not (options.qStopAfterPrepare or options.qStopAfterSeqs or options.qStopAfterGroups):
         if not orthologues.CanRunOrthologueDependencies(dirForTempFiles, 
@@ -1305,12 +1375,19 @@ def DoOrthogroups(options, speciesInfoObj, seqsInfo):
     util.ManageQueue(runningProcesses, cmd_queue)
     
     util.PrintTime("Connected putatitive homologs") 
-    WaterfallMethod.WriteGraphParallel(seqsInfo, options.nProcessAlg)
-    
-    # 5b. MCL     
     clustersFilename, clustersFilename_pairs = scripts.files.FileHandler.CreateUnusedClustersFN(options.mclInflation) 
-    graphFilename = scripts.files.FileHandler.GetGraphFilename() 
-    MCL.RunMCL(graphFilename, clustersFilename, options.nProcessAlg, options.mclInflation)
+    if options.qBuiltinMCL:
+        # 5b. MCL, in-process without the graph file 
+        graph = WaterfallMethod.GetGraphParallel(seqsInfo, options.nProcessAlg)
+        clusters = scripts.markov_clustering.MCL(graph, options.mclInflation, options.nProcessAlg)
+        util.PrintTime("Ran MCL")
+        scripts.markov_clustering.WriteClusters(clusters, seqsInfo.nSeqs, clustersFilename)
+    else:
+        WaterfallMethod.WriteGraphParallel(seqsInfo, options.nProcessAlg)
+        
+        # 5b. MCL     
+        graphFilename = scripts.files.FileHandler.GetGraphFilename() 
+        MCL.RunMCL(graphFilename, clustersFilename, options.nProcessAlg, options.mclInflation)
     MCLread.ConvertSingleIDsToIDPair(seqsInfo, clustersFilename, clustersFilename_pairs)   
     
     util.PrintUnderline("Writing orthogroups to file")
@@ -1326,10 +1403,8 @@ def DoOrthogroups(options, speciesInfoObj, seqsInfo):
     ogSet = scripts.orthologues.OrthoGroupsSet(scripts.files.FileHandler.GetWorkingDirectory1_Read(), speciesInfoObj.speciesToUse, speciesInfoObj.nSpAll, options.qAddSpeciesToIDs, idExtractor = scripts.util.FirstWordExtractor)
     treeGen = scripts.trees_msa.TreesForOrthogroups(None, None, None)
     fastaWriter = scripts.trees_msa.FastaWriter(scripts.files.FileHandler.GetSpeciesSeqsDir(), speciesInfoObj.speciesToUse)
-    d_seqs = scripts.files.FileHandler.GetResultsSeqsDir()
-    if not os.path.exists(d_seqs): os.mkdir(d_seqs)
-    treeGen.WriteFastaFiles(fastaWriter, ogSet.OGs(qInclAll=True), idsDict, False)
-    orthogroupsResultsFilesString += ("\nSequences for orthogroups:\n   %s\n" % scripts.files.FileHandler.GetResultsSeqsDir())
+    treeGen.WriteFastaFiles(fastaWriter, ogSet.OGs(qInclAll=True), idsDict, False, options.nBlast)
+    orthogroupsResultsFilesString += ("\nSequences for orthogroups:\n   %s\n" % scripts.files.FileHandler.OGFilesLocation(scripts.files.FileHandler.GetResultsSeqsDir()))
     
     print(orthogroupsResultsFilesString)
     summaryText, statsFile = Stats(ogs, speciesNamesDict, speciesInfoObj.speciesToUse, scripts.files.FileHandler.iResultsVersion)
@@ -1480,13 +1555,15 @@ def GetOrthologues(dirs, options, program_caller, orthogroupsResultsFilesString=
                                                                     options.qStopAfterTrees,
                                                                     options.qMSATrees,
                                                                     options.qPhyldog,
-                                                                    options.name)
+                                                                    options.name,
+                                                                    options.qOrthologueStore,
+                                                                    options.qSTAG_BIONJ)
     util.PrintTime("Done orthologues")
     if None != orthogroupsResultsFilesString: print(orthogroupsResultsFilesString)
     print(orthologuesResultsFilesString.rstrip())    
 
 def GetOrthologues_FromTrees(options):
-    return orthologues.OrthologuesFromTrees(options.recon_method, options.nBlast, options.speciesTreeFN, options.qAddSpeciesToIDs)
+    return orthologues.OrthologuesFromTrees(options.recon_method, options.nBlast, options.speciesTreeFN, options.qAddSpeciesToIDs, options.qOrthologueStore)
  
 def ProcessesNewFasta(fastaDir, speciesInfoObj_prev = None, speciesToUse_prev_names=[]):
     """
@@ -1694,6 +1771,11 @@ if __name__ == "__main__":
             raise NotImplementedError
             ptm = parallel_task_manager.ParallelTaskManager_singleton()
             ptm.Stop()
+        if options.qPackOGFiles:
+            archives = scripts.files.FileHandler.PackOGFiles()
+            if len(archives) > 0:
+                print("Per-orthogroup files packed into:\n   " + "\n   ".join(archives) + "\n")
+                scripts.files.FileHandler.WriteToLog("Per-orthogroup files packed into: %s\n" % ", ".join(archives))
         scripts.files.FileHandler.WriteToLog("OrthoFinder run completed\n", True)
     except Exception as e:
         ptm = parallel_task_manager.ParallelTaskManager_singleton()
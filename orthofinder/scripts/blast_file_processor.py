@@ -28,14 +28,22 @@ import os
 import sys
 import csv
 import gzip
+import numpy as np
 from scipy import sparse
 
 import util
+import files
               
 #def NumberOfSequences(seqsInfo, iSpecies):
 #    return (seqsInfo.seqStartingIndices[iSpecies+1] if iSpecies != seqsInfo.nSpecies-1 else seqsInfo.nSeqs) - seqsInfo.seqStartingIndices[iSpecies] 
+
+nBLAST6Fields = 12
                          
 def GetBLAST6Scores(seqsInfo, blastDir_list, iSpecies, jSpecies, qExcludeSelfHits = True, sep = "_", qDoubleBlast=True): 
+    """
+    Returns the nSeqs_i x nSeqs_j csr_matrix of the best bit-score for each query-hit pair in Blast{i}_{j}.txt
+    (or the transpose of Blast{j}_{i}.txt if only the one-way search was performed).
+    """
     qSameSpecies = iSpecies==jSpecies
     qCheckForSelfHits = qExcludeSelfHits and qSameSpecies
     if not qDoubleBlast:
@@ -54,43 +62,219 @@ def GetBLAST6Scores(seqsInfo, blastDir_list, iSpecies, jSpecies, qExcludeSelfHit
         jSpeciesOpen = jSpecies
     nSeqs_i = seqsInfo.nSeqsPerSpecies[iSpecies]
     nSeqs_j = seqsInfo.nSeqsPerSpecies[jSpecies]
-    B = sparse.lil_matrix((nSeqs_i, nSeqs_j))
-    row = ""
     for d in blastDir_list:
         fn = d + "Blast%d_%d.txt" % (iSpeciesOpen, jSpeciesOpen)
         if os.path.exists(fn) or os.path.exists(fn + ".gz"): break
+    if os.path.exists(fn + ".gz"): fn = fn + ".gz"
+    hits = LoadBestHits(fn, iSpeciesOpen, jSpeciesOpen)
+    if hits is None:
+        try:
+            with (gzip.open(fn, 'rb') if fn.endswith(".gz") else open(fn, 'rb')) as blastfile:
+                text = blastfile.read()
+        except Exception:
+            sys.stderr.write("Malformatted line in %sBlast%d_%d.txt\nOffending line was:\n\n" % (d, iSpecies, jSpecies))
+            raise
+        hits = ReadBLAST6Hits(text, 0, 1, sep)
+        if hits != None: 
+            # check the IDs on every line, GetBestHits drops the lines with non-positive scores
+            Q, H, _ = hits
+            if (len(Q) == 0) or (Q.max() < seqsInfo.nSeqsPerSpecies[iSpeciesOpen] and H.max() < seqsInfo.nSeqsPerSpecies[jSpeciesOpen]):
+                hits = GetBestHits(*hits)
+                SaveBestHits(hits, fn, iSpeciesOpen, jSpeciesOpen)
+            else:
+                hits = None
+        if hits is None:
+            # Malformed line or inconsistent IDs, re-read line by line to identify & report the offending line
+            B = GetBLAST6Scores_ByRow(text.splitlines(True), d, iSpecies, jSpecies, iQ, iH, nSeqs_i, nSeqs_j, qCheckForSelfHits, sep)
+            return B.tocsr()
+    Q, H, S = (hits[1], hits[0], hits[2]) if qRev else hits
+    return BestHitsMatrix(Q, H, S, nSeqs_i, nSeqs_j, qCheckForSelfHits)
+
+def LoadBestHits(blastFN, iSpeciesSearch, jSpeciesDB):
+    """
+    Returns the (Q, H, S) best hits for Blast{i}_{j}.txt from the binary cache written when the file was first parsed
+    or None if there is no cache or the BLAST file has been modified since it was written.
+    """
+    cacheFN = files.FileHandler.GetBlastHitsFN(iSpeciesSearch, jSpeciesDB)
+    if cacheFN is None: return None
+    try:
+        with np.load(cacheFN) as cache:
+            if not np.array_equal(cache["source"], BlastFileStamp(blastFN)): return None
+            return cache["Q"].astype(np.int64), cache["H"].astype(np.int64), cache["S"]
+    except Exception:
+        return None
+
+def SaveBestHits(hits, blastFN, iSpeciesSearch, jSpeciesDB):
+    """
+    Write the best hits as columns of int32 query iSeq, int32 hit iSeq & float64 bit-score so that later stages and 
+    restarts with -b don't need to parse the BLAST text again. The bit-scores are not reduced to float32 as this 
+    would change the normalised scores. 
+    """
+    cacheFN = files.FileHandler.GetBlastHitsFN(iSpeciesSearch, jSpeciesDB, qForCreation=True)
+    if cacheFN == None: return
+    Q, H, S = hits
+    tempFN = cacheFN + ".%d.tmp" % os.getpid()
+    try:
+        with open(tempFN, 'wb') as outfile:
+            np.savez(outfile, Q=Q.astype(np.int32), H=H.astype(np.int32), S=S, source=BlastFileStamp(blastFN))
+        os.rename(tempFN, cacheFN)   # atomic, a partially written file is never seen by another process
+    except (IOError, OSError):
+        if os.path.exists(tempFN): os.remove(tempFN)
+        
+def BlastFileStamp(blastFN):
+    s = os.stat(blastFN)
+    return np.array([s.st_size, s.st_mtime], dtype=np.float64)
+
+def ReadBLAST6Hits(text, iQ, iH, sep = "_"):
+    """
+    Parse the complete text of a BLAST tabular (-outfmt 6) file into numpy columns without a per-line python loop.
+    Args:
+        text - contents of the BLAST results file
+        iQ, iH - field index of the query & hit, OrthoFinder IDs of the form "iSpecies_iSeq"
+        sep - separator in the OrthoFinder sequence IDs
+    Returns:
+        (Q, H, S) - int64 query iSeq, int64 hit iSeq & float64 bit-score arrays, one entry per line
+        None if any line could not be parsed, the caller should then fall back to GetBLAST6Scores_ByRow 
+        in order to report the error
+    """
+    if len(sep) != 1: return None
+    buf = np.frombuffer(text, dtype=np.uint8)
+    if len(buf) == 0: 
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float64)
+    if buf[-1] != ord("\n"):
+        buf = np.append(buf, np.uint8(ord("\n")))
+    line_ends = np.flatnonzero(buf == ord("\n"))
+    line_starts = np.empty_like(line_ends)
+    line_starts[0] = 0
+    line_starts[1:] = line_ends[:-1] + 1
+    # Allow for windows line endings
+    qCR = buf[line_ends - 1] == ord("\r")
+    qCR[line_starts == line_ends] = False
+    line_ends = line_ends - qCR
+    # field k of line spans [field_start, field_end), every line requires at least 11 tabs 
+    tabs = np.flatnonzero(buf == ord("\t"))
+    iFirstTab = np.searchsorted(tabs, line_starts)
+    nTabs = np.searchsorted(tabs, line_ends) - iFirstTab
+    if np.any(nTabs < nBLAST6Fields - 1): return None
+    tabs = np.append(tabs, len(buf))   # the last field on a line can be terminated by the line end
+    def FieldBounds(k):
+        field_starts = line_starts if k == 0 else tabs[iFirstTab + k - 1] + 1
+        field_ends = np.where(nTabs > k, tabs[iFirstTab + k], line_ends)
+        return field_starts, field_ends
+    Q = ReadSequenceIDs(buf, FieldBounds(iQ), sep)
+    H = ReadSequenceIDs(buf, FieldBounds(iH), sep)
+    S = ReadFloats(buf, FieldBounds(nBLAST6Fields - 1))
+    if Q is None or H is None or S is None: return None
+    return Q, H, S
+
+def GatherFields(buf, field_starts, field_ends):
+    """
+    Returns the characters of each field as a zero-padded (nFields x max_length) uint8 array & a boolean mask of 
+    the valid characters
+    """
+    lengths = field_ends - field_starts
+    w = max(lengths.max(), 1)
+    offsets = np.arange(w)
+    mask = offsets[None, :] < lengths[:, None]
+    chars = np.zeros((len(lengths), w), dtype=np.uint8)
+    chars[mask] = buf[(field_starts[:, None] + offsets[None, :])[mask]]
+    return chars, mask
+
+def ReadSequenceIDs(buf, bounds, sep):
+    """ Returns the integer sequence index, iSeq, from the IDs "iSpecies_iSeq" or None if an ID is incorrectly formatted """
+    field_starts, field_ends = bounds
+    seps = np.flatnonzero(buf == ord(sep))
+    seps = np.append(seps, len(buf))
+    iSep = np.searchsorted(seps, field_starts)
+    id_starts = seps[iSep] + 1
+    if np.any(id_starts > field_ends): return None
+    id_ends = np.minimum(seps[iSep + 1], field_ends)
+    lengths = id_ends - id_starts
+    if np.any(lengths == 0) or lengths.max() > 18: return None 
+    chars, mask = GatherFields(buf, id_starts, id_ends)
+    digits = chars.astype(np.int64) - ord("0")
+    if np.any(mask & ((digits < 0) | (digits > 9))): return None
+    ids = np.zeros(len(lengths), dtype=np.int64)
+    for k in xrange(chars.shape[1]):
+        ids = np.where(mask[:, k], 10*ids + digits[:, k], ids)
+    return ids
+
+def ReadFloats(buf, bounds):
+    field_starts, field_ends = bounds
+    chars, _ = GatherFields(buf, field_starts, field_ends)
+    try:
+        return np.ascontiguousarray(chars).view("S%d" % chars.shape[1]).ravel().astype(np.float64)
+    except ValueError:
+        return None
+    
+def GetBestHits(Q, H, S):
+    """
+    Returns the (Q, H, S) columns of the maximum score for each query-hit pair, sorted by query and then hit. 
+    Only positive scores are kept.
+    """
+    keep = S > 0.
+    Q = Q[keep]
+    H = H[keep]
+    S = S[keep]
+    # sort by pair and then by score so the last entry for each pair is the best score
+    order = np.lexsort((S, H, Q))
+    Q = Q[order]
+    H = H[order]
+    S = S[order]
+    qLast = np.ones(len(Q), dtype=np.bool_)
+    qLast[:-1] = (Q[1:] != Q[:-1]) | (H[1:] != H[:-1])
+    return Q[qLast], H[qLast], S[qLast]
+    
+def BestHitsMatrix(Q, H, S, nSeqs_i, nSeqs_j, qExcludeSelfHits):
+    """
+    Returns the nSeqs_i x nSeqs_j csr_matrix of the maximum score for each query-hit pair. Only positive scores are stored.
+    """
+    if qExcludeSelfHits: 
+        keep = Q != H
+        Q = Q[keep]
+        H = H[keep]
+        S = S[keep]
+    Q, H, S = GetBestHits(Q, H, S)
+    indptr = np.searchsorted(Q, np.arange(nSeqs_i + 1))
+    return sparse.csr_matrix((S, H, indptr), shape=(nSeqs_i, nSeqs_j))
+    
+def GetBLAST6Scores_ByRow(lines, d, iSpecies, jSpecies, iQ, iH, nSeqs_i, nSeqs_j, qCheckForSelfHits, sep="_"):
+    """
+    Process the BLAST results line by line. Slow, but reports the first malformed line or inconsistent sequence ID
+    """
+    B = sparse.lil_matrix((nSeqs_i, nSeqs_j))
+    row = ""
     try:
-        with (gzip.open(fn + ".gz", 'rb') if os.path.exists(fn + ".gz") else open(fn, 'rb')) as blastfile:
-            blastreader = csv.reader(blastfile, delimiter='\t')
-            for row in blastreader:    
-                # Get hit and query IDs
-                try:
-                    sequence1ID = int(row[iQ].split(sep, 2)[1])
-                    sequence2ID = int(row[iH].split(sep, 2)[1])
-                except (IndexError, ValueError):
-                    sys.stderr.write("\nERROR: Query or hit sequence ID in BLAST results file was missing or incorrectly formatted.\n")
-                    raise
-                # Get bit score for pair
-                try:
-                    score = float(row[11])   
-                except (IndexError, ValueError):
-                    sys.stderr.write("\nERROR: 12th field in BLAST results file line should be the bit-score for the hit\n")
-                    raise
-                if (qCheckForSelfHits and sequence1ID == sequence2ID):
-                    continue
-                # store bit score
-                try:
-                    if score > B[sequence1ID, sequence2ID]: 
-                        B[sequence1ID, sequence2ID] = score   
-                except IndexError:
-                    def ord(n):
-                        return str(n)+("th" if 4<=n%100<=20 else {1:"st",2:"nd",3:"rd"}.get(n%10, "th"))
+        blastreader = csv.reader(lines, delimiter='\t')
+        for row in blastreader:    
+            # Get hit and query IDs
+            try:
+                sequence1ID = int(row[iQ].split(sep, 2)[1])
+                sequence2ID = int(row[iH].split(sep, 2)[1])
+            except (IndexError, ValueError):
+                sys.stderr.write("\nERROR: Query or hit sequence ID in BLAST results file was missing or incorrectly formatted.\n")
+                raise
+            # Get bit score for pair
+            try:
+                score = float(row[11])   
+            except (IndexError, ValueError):
+                sys.stderr.write("\nERROR: 12th field in BLAST results file line should be the bit-score for the hit\n")
+                raise
+            if (qCheckForSelfHits and sequence1ID == sequence2ID):
+                continue
+            # store bit score
+            try:
+                if score > B[sequence1ID, sequence2ID]: 
+                    B[sequence1ID, sequence2ID] = score   
+            except IndexError:
+                def ord(n):
+                    return str(n)+("th" if 4<=n%100<=20 else {1:"st",2:"nd",3:"rd"}.get(n%10, "th"))
 #                        sys.stderr.write("\nError in input files, expected only %d sequences in species %d and %d sequences in species %d but found a hit in the Blast%d_%d.txt between sequence %d_%d (i.e. %s sequence in species) and sequence %d_%d (i.e. %s sequence in species)\n" %  (nSeqs_i, iSpecies, nSeqs_j, jSpecies, iSpecies, jSpecies, iSpecies, sequence1ID, ord(sequence1ID+1), jSpecies, sequence2ID, ord(sequence2ID+1)))
-                    sys.stderr.write("\nERROR: Inconsistent input files.\n")
-                    kSpecies, nSeqs_k, sequencekID = (iSpecies,  nSeqs_i, sequence1ID) if sequence1ID >= nSeqs_i else (jSpecies,  nSeqs_j, sequence2ID)
-                    sys.stderr.write("Species%d.fa contains only %d sequences " % (kSpecies,  nSeqs_k)) 
-                    sys.stderr.write("but found a query/hit in the Blast%d_%d.txt for sequence %d_%d (i.e. %s sequence in species %d).\n" %  (iSpecies, jSpecies, kSpecies, sequencekID, ord(sequencekID+1), kSpecies))
-                    util.Fail()
+                sys.stderr.write("\nERROR: Inconsistent input files.\n")
+                kSpecies, nSeqs_k, sequencekID = (iSpecies,  nSeqs_i, sequence1ID) if sequence1ID >= nSeqs_i else (jSpecies,  nSeqs_j, sequence2ID)
+                sys.stderr.write("Species%d.fa contains only %d sequences " % (kSpecies,  nSeqs_k)) 
+                sys.stderr.write("but found a query/hit in the Blast%d_%d.txt for sequence %d_%d (i.e. %s sequence in species %d).\n" %  (iSpecies, jSpecies, kSpecies, sequencekID, ord(sequencekID+1), kSpecies))
+                util.Fail()
     except Exception:
         sys.stderr.write("Malformatted line in %sBlast%d_%d.txt\nOffending line was:\n" % (d, iSpecies, jSpecies))
         sys.stderr.write("\t".join(row) + "\n")
@@ -24,7 +24,6 @@
 import time
 import glob
 import argparse
-from collections import Counter, defaultdict
 
 import tree
 
@@ -86,14 +85,17 @@ class BitVector(object):
     def Is(self, taxon):
         return (self.X >> self.taxa_index[taxon]) & 1
 
-def UpdateSplits(all_splits, tree, taxa_index):
+def Canonical(x, mask):
+    """ The canonical form of split x, as BitVector.Canonical, where mask has the bits set for all the taxa """
+    return x ^ mask if x & 1 else x
+
+def UpdateSplits(split_counts, tree, taxa_index):
     """
-    Adds the splits in tree to the list all_splits
+    Adds the splits in tree to split_counts
     Args:
-        all_splits - list of splits
+        split_counts - dict from canonical split to [number of times seen, sum of branch lengths]
         tree - Tree object
         taxa_index - dictionary from taxa to their index
-        taxa_set - a set object of the taxa in taxa_index
         
     Returns:
         None
@@ -101,102 +103,122 @@ def UpdateSplits(all_splits, tree, taxa_index):
     Requirements:
         - The taxa in tree should be identical to the taxa in taxa_index
     """
+    mask = (1 << len(taxa_index)) - 1
     nRoot = len(tree.get_children())  
-    if nRoot == 2:
-        # don't double count at root. If there are two children then must only do once
-        for node in tree.traverse("postorder"):
-            if node.is_leaf():
-                if node.up.is_root():
-                    nRoot -= 1
-                    if nRoot == 0: continue
-                s = BitVector(taxa_index, node.name)
-                node.add_feature('split_down', s)
-                all_splits.append((s.Canonical(), node.dist))
-            elif node.is_root():
-                continue
-            else:
-                if node.up.is_root():
-                    nRoot -= 1
-                    if nRoot == 0: continue
-                s = BitVector(taxa_index)
-                s.AddList([ch.split_down for ch in node.get_children()])    
-                node.add_feature('split_down', s)
-                all_splits.append((s.Canonical(), node.dist))
-    else:
-        for node in tree.traverse("postorder"):
-            if node.is_leaf():
-                s = BitVector(taxa_index, node.name)
-                node.add_feature('split_down', s)
-                all_splits.append((s.Canonical(), node.dist))
-            elif node.is_root():
-                continue
-            else:
-                s = BitVector(taxa_index)
-                s.AddList([ch.split_down for ch in node.get_children()])    
-                node.add_feature('split_down', s)
-                all_splits.append((s.Canonical(), node.dist))
+    # don't double count at root. If there are two children then must only do the split once
+    qSkipOne = (nRoot == 2)
+    splits = dict()     # node -> split (not canonical)
+    for node in tree.traverse("postorder"):
+        if node.is_leaf():
+            x = 1 << taxa_index[node.name]
+        elif node.is_root():
+            continue
+        else:
+            x = 0
+            for ch in node.get_children():
+                x |= splits[ch]
+        splits[node] = x
+        if qSkipOne and node.up.is_root():
+            nRoot -= 1
+            if nRoot == 0: continue
+        x = Canonical(x, mask)
+        if x in split_counts:
+            c = split_counts[x]
+            c[0] += 1
+            c[1] += node.dist
+        else:
+            split_counts[x] = [1, 0 + node.dist]
 
 def GetAllSplits(trees_dir):
     """
     Gets the set of splits in a set of trees
     
     Args:
-        trees_dir - directory containing the input trees    
+        trees_dir - directory containing the input trees, or a list of the trees (Tree objects)
     
     Returns:
-        list of (splits,length) tuples, taxa_index, taxa_ordered, number of trees
+        dict from split to [count, sum of lengths], taxa_index, taxa_ordered, number of trees
     """
-    treesFNs = glob.glob(trees_dir + "/*")
-    if len(treesFNs) == 0:
+    if isinstance(trees_dir, basestring):
+        treesFNs = glob.glob(trees_dir + "/*")
+        nTrees = len(treesFNs)
+        trees = (tree.Tree(treeFN) for treeFN in treesFNs)
+    else:
+        nTrees = len(trees_dir)
+        trees = iter(trees_dir)
+    if nTrees == 0:
         print("ERROR: No trees found in directory")
         raise Exception()
-    first_tree = tree.Tree(treesFNs[0])
+    first_tree = next(trees)
     taxa_ordered = first_tree.get_leaf_names()
     taxa_index = {taxon:i for i, taxon in enumerate(taxa_ordered)}
-    splits = []
-    UpdateSplits(splits, first_tree, taxa_index)
-    for i, treeFN in enumerate(treesFNs[1:]):
-        t = tree.Tree(treeFN)
-        UpdateSplits(splits, t, taxa_index)
-    return splits, taxa_index, taxa_ordered, len(treesFNs)
+    split_counts = dict()
+    UpdateSplits(split_counts, first_tree, taxa_index)
+    for t in trees:
+        UpdateSplits(split_counts, t, taxa_index)
+    return split_counts, taxa_index, taxa_ordered, nTrees
 
-def GetCompatibleSplits(splits_lengths):
+def GetCompatibleSplits(split_counts):
     """
+    Greedily selects the splits, most frequent first, that are compatible with all those already selected
     Args:
-        splits_lengths - listof (split, length) tuples
+        split_counts - dict from split to [count, sum of lengths]
     Returns:
-        compatible_splits, dict:split->list_of_lengths
+        compatible_splits - list of (split, count) tuples
+    Implementation:
+        The selected splits are nested or disjoint so they form a tree. A split only needs checking against the 
+        smallest selected split containing it & that split's children: it's compatible if it contains or is 
+        disjoint from each of them. lowest[i] is the smallest selected split containing taxon i.
     """
-    splits = [s for s,l in splits_lengths]
-    lengths = defaultdict(list)
-    for s,l in splits_lengths:
-        lengths[s].append(l)
-    counter = Counter(splits)
+    root = -1   # contains every split
+    parent = dict()
+    children = {root:[]}
+    lowest = dict()
     compatible_splits = []
-    for x, n in counter.most_common():
-        # Check if it is consistent with the tree 
+    for x, (n, _) in sorted(split_counts.iteritems(), key=lambda item: item[1][0], reverse=True):
+        if x == 0:
+            compatible_splits.append((x, n))
+            continue
+        p = lowest.get((x & -x).bit_length() - 1, root)
+        while x & ~p:
+            p = parent[p]
+        inside = []
         ok = True
-        for y,_ in compatible_splits:
-            z = x & y
-            if not (z==x or z==y or z==0):
+        for c in children[p]:
+            z = x & c
+            if z == c:
+                inside.append(c)
+            elif z:
                 ok = False
                 break
-        # Add the split
-        if ok: compatible_splits.append((x,n))
-    return compatible_splits, lengths
+        if not ok: continue
+        compatible_splits.append((x, n))
+        children[p] = [c for c in children[p] if not (x & c)] + [x]
+        children[x] = inside
+        parent[x] = p
+        rest = x
+        for c in inside:
+            parent[c] = x
+            rest &= ~c
+        while rest:
+            bit = rest & -rest
+            lowest[bit.bit_length() - 1] = x
+            rest ^= bit
+    return compatible_splits
     
-def ConstructTree(compatible_splits, split_lengths, taxa_index, taxa_ordered, nTrees):
+def ConstructTree(compatible_splits, split_counts, taxa_index, taxa_ordered, nTrees):
     # Progressively build the tree - Inspired by Day's algorithm (but I've not checked how similar)
     # Start from the leaves 
 #    t = ConstructTree(compatible_splits)
     nTrees = float(nTrees)
+    mask = (1 << len(taxa_index)) - 1
     t = tree.Tree()
     nodes_list = []
     for i, taxon in enumerate(taxa_ordered):
         n = tree.TreeNode()
         n.name = taxon
-        x = BitVector(taxa_index, taxon).Canonical()
-        n.dist = sum(split_lengths[x]) / float(len(split_lengths[x]))
+        x = Canonical(1 << taxa_index[taxon], mask)
+        n.dist = split_counts[x][1] / float(split_counts[x][0])
         nodes_list.append(n)
         t.add_child(n)
     compatible_splits = sorted(compatible_splits) # ascending
@@ -219,7 +241,7 @@ def ConstructTree(compatible_splits, split_lengths, taxa_index, taxa_ordered, nT
                     iInsert = i
                     node_new = tree.TreeNode()
                     node_new.support = nSup/nTrees
-                    node_new.dist = sum(split_lengths[x]) / float(len(split_lengths[x]))
+                    node_new.dist = split_counts[x][1] / float(split_counts[x][0])
                     node_new.add_child(node.detach())
                     nodes_list[i] = node_new
                     t.add_child(node_new)
@@ -236,7 +258,7 @@ def ConsensusTree(trees_dir):
     Calcualtes a greedy consensus tree for the set of trees
     
     Args:
-        trees_dir - directory containing the input trees    
+        trees_dir - directory containing the input trees, or a list of the trees (Tree objects)
     
     Returns:
         A greedy consensus tree
@@ -246,9 +268,9 @@ def ConsensusTree(trees_dir):
         - All trees should be unrooted
     """
     # Get the set of splits in the trees
-    splits_lengths, taxa_index, taxa_ordered, nTrees = GetAllSplits(trees_dir)
-    compatible_splits, split_lengths = GetCompatibleSplits(splits_lengths)
-    t = ConstructTree(compatible_splits, split_lengths, taxa_index, taxa_ordered, nTrees)
+    split_counts, taxa_index, taxa_ordered, nTrees = GetAllSplits(trees_dir)
+    compatible_splits = GetCompatibleSplits(split_counts)
+    t = ConstructTree(compatible_splits, split_counts, taxa_index, taxa_ordered, nTrees)
     return t
 
 def main(args):
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2014 David Emms
+#
+# This program (OrthoFinder) is distributed under the terms of the GNU General Public License v3
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#  When publishing work that uses OrthoFinder please cite:
+#      Emms, D.M. and Kelly, S. (2015) OrthoFinder: solving fundamental biases in whole genome comparisons dramatically
+#      improves orthogroup inference accuracy, Genome Biology 16:157
+#
+# For any enquiries send an email to David Emms
+# david_emms@hotmail.com
+
+"""
+Random access to the sequences in a set of FASTA files without reading them into memory.
+
+Each FASTA file has an index, in the style of samtools faidx, giving the accession of each sequence and the byte range
+of its sequence lines in the file. It is written alongside the file the first time it is needed (fastaFN + ".idx") and
+is rebuilt if the file's modification time or size change. The files themselves are memory-mapped and a sequence is
+returned as the exact bytes of its lines in the file, so it can be copied straight to another FASTA file.
+
+Usage:
+    store = FastaStore(fastaFNs)
+    seq = store.Sequence(accession)     # the sequence lines, including the newlines, or None
+"""
+import os
+import mmap
+import numpy as np
+
+indexSuffix = ".idx"
+
+def BuildIndex(data):
+    """
+    Returns (accessions, starts, ends) for the sequences in the FASTA file contents, data. A header is a line starting
+    with ">" and the sequence is all the lines up to the next header, data[start:end].
+    """
+    n = len(data)
+    accessions, starts, ends = [], [], []
+    pos = 0 if data[:1] == ">" else data.find("\n>")
+    if pos > 0: pos += 1
+    while pos != -1 and pos < n:
+        eol = data.find("\n", pos)
+        start = n if eol == -1 else eol + 1
+        accessions.append(data[pos+1:start].rstrip())
+        nxt = data.find("\n>", start - 1)
+        end = n if nxt == -1 else nxt + 1
+        starts.append(start)
+        ends.append(end)
+        pos = end if nxt != -1 else -1
+    return accessions, starts, ends
+
+def ReadIndex(fastaFN, data):
+    """ (accessions, starts, ends) for the FASTA file from its index file if it is current, else from data """
+    st = os.stat(fastaFN)
+    indexFN = fastaFN + indexSuffix
+    try:
+        with open(indexFN, 'rb') as infile:
+            index = np.load(infile)
+            if index["mtime"] == st.st_mtime and index["size"] == st.st_size:
+                return index["accessions"], index["starts"], index["ends"]
+    except (IOError, OSError, KeyError, ValueError):
+        pass
+    accessions, starts, ends = BuildIndex(data)
+    accessions = np.array(accessions, dtype=str)
+    starts = np.array(starts, dtype=np.int64)
+    ends = np.array(ends, dtype=np.int64)
+    tempFN = indexFN + ".%d.tmp" % os.getpid()
+    try:
+        with open(tempFN, 'wb') as outfile:
+            np.savez(outfile, accessions=accessions, starts=starts, ends=ends, mtime=st.st_mtime, size=st.st_size)
+        os.rename(tempFN, indexFN)
+    except (IOError, OSError):
+        # e.g. a read-only directory, the index is just kept in memory
+        if os.path.exists(tempFN): os.remove(tempFN)
+    return accessions, starts, ends
+
+class FastaStore(object):
+    def __init__(self, fastaFNs):
+        """
+        fastaFNs - the FASTA files, if an accession is in more than one file the sequence is from the last of them
+        """
+        self.data = []
+        accessions, iFiles, starts, ends = [], [], [], []
+        for iFile, fn in enumerate(fastaFNs):
+            with open(fn, 'rb') as infile:
+                data = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ) if os.path.getsize(fn) > 0 else ""
+            self.data.append(data)
+            a, s, e = ReadIndex(fn, data)
+            accessions.append(a)
+            iFiles.append(np.full(len(a), iFile, dtype=np.int32))
+            starts.append(s)
+            ends.append(e)
+        if len(accessions) == 0:
+            accessions = [np.array([], dtype=str)]
+        accessions = np.concatenate(accessions)
+        # sorted by accession for lookups, keeping only the last occurrence of each
+        order = np.argsort(accessions, kind='mergesort')
+        accessions = accessions[order]
+        qLast = np.ones(len(order), dtype=bool)
+        qLast[:-1] = accessions[:-1] != accessions[1:]
+        order = order[qLast]
+        self.accessions = accessions[qLast]
+        self.iFiles = np.concatenate(iFiles + [np.array([], dtype=np.int32)])[order]
+        self.starts = np.concatenate(starts + [np.array([], dtype=np.int64)])[order]
+        self.ends = np.concatenate(ends + [np.array([], dtype=np.int64)])[order]
+
+    def __len__(self):
+        return len(self.accessions)
+
+    def __contains__(self, accession):
+        return self.Find(accession) is not None
+
+    def Find(self, accession):
+        """ The index of the accession in the store or None if it isn't present """
+        i = np.searchsorted(self.accessions, accession)
+        if i < len(self.accessions) and self.accessions[i] == accession:
+            return i
+        return None
+
+    def Sequence(self, accession):
+        """ The lines of the sequence, as in the FASTA file, or None if the accession isn't present """
+        i = self.Find(accession)
+        if i is None: return None
+        return self.data[self.iFiles[i]][self.starts[i]:self.ends[i]]
@@ -44,6 +44,7 @@ import shutil
 import datetime
 
 import util
+import og_archive
 
 class SpeciesInfo(object):
     def __init__(self):
@@ -71,6 +72,7 @@ class __Files_new_dont_manually_create__(object):
         self.speciesTreeRootedIDsFN = None
         self.multipleRootedSpeciesTreesDir = None
         self.species_ids_corrected = None
+        self.qPackOGFiles = False       # write the per-orthogroup results files straight into archives, see og_archive
         # to be modified as appropriate
      
     """ ========================================================================================== """
@@ -314,7 +316,29 @@ class __Files_new_dont_manually_create__(object):
             fn = "%sBlast%d_%d.txt" % (d, iSpeciesSearch, jSpeciesDB)
             if os.path.exists(fn) or os.path.exists(fn + ".gz"): return fn
         raise Exception(fn + " not found")
-        
+
+    def GetBlastHitsFN(self, iSpeciesSearch, jSpeciesDB, qForCreation=False):
+        """
+        Binary cache of the best hits parsed from Blast{i}_{j}.txt. Returns None if there is no working directory
+        or, unless qForCreation, if no cache file exists.
+        """
+        if self.wd_current == None: return None
+        if qForCreation:
+            d = self.wd_current + "BlastHits/"
+            if not os.path.exists(d):
+                try:
+                    os.mkdir(d)
+                except OSError:
+                    pass    # another process created it
+            return "%sBlastHits%d_%d.npz" % (d, iSpeciesSearch, jSpeciesDB)
+        dirs = [self.wd_current] + self.wd_base
+        if self.clustersFilename != None: 
+            dirs.append(os.path.split(self.clustersFilename)[0] + os.sep)   # the analysis that inferred the orthogroups
+        for d in dirs:
+            fn = "%sBlastHits/BlastHits%d_%d.npz" % (d, iSpeciesSearch, jSpeciesDB)
+            if os.path.exists(fn): return fn
+        return None
+
     def GetGraphFilename(self):
         if self.wd_current == None: raise Exception("No wd_current")
         return self.wd_current + "%s_graph.txt" % self.fileIdentifierString
@@ -336,9 +360,7 @@ class __Files_new_dont_manually_create__(object):
         ========================================================================================== """
     
     def GetResultsSeqsDir_SingleCopy(self):
-        d = self.rd1 + "Single_Copy_Orthologue_Sequences/"
-        if not os.path.exists(d): os.mkdir(d)
-        return d        
+        return self.rd1 + "Single_Copy_Orthologue_Sequences/"
         
     def GetResultsSeqsDir(self):
         return self.rd1 + "Orthogroup_Sequences/"
@@ -425,9 +447,7 @@ class __Files_new_dont_manually_create__(object):
             
     def GetOGsReconTreeDir(self, qResults=False):
         if qResults:
-            d = self.rd1 + "Resolved_Gene_Trees/" 
-            if not os.path.exists(d): os.mkdir(d)
-            return d
+            return self.rd1 + "Resolved_Gene_Trees/" 
         else:
             raise NotImplemented() 
             
@@ -454,6 +474,26 @@ class __Files_new_dont_manually_create__(object):
                 except OSError:
                     time.sleep(1)
                     shutil.rmtree(dFull, True)  # shutil / NFS bug - ignore errors, it's less crucial that the files are deleted
+
+    def OGFileWriter(self, d):
+        """ Writer for the files for the results directory d, see og_archive.OGFileWriter """
+        return og_archive.OGFileWriter(d, self.qPackOGFiles)
+
+    def OGFilesLocation(self, d):
+        """ Where the files for the results directory d are, i.e. the archive they're written into with qPackOGFiles """
+        return og_archive.ArchiveFN(d) if self.qPackOGFiles else d
+
+    def PackOGFiles(self):
+        """
+        Move any per-orthogroup files that were written as files, e.g. the inputs to the MSA program in the working 
+        directory, into an archive for each directory (see og_archive). The gene trees in the working directory are 
+        left as they are since they are read by '-ft' runs. Returns the archive filenames
+        """
+        dirs = [self.rd1 + d for d in ["Orthogroup_Sequences/", "Single_Copy_Orthologue_Sequences/", "MultipleSequenceAlignments/", "Gene_Trees/", "Resolved_Gene_Trees/"]]
+        if self.wd_current != None:
+            dirs += [self.wd_current + d for d in ["Sequences_ids/", "Alignments_ids/"]]
+        archives = [og_archive.PackDirectory(d) for d in dirs if os.path.exists(d)]
+        return [fn for fn in archives if fn != None]
                     
     """ ************************************************************************************************************************* """
             
@@ -498,9 +538,11 @@ class __Files_new_dont_manually_create__(object):
             for i, d in enumerate([self.GetResultsSeqsDir(), self.wd_current + "Sequences_ids/", self.GetResultsAlignDir(), self.wd_current + "Alignments_ids/", self.GetResultsTreesDir(), self.wd_current + "Trees_ids/"]):
                 if stop_after == "seqs" and i == 2: break 
                 if stop_after == "align" and i == 4: break 
+                if self.qPackOGFiles and i % 2 == 0: continue   # results files go into archives
                 if not os.path.exists(d): os.mkdir(d)
         elif tree_generation_method == "dendroblast":
             for i, d in enumerate([self.wd_current + "Distances/", self.GetResultsTreesDir(), self.wd_current + "Trees_ids/"]):
+                if self.qPackOGFiles and i == 1: continue
                 if not os.path.exists(d): os.mkdir(d)
     
     def GetResultsFNBase(self):
@@ -531,6 +573,9 @@ class __Files_new_dont_manually_create__(object):
         d = self.rd1 + "Putative_Xenologs/"
         if not os.path.exists(d): os.mkdir(d)
         return d    
+    
+    def GetOrthologueStoreFN(self):
+        return self.GetOrthologuesDirectory() + "Orthologues.npz"
 
 FileHandler = __Files_new_dont_manually_create__()
                     
@@ -822,5 +867,6 @@ def InitialiseFileHandler(options, fastaDir=None, continuationDir=None, resultsD
     - If starting from a previous old-structure directory then, as high up as we can go and still be in the directory structure:
         - Fasta/Results_OldDate/OrthoFinder/Results_Date
     """
+    FileHandler.qPackOGFiles = options.qPackOGFiles
     FileHandler.CreateOutputDirectories(options, pfl, base_dir, fastaDir)    
         
\ No newline at end of file
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2014 David Emms
+#
+# This program (OrthoFinder) is distributed under the terms of the GNU General Public License v3
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#  When publishing work that uses OrthoFinder please cite:
+#      Emms, D.M. and Kelly, S. (2015) OrthoFinder: solving fundamental biases in whole genome comparisons dramatically
+#      improves orthogroup inference accuracy, Genome Biology 16:157
+#
+# For any enquiries send an email to David Emms
+# david_emms@hotmail.com
+
+"""
+In-process Markov clustering (MCL), an alternative to running the external mcl program on the graph file.
+
+The graph is a csr_matrix G in which row i holds the weighted edges of sequence i, i.e. the same layout as a line
+"i    j:w j:w ... $" of the mcl graph file. mcl works with column-stochastic matrices, the transpose of G, so here
+each row is normalised to sum to one and the expansion step for M^T is the matrix product M^T.M^T. Inflation, pruning
+and normalisation act on each row independently, so each iteration is distributed across processes in blocks of rows.
+
+The pruning defaults follow those of mcl: entries below 1/4000 are removed and at most 1100 entries are kept per row.
+"""
+import numpy as np
+import multiprocessing as mp
+from scipy import sparse
+from scipy.sparse import csgraph
+
+pruneThresholdDefault = 1./4000
+nSelectDefault = 1100
+chaosThreshold = 1e-4
+nIterationsMax = 200
+
+_M = None       # the matrix for the current iteration, set before the worker processes are forked
+
+def AddLoops(G):
+    """ Add a loop to each node with weight equal to the maximum weight of its edges (one if it has no edges), as mcl does """
+    n = G.shape[0]
+    G = G.tocsr()
+    loops = np.ones(n)
+    iRows = np.flatnonzero(np.diff(G.indptr))
+    if len(iRows) > 0:
+        loops[iRows] = np.maximum.reduceat(G.data, G.indptr[iRows])
+    return (G + sparse.diags(loops, 0, format='csr')).tocsr()
+
+def NormaliseRows(M):
+    rowSums = np.asarray(M.sum(axis=1)).ravel()
+    rowSums[rowSums == 0.] = 1.
+    M.data /= np.repeat(rowSums, np.diff(M.indptr))
+    return M
+
+def Prune(M, pruneThreshold, nSelect):
+    """ Remove entries below pruneThreshold and keep only the nSelect largest entries in each row """
+    M.data[M.data < pruneThreshold] = 0.
+    M.eliminate_zeros()
+    nPerRow = np.diff(M.indptr)
+    if nPerRow.max() > nSelect:
+        rows = np.repeat(np.arange(M.shape[0]), nPerRow)
+        order = np.lexsort((-M.data, rows))
+        rank = np.empty(len(order), dtype=np.int64)
+        rank[order] = np.arange(len(order)) - M.indptr[rows[order]]
+        M.data[rank >= nSelect] = 0.
+        M.eliminate_zeros()
+    return M
+
+def Chaos(M):
+    """ mcl's convergence measure, zero once every row is spread uniformly over its non-zero entries """
+    iRows = np.flatnonzero(np.diff(M.indptr))
+    if len(iRows) == 0: return 0.
+    maxes = np.maximum.reduceat(M.data, M.indptr[iRows])
+    sumSquares = np.add.reduceat(M.data*M.data, M.indptr[iRows])
+    return (maxes/sumSquares - 1.).max()
+
+def Iterate(block, inflation, pruneThreshold, nSelect):
+    """ Expansion, inflation & pruning for the rows [block[0], block[1]) of _M """
+    Mb = _M[block[0]:block[1]] * _M
+    Mb.data **= inflation
+    Mb = Prune(NormaliseRows(Mb), pruneThreshold, nSelect)
+    Mb = NormaliseRows(Mb)
+    return Mb, Chaos(Mb)
+
+def Worker_Iterate(args):
+    return Iterate(*args)
+
+def GetBlocks(M, nBlocks):
+    """ Split the rows into contiguous blocks with similar numbers of non-zero entries """
+    targets = np.linspace(0, M.nnz, nBlocks + 1)
+    bounds = np.unique(np.concatenate(([0], np.searchsorted(M.indptr, targets[1:-1]), [M.shape[0]])))
+    return zip(bounds[:-1], bounds[1:])
+
+def MCL(G, inflation, nProcesses=1, pruneThreshold=pruneThresholdDefault, nSelect=nSelectDefault):
+    """
+    Args:
+        G - n x n graph (csr_matrix), row i contains the weighted edges from node i
+        inflation - MCL inflation parameter
+        nProcesses - number of processes to use for each iteration
+    Returns:
+        clusters - list of lists of node indices, each sorted, largest cluster first
+    """
+    global _M
+    M = NormaliseRows(AddLoops(G).astype(np.float64))
+    nBlocks = 1 if nProcesses == 1 else 4*nProcesses
+    for iIter in xrange(nIterationsMax):
+        _M = M
+        args = [(block, inflation, pruneThreshold, nSelect) for block in GetBlocks(M, nBlocks)]
+        if nProcesses == 1:
+            results = map(Worker_Iterate, args)
+        else:
+            pool = mp.Pool(nProcesses)
+            results = pool.map(Worker_Iterate, args)
+            pool.close()
+            pool.join()
+        _M = None
+        M = sparse.vstack([Mb for Mb, _ in results], format='csr')
+        chaos = max(c for _, c in results)
+        if chaos < chaosThreshold: break
+    return Interpret(M)
+
+def Interpret(M):
+    """ Each node belongs to the cluster of the attractors its flow ends at, clusters sharing a node are joined """
+    nClusters, labels = csgraph.connected_components(M, directed=True, connection='weak')
+    order = np.argsort(labels, kind='mergesort')
+    bounds = np.searchsorted(labels[order], np.arange(nClusters + 1))
+    clusters = [order[bounds[i]:bounds[i+1]].tolist() for i in xrange(nClusters)]
+    clusters.sort(key=lambda c: (-len(c), c[0]))
+    return clusters
+
+def WriteClusters(clusters, nNodes, clustersFilename):
+    """ Write the clusters in the format of the mcl output file, as read by mcl.GetPredictedOGs """
+    with open(clustersFilename, 'wb') as outfile:
+        outfile.write("(mclheader\nmcltype matrix\ndimensions %dx%d\n)\n" % (nNodes, len(clusters)))
+        outfile.write("(mclmatrix\nbegin\n")
+        for iCluster, cluster in enumerate(clusters):
+            outfile.write("%d      %s $\n" % (iCluster, " ".join(map(str, cluster))))
+        outfile.write(")\n")
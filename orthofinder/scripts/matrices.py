@@ -26,22 +26,59 @@
 
 import os
 import glob
-import cPickle as pic
+import numpy as np
+from scipy import sparse
+from scipy.sparse import sputils
 
-import util, files
+import files
+
+"""
+Matrices are stored as raw CSR arrays so that they can be memory-mapped rather than deserialised. All the matrices 
+for one query species, (iSpecies, 0), (iSpecies, 1), ..., are written to a single file "<name><iSpecies>.csr" 
+and the shape and location of the indptr, indices & data arrays of each matrix are recorded in the index file,
+"<name><iSpecies>.idx". The indptr & indices arrays are stored with the integer type scipy uses for the matrix (int32 
+unless it is too large) so that the memory-mapped arrays are used as they are rather than converted.
+"""
+
+nIndexFields = 7                # nRows, nCols, nnz, index itemsize, indptr offset, indices offset, data offset
+dataDtype = np.dtype(np.float64)
+
+def IndexDtype(nnz, nCols):
+    """ The dtype scipy uses for the indptr & indices of a CSR matrix with nnz entries and nCols columns """
+    return np.dtype(sputils.get_index_dtype(maxval=max(nnz, nCols)))
+
+def GetMatrixFNs(name, iSpecies):
+    d = files.FileHandler.GetPickleDir()
+    return "%s%s%d.csr" % (d, name, iSpecies), "%s%s%d.idx" % (d, name, iSpecies)
 
-def DumpMatrix(name, m, iSpecies, jSpecies):
-    with open(files.FileHandler.GetPickleDir() + "%s%d_%d.pic" % (name, iSpecies, jSpecies), 'wb') as picFile:
-        pic.dump(m, picFile, protocol=util.picProtocol)
-    
 def DumpMatrixArray(name, matrixArray, iSpecies):
-    for jSpecies, m in enumerate(matrixArray):
-        DumpMatrix(name, m, iSpecies, jSpecies)
+    dataFN, indexFN = GetMatrixFNs(name, iSpecies)
+    index = np.zeros((len(matrixArray), nIndexFields), dtype=np.int64)
+    offset = 0
+    with open(dataFN, 'wb') as outfile:
+        for jSpecies, m in enumerate(matrixArray):
+            m = m.tocsr()
+            indexDtype = IndexDtype(m.nnz, m.shape[1])
+            index[jSpecies, :4] = m.shape + (m.nnz, indexDtype.itemsize)
+            for k, x in enumerate((m.indptr.astype(indexDtype), m.indices.astype(indexDtype), m.data.astype(dataDtype))):
+                index[jSpecies, 4+k] = offset
+                outfile.write(x.tostring())
+                offset += x.nbytes
+    with open(indexFN, 'wb') as outfile:
+        np.save(outfile, index)
+    
+def MapArray(dataFN, dtype, offset, n):
+    if n == 0: return np.zeros(0, dtype=dtype)
+    return np.memmap(dataFN, dtype=dtype, mode='c', offset=offset, shape=(n,))   # copy-on-write, the file is never modified
 
 def LoadMatrix(name, iSpecies, jSpecies): 
-    with open(files.FileHandler.GetPickleDir() + "%s%d_%d.pic" % (name, iSpecies, jSpecies), 'rb') as picFile:  
-        M = pic.load(picFile)
-    return M
+    dataFN, indexFN = GetMatrixFNs(name, iSpecies)
+    nRows, nCols, nnz, itemsize, offset_indptr, offset_indices, offset_data = np.load(indexFN)[jSpecies]
+    indexDtype = np.dtype(np.int32) if itemsize == 4 else np.dtype(np.int64)
+    indptr = MapArray(dataFN, indexDtype, offset_indptr, nRows + 1)
+    indices = MapArray(dataFN, indexDtype, offset_indices, nnz)
+    data = MapArray(dataFN, dataDtype, offset_data, nnz)
+    return sparse.csr_matrix((data, indices, indptr), shape=(nRows, nCols))
         
 def LoadMatrixArray(name, seqsInfo, iSpecies, row=True):
     matrixArray = []
@@ -65,5 +102,5 @@ def MatricesAndTr_s(Xarr, Yarr):
     return Zarr   
     
 def DeleteMatrices(baseName):
-    for f in glob.glob(files.FileHandler.GetPickleDir() + baseName + "*_*.pic"):
+    for f in glob.glob(files.FileHandler.GetPickleDir() + baseName + "*.csr") + glob.glob(files.FileHandler.GetPickleDir() + baseName + "*.idx"):
         if os.path.exists(f): os.remove(f)
@@ -42,6 +42,8 @@ __VERSION__="ete2-2.2rev1026"
 import re
 import os
 import base64 
+import itertools
+import gc
 
 __all__ = ["read_newick", "write_newick"]
 
@@ -226,6 +228,14 @@ def _read_newick_from_string(nw, root_node, format):
     # white spaces and separators are removed
     nw = re.sub("[\n\r\t]+", "", nw)
 
+    if format in _FAST_FORMATS and type(nw) == str and "[" not in nw and "]" not in nw:
+        nChildren = len(root_node.children)
+        try:
+            return _read_newick_fast(nw, root_node, format)
+        except _NotSimpleNewick:
+            # read it again below, which gives the same result or error as for any other tree
+            del root_node.children[nChildren:]
+
     current_parent = None
 
     # Ok, this is my own way of reading newick structures. I find it
@@ -275,6 +285,254 @@ def _read_newick_from_string(nw, root_node, format):
                     current_parent = current_parent.up
     return root_node
 
+# The attributes (first, is strict) of the leaf & internal nodes for the formats read by _read_newick_fast
+_FAST_FORMATS = {
+    0: (("name", False), ("support", False)),
+    1: (("name", False), ("name", False)),
+    2: (("name", True), ("support", True)),
+    3: (("name", True), ("name", True)),
+    5: (("name", True), (None, True)),
+}
+
+# The formats above whose labels are strict. For a tree that read_newick_arrays can read, read_newick raises a 
+# NewickError for one of these formats exactly when tree_from_arrays can't be used for it, the others never fail.
+_STRICT_FORMATS = (2, 3, 5)
+
+_NON_STRUCTURE_CHARS = "".join(chr(i) for i in xrange(256) if chr(i) not in "(),;")
+_STRUCTURE_TO_NULL = "".join("\x00" if chr(i) in "(),;" else chr(i) for i in xrange(256))
+
+class _NotSimpleNewick(Exception):
+    """ The tree can't be read by _read_newick_fast with certainty that the result is that of _read_newick_from_string """
+    pass
+
+def _read_float(s):
+    """ s as a float if it is entirely a match to _FLOAT_RE """
+    try:
+        value = float(s)
+    except ValueError:
+        raise _NotSimpleNewick
+    if s[0] not in "0123456789" and not (s[0] in "+-" and s[1:2].isdigit()):
+        raise _NotSimpleNewick   # e.g. '.5', 'nan', ' 1'
+    if "e" in s or "E" in s:
+        i = max(s.find("e"), s.find("E"))
+        if s[i+1] not in "+-": raise _NotSimpleNewick   # e.g. '1e5'
+    return value
+
+def _read_label(text, first, qStrict):
+    """ The values of the first attribute and the distance from the text following a node, None if not given """
+    i = text.find(":")
+    if i == -1:
+        if qStrict: raise _NotSimpleNewick
+        part1 = text
+        dist = None
+    else:
+        part1 = text[:i]
+        dist = _read_float(text[i+1:].rstrip())
+    if first == "name":
+        if part1 == "":
+            if qStrict: raise _NotSimpleNewick
+            value = None
+        else:
+            value = part1.strip()
+    elif first == "support":
+        part1 = part1.rstrip()
+        if part1 == "":
+            if qStrict: raise _NotSimpleNewick
+            value = None
+        else:
+            value = _read_float(part1)
+    else:
+        if part1.strip() != "": raise _NotSimpleNewick
+        value = None
+    return value, dist
+
+def _scan_newick(nw):
+    """ The structure of a newick string without NHX data, from a single pass over its structural characters.
+    Returns:
+        parents - for each node in preorder the index of its parent, -1 for the root
+        texts - for each node the text following it, None for the root if this is only white space
+
+    Anything that _read_newick_from_string would read in an unusual way, or fail to read, raises _NotSimpleNewick.
+    """
+    if "\x00" in nw or not nw.startswith("("): raise _NotSimpleNewick
+    # the structural characters and the text following each of them
+    separators = nw.translate(None, _NON_STRUCTURE_CHARS)
+    texts_in = nw.translate(_STRUCTURE_TO_NULL).split("\x00")[1:]
+    if separators[-1] != ";" or separators.count(";") != 1: raise _NotSimpleNewick
+    parents = [-1]
+    texts = [None]
+    iParent = None
+    for k in xrange(len(separators) - 1):
+        c = separators[k]
+        c_next = separators[k+1]
+        text = texts_in[k]
+        if c == ")":
+            # text is the data of the internal node just closed
+            if iParent is None: raise _NotSimpleNewick
+            if iParent == 0:
+                if c_next != ";": raise _NotSimpleNewick
+                if text.strip() != "": texts[0] = text
+                return parents, texts
+            if c_next == "(" or c_next == ";": raise _NotSimpleNewick
+            texts[iParent] = text
+            iParent = parents[iParent]
+            continue
+        if c == "(":
+            if iParent is None:
+                if k != 0: raise _NotSimpleNewick
+                iParent = 0
+            else:
+                parents.append(iParent)
+                texts.append(None)
+                iParent = len(parents) - 1
+        # c is "(" or ",", text is a leaf unless it's followed by the "(" of an internal node
+        if c_next == "(":
+            if text.strip() != "": raise _NotSimpleNewick
+        elif c_next == ";":
+            raise _NotSimpleNewick
+        else:
+            parents.append(iParent)
+            texts.append(text)
+    raise _NotSimpleNewick
+
+def _read_newick_fast(nw, root_node, format):
+    """ Reads a newick string in one of the formats in _FAST_FORMATS, without NHX data, creating the TreeNodes 
+    directly from the single pass over the string by _scan_newick. Raises _NotSimpleNewick if the tree should be read
+    by _read_newick_from_string instead.
+    """
+    (leafFirst, leafStrict), (internalFirst, internalStrict) = _FAST_FORMATS[format]
+    parents, texts = _scan_newick(nw)
+    qLeaf = [True] * len(parents)
+    for iParent in parents[1:]:
+        qLeaf[iParent] = False
+    Node = root_node.__class__
+    nodes = [root_node]
+    for i in xrange(1, len(parents)):
+        node = Node()
+        parent = nodes[parents[i]]
+        node._up = parent
+        parent._children.append(node)
+        nodes.append(node)
+        if qLeaf[i]:
+            value, dist = _read_label(texts[i], leafFirst, leafStrict)
+            if value is not None: node.name = value
+        else:
+            value, dist = _read_label(texts[i], internalFirst, internalStrict)
+            if value is not None:
+                if internalFirst == "name":
+                    node.name = value
+                else:
+                    node._support = value
+        if dist is not None: node._dist = dist
+    if texts[0] is not None:
+        value, dist = _read_label(texts[0], internalFirst, internalStrict)
+        if value is not None:
+            if internalFirst == "name":
+                root_node.name = value
+            else:
+                root_node._support = value
+        if dist is not None: root_node._dist = dist
+    return root_node
+
+def read_newick_arrays(newick):
+    """ Reads a newick tree from either a string or a file into arrays, a compact form of the tree that 
+    tree_from_arrays converts to TreeNodes without parsing the newick again.
+    Returns:
+        parents - for each node in preorder the index of its parent, -1 for the root
+        names - the leaf names and internal node names, None if not given
+        dists - the branch lengths, nan if not given
+        supports - the internal node labels read as support values, nan if not given
+        formats - bit i is set if tree_from_arrays gives the same tree as read_newick with format=i
+    Raises NewickError if the tree can't be read in a single pass, e.g. if it has NHX data.
+    """
+    if os.path.exists(newick):
+        nw = open(newick, 'rU').read()
+    else:
+        nw = newick
+    nw = nw.strip()
+    if not nw.startswith('(') or not nw.endswith(';') or nw.count('(') != nw.count(')'):
+        raise NewickError, 'Unexisting tree file or Malformed newick tree structure.'
+    nw = re.sub("[\n\r\t]+", "", nw)
+    if type(nw) != str or "[" in nw or "]" in nw:
+        raise NewickError, 'Tree can only be read by read_newick'
+    try:
+        parents, texts = _scan_newick(nw)
+    except _NotSimpleNewick:
+        raise NewickError, 'Tree can only be read by read_newick'
+    n = len(parents)
+    qLeaf = [True] * n
+    for iParent in parents[1:]:
+        qLeaf[iParent] = False
+    names = [None] * n
+    dists = [float('nan')] * n
+    supports = [float('nan')] * n
+    # whether every node of the type has the data required by the strict formats, or in the form of a support value
+    qLeafStrict = qNameStrict = qNoneStrict = qSupport = qSupportStrict = True
+    for i in xrange(n):
+        text = texts[i]
+        if text is None: continue
+        # all the formats read the distance in the same way and the name is read in the same way by all that read it
+        try:
+            name, dist = _read_label(text, "name", False)
+        except _NotSimpleNewick:
+            raise NewickError, 'Tree can only be read by read_newick'
+        if name is not None: names[i] = name
+        if dist is not None: dists[i] = dist
+        iColon = text.find(":")
+        if qLeaf[i]:
+            qLeafStrict = qLeafStrict and iColon > 0
+            continue
+        qNameStrict = qNameStrict and iColon > 0
+        part1 = text if iColon == -1 else text[:iColon]
+        qNoneStrict = qNoneStrict and iColon != -1 and part1.strip() == ""
+        part1 = part1.rstrip()
+        if part1 == "":
+            qSupportStrict = False
+        else:
+            try:
+                supports[i] = _read_float(part1)
+            except _NotSimpleNewick:
+                qSupport = qSupportStrict = False
+        qSupportStrict = qSupportStrict and iColon != -1
+    formats = [qSupport, True, qLeafStrict and qSupportStrict, qLeafStrict and qNameStrict, False, qLeafStrict and qNoneStrict]
+    formats = sum(1 << f for f, q in enumerate(formats) if q)
+    return parents, names, dists, supports, formats
+
+def array_format_errors(formats):
+    """ For a tree read by read_newick_arrays with these formats, bit i is set if read_newick raises a NewickError for 
+    format=i, without needing to read the tree again """
+    return ~formats & sum(1 << f for f in _STRICT_FORMATS)
+
+def tree_from_arrays(root_node, parents, names, dists, supports, format):
+    """ The tree read by read_newick_arrays as TreeNodes below root_node, format must be one of those it returned """
+    internalFirst = _FAST_FORMATS[format][1][0]
+    Node = root_node.__class__
+    nodes = [root_node]
+    # every node is kept, so the garbage collector passes triggered by creating them would only double the time taken
+    qGC = gc.isenabled()
+    gc.disable()
+    try:
+        nodes.extend(Node() for _ in xrange(len(parents) - 1))
+    finally:
+        if qGC: gc.enable()
+    for node, iParent in itertools.izip(itertools.islice(nodes, 1, None), itertools.islice(parents, 1, None)):
+        parent = nodes[iParent]
+        node._up = parent
+        parent._children.append(node)
+    # names, supports & distances that aren't given (None or nan) are left as the defaults
+    if internalFirst == "name":
+        for node, name in itertools.izip(nodes, names):
+            if name is not None: node.name = name
+    else:
+        for node, name in itertools.izip(nodes, names):
+            if name is not None and not node._children: node.name = name
+        if internalFirst == "support":
+            for node, support in itertools.izip(nodes, supports):
+                if support == support: node._support = support
+    for node, dist in itertools.izip(nodes, dists):
+        if dist == dist: node._dist = dist
+    return root_node
+
 def _parse_extra_features(node, NHX_string):
     """ Reads node's extra data form its NHX string. NHX uses this
     format:  [&&NHX:prop1=value1:prop2=value2] """
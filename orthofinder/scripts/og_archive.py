@@ -0,0 +1,281 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2014 David Emms
+#
+# This program (OrthoFinder) is distributed under the terms of the GNU General Public License v3
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#  When publishing work that uses OrthoFinder please cite:
+#      Emms, D.M. and Kelly, S. (2015) OrthoFinder: solving fundamental biases in whole genome comparisons dramatically
+#      improves orthogroup inference accuracy, Genome Biology 16:157
+#
+# For any enquiries send an email to David Emms
+# david_emms@hotmail.com
+
+"""
+The per-orthogroup files in a directory (e.g. Orthogroup_Sequences/OG0000000.fa) packed into a single archive so that
+a large analysis doesn't leave hundreds of thousands of small files behind.
+
+The archive is an uncompressed zip file, Orthogroup_Sequences.zip, so it can be listed and extracted with the standard
+tools. Alongside it is an index, Orthogroup_Sequences.zip.idx, giving the orthogroup, name and the byte range of the
+contents of each file in the archive. It is rebuilt from the zip file if the archive's modification time or size change.
+The archive is memory-mapped and a file is returned as the exact bytes that were packed.
+
+Usage:
+    with OGFileWriter(d, qPack) as writer:
+        writer.Write("OG0000000.fa", text)  # straight into the archive if qPack, else to the file in d
+    PackDirectory(d)                    # or pack the files in d once they have been written
+    archive = OGArchive(d[:-1] + ".zip")
+    text = archive.Read(iOG)            # the contents of the file for the orthogroup, or None
+"""
+import os
+import re
+import time
+import mmap
+import struct
+import zipfile
+import numpy as np
+
+import util
+
+archiveSuffix = ".zip"
+indexSuffix = ".idx"
+
+ogFilenameRegex = re.compile(r"^OG(\d+)[^/]*$")
+
+def ArchiveFN(d):
+    """ The archive for the directory d """
+    return d.rstrip(os.sep) + archiveSuffix
+
+def OGFromFilename(fn):
+    """ The orthogroup the file is for, or None if it isn't a per-orthogroup file """
+    m = ogFilenameRegex.match(os.path.basename(fn))
+    return None if m is None else int(m.group(1))
+
+def BuildIndex(archiveFN):
+    """
+    Returns (ogs, names, offsets, sizes) for the files in the zip archive, where the contents of a file are the bytes
+    offset:offset+size of the archive
+    """
+    ogs, names, offsets, sizes = [], [], [], []
+    with open(archiveFN, 'rb') as infile, zipfile.ZipFile(infile) as z:
+        for info in z.infolist():
+            iog = OGFromFilename(info.filename)
+            if iog is None: continue
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError("%s in %s is compressed" % (info.filename, archiveFN))
+            # the data starts after the local file header, whose name & extra field lengths may differ from the central directory
+            infile.seek(info.header_offset)
+            header = infile.read(zipfile.sizeFileHeader)
+            nName, nExtra = struct.unpack("<2H", header[26:30])
+            ogs.append(iog)
+            names.append(info.filename)
+            offsets.append(info.header_offset + zipfile.sizeFileHeader + nName + nExtra)
+            sizes.append(info.file_size)
+    return ogs, names, offsets, sizes
+
+def ReadIndex(archiveFN):
+    """ (ogs, names, offsets, sizes) for the archive from its index file if it is current, else from the archive """
+    st = os.stat(archiveFN)
+    indexFN = archiveFN + indexSuffix
+    try:
+        with open(indexFN, 'rb') as infile:
+            index = np.load(infile)
+            if index["mtime"] == st.st_mtime and index["size"] == st.st_size:
+                return index["ogs"], index["names"], index["offsets"], index["sizes"]
+    except (IOError, OSError, KeyError, ValueError):
+        pass
+    ogs, names, offsets, sizes = BuildIndex(archiveFN)
+    ogs = np.array(ogs, dtype=np.int64)
+    names = np.array(names, dtype=str)
+    offsets = np.array(offsets, dtype=np.int64)
+    sizes = np.array(sizes, dtype=np.int64)
+    tempFN = indexFN + ".%d.tmp" % os.getpid()
+    try:
+        with open(tempFN, 'wb') as outfile:
+            np.savez(outfile, ogs=ogs, names=names, offsets=offsets, sizes=sizes, mtime=st.st_mtime, size=st.st_size)
+        os.rename(tempFN, indexFN)
+    except (IOError, OSError):
+        # e.g. a read-only directory, the index is just kept in memory
+        if os.path.exists(tempFN): os.remove(tempFN)
+    return ogs, names, offsets, sizes
+
+def PackDirectory(d):
+    """
+    Move the per-orthogroup files in the directory d into the archive for it, ArchiveFN(d), and write its index. Any
+    other files are left in d, which is removed if it is then empty. If the archive already exists the files are
+    added to it, replacing any earlier copies.
+    Returns the archive filename, or None if there were no files to pack
+    """
+    fns = sorted(fn for fn in os.listdir(d) if OGFromFilename(fn) is not None and os.path.isfile(os.path.join(d, fn)))
+    if len(fns) == 0: return None
+    archiveFN = ArchiveFN(d)
+    qAppend = os.path.exists(archiveFN)
+    tempFN = archiveFN + ".%d.tmp" % os.getpid()
+    try:
+        with zipfile.ZipFile(tempFN, 'w', zipfile.ZIP_STORED, allowZip64=True) as z:
+            if qAppend:
+                with zipfile.ZipFile(archiveFN) as old:
+                    for info in old.infolist():
+                        if info.filename not in fns: z.writestr(info, old.read(info))
+            for fn in fns:
+                z.write(os.path.join(d, fn), fn)
+        os.rename(tempFN, archiveFN)
+    finally:
+        if os.path.exists(tempFN): os.remove(tempFN)
+    ReadIndex(archiveFN)
+    for fn in fns:
+        os.remove(os.path.join(d, fn))
+    if len(os.listdir(d)) == 0:
+        os.rmdir(d)
+    return archiveFN
+
+class OGArchive(object):
+    def __init__(self, archiveFN):
+        with open(archiveFN, 'rb') as infile:
+            self.data = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+        ogs, names, offsets, sizes = ReadIndex(archiveFN)
+        # sorted by orthogroup for lookups
+        order = np.argsort(ogs, kind='mergesort')
+        self.ogs = ogs[order]
+        self.names = names[order]
+        self.offsets = offsets[order]
+        self.sizes = sizes[order]
+
+    def __len__(self):
+        return len(self.ogs)
+
+    def __contains__(self, iog):
+        return self.Find(iog) is not None
+
+    def OGs(self):
+        """ The orthogroups with a file in the archive, in order """
+        return self.ogs.tolist()
+
+    def Find(self, iog):
+        """ The index of the orthogroup's file in the archive or None if it isn't present """
+        i = np.searchsorted(self.ogs, iog)
+        if i < len(self.ogs) and self.ogs[i] == iog:
+            return i
+        return None
+
+    def Filename(self, iog):
+        """ The name the orthogroup's file had in the directory, or None if it isn't present """
+        i = self.Find(iog)
+        return None if i is None else self.names[i]
+
+    def Read(self, iog):
+        """ The contents of the orthogroup's file, or None if it isn't present """
+        i = self.Find(iog)
+        if i is None: return None
+        return self.data[self.offsets[i]:self.offsets[i] + self.sizes[i]]
+
+    def Close(self):
+        self.data.close()
+
+def Exists(d, fn):
+    """ Whether the file fn from the directory d exists, either in d or in the archive for d """
+    if os.path.exists(os.path.join(d, fn)): return True
+    archiveFN = ArchiveFN(d)
+    return os.path.exists(archiveFN) and fn in ReadIndex(archiveFN)[1]
+
+class OGFileWriter(object):
+    """
+    Writes the files for the directory d. With qPack the per-orthogroup files are written straight into the archive 
+    for d, so they are never created in d, and the archive is only in place once Close is called. Any other files, or 
+    all files without qPack, are written to d. An existing archive is added to, replacing any earlier copies.
+    Only the process that created the writer may write to the archive, other processes may write the files in d.
+    """
+    def __init__(self, d, qPack):
+        self.d = d
+        self.qPack = qPack
+        self.archiveFN = ArchiveFN(d)
+        self.tempFN = self.archiveFN + ".%d.tmp" % os.getpid()
+        self.z = None
+        self.written = set()
+        if not qPack: self.MakeDirectory()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.Close()
+        else:
+            self.Abort()
+
+    def Write(self, fn, text):
+        if self.qPack and OGFromFilename(fn) is not None:
+            if self.z is None:
+                self.z = zipfile.ZipFile(self.tempFN, 'w', zipfile.ZIP_STORED, allowZip64=True)
+            info = zipfile.ZipInfo(fn, time.localtime()[:6])
+            info.external_attr = 0o644 << 16
+            self.z.writestr(info, text)
+            self.written.add(fn)
+        else:
+            self.MakeDirectory()
+            with util.AtomicWrite(os.path.join(self.d, fn)) as outfile:
+                outfile.write(text)
+
+    def MakeDirectory(self):
+        if not os.path.exists(self.d): 
+            try:
+                os.mkdir(self.d)
+            except OSError:
+                # created by another process writing to d
+                if not os.path.isdir(self.d): raise
+
+    def Close(self):
+        """ Returns the archive filename, or None if nothing was written to the archive """
+        if self.z is None: return None
+        try:
+            if os.path.exists(self.archiveFN):
+                with zipfile.ZipFile(self.archiveFN) as old:
+                    for info in old.infolist():
+                        if info.filename not in self.written: self.z.writestr(info, old.read(info))
+            self.z.close()
+            os.rename(self.tempFN, self.archiveFN)
+        finally:
+            self.Abort()
+        ReadIndex(self.archiveFN)
+        return self.archiveFN
+
+    def Abort(self):
+        """ Discard anything written to the archive """
+        if self.z is not None: 
+            self.z.close()
+            self.z = None
+        if os.path.exists(self.tempFN): os.remove(self.tempFN)
+
+class OGFileReader(object):
+    """ Reads the files for the directory d, from the archive for d if there is one, else from the files in d """
+    def __init__(self, d):
+        self.d = d
+        archiveFN = ArchiveFN(d)
+        self.archive = OGArchive(archiveFN) if os.path.exists(archiveFN) else None
+
+    def Read(self, fn):
+        """ The contents of the file fn, or None if it doesn't exist """
+        if self.archive is not None:
+            iog = OGFromFilename(fn)
+            if iog is not None and self.archive.Filename(iog) == fn:
+                return self.archive.Read(iog)
+        fn = os.path.join(self.d, fn)
+        if not os.path.exists(fn): return None
+        with open(fn, 'rb') as infile:
+            return infile.read()
+
+    def Close(self):
+        if self.archive is not None: self.archive.Close()
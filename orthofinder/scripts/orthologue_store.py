@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2014 David Emms
+#
+# This program (OrthoFinder) is distributed under the terms of the GNU General Public License v3
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#  When publishing work that uses OrthoFinder please cite:
+#      Emms, D.M. and Kelly, S. (2015) OrthoFinder: solving fundamental biases in whole genome comparisons dramatically
+#      improves orthogroup inference accuracy, Genome Biology 16:157
+#
+# For any enquiries send an email to David Emms
+# david_emms@hotmail.com
+
+"""
+All the orthologues of a run in a single binary file, an alternative to parsing the species-pair tsv files.
+
+The file is an .npz with a table of gene pairs: 'gene0', 'gene1' (int32), 'og' (int32, the orthogroup) and 'type'
+(int8, ORTHOLOGUE or XENOLOGUE), sorted by gene0 then gene1. Each relationship is stored in both directions. Genes are
+indexed by their position in 'names', the sequences of species 'species'[i] start at 'offsets'[i].
+
+Usage:
+    store = OrthologueStore(fn)
+    store.Orthologues("gene_accession")
+    store.SpeciesPair("species_A", "species_B")
+"""
+import array
+import numpy as np
+
+ORTHOLOGUE = 0
+XENOLOGUE = 1    # putative xenologue, one of the two genes is phylogenetically misplaced
+relationshipNames = {ORTHOLOGUE:"Orthologue", XENOLOGUE:"Putative xenologue"}
+
+class OrthologueStoreWriter(object):
+    """ Collects the orthologues as they are inferred, one group of many-to-many orthologues at a time """
+    def __init__(self):
+        self.og = array.array('i')
+        self.sp0 = array.array('i')
+        self.sp1 = array.array('i')
+        self.relType = array.array('b')
+        self.n0 = array.array('i')
+        self.n1 = array.array('i')
+        self.seqs0 = array.array('i')
+        self.seqs1 = array.array('i')
+
+    def Add(self, iog, iSp0, seqs0, iSp1, seqs1, relType=ORTHOLOGUE):
+        """
+        Each of the sequences seqs0 (OrthoFinder sequence indices) from species iSp0 is related to each of seqs1 from iSp1
+        """
+        self.og.append(iog)
+        self.sp0.append(iSp0)
+        self.sp1.append(iSp1)
+        self.relType.append(relType)
+        self.n0.append(len(seqs0))
+        self.n1.append(len(seqs1))
+        self.seqs0.extend(seqs0)
+        self.seqs1.extend(seqs1)
+
+    def Write(self, fn, ogSet):
+        speciesToUse = ogSet.speciesToUse
+        speciesDict = ogSet.SpeciesDict()
+        sequenceDict = ogSet.SequenceDict()
+        nSeqs = [ogSet.seqsInfo.nSeqsPerSpecies[iSp] for iSp in speciesToUse]
+        offsets = np.cumsum([0] + nSeqs)
+        spOffset = np.zeros(max(speciesToUse) + 1, dtype=np.int64)
+        spOffset[speciesToUse] = offsets[:-1]
+        names = np.array([sequenceDict["%d_%d" % (iSp, iSeq)] for iSp, n in zip(speciesToUse, nSeqs) for iSeq in xrange(n)])
+        # expand each group to its pairs
+        n0 = np.frombuffer(self.n0, dtype=np.int32).astype(np.int64)
+        n1 = np.frombuffer(self.n1, dtype=np.int32).astype(np.int64)
+        nPairs = n0*n1
+        iGroup = np.repeat(np.arange(len(nPairs)), nPairs)
+        p = np.arange(nPairs.sum()) - np.repeat(np.cumsum(nPairs) - nPairs, nPairs)
+        i0 = (np.cumsum(n0) - n0)[iGroup] + p // n1[iGroup]
+        i1 = (np.cumsum(n1) - n1)[iGroup] + p % n1[iGroup]
+        g0 = spOffset[np.frombuffer(self.sp0, dtype=np.int32)[iGroup]] + np.frombuffer(self.seqs0, dtype=np.int32)[i0]
+        g1 = spOffset[np.frombuffer(self.sp1, dtype=np.int32)[iGroup]] + np.frombuffer(self.seqs1, dtype=np.int32)[i1]
+        og = np.frombuffer(self.og, dtype=np.int32)[iGroup]
+        relType = np.frombuffer(self.relType, dtype=np.int8)[iGroup]
+        gene0 = np.concatenate((g0, g1))
+        gene1 = np.concatenate((g1, g0))
+        og = np.concatenate((og, og))
+        relType = np.concatenate((relType, relType))
+        order = np.lexsort((gene1, gene0))
+        np.savez(fn,
+                 gene0=gene0[order].astype(np.int32),
+                 gene1=gene1[order].astype(np.int32),
+                 og=og[order],
+                 type=relType[order],
+                 species=np.array(speciesToUse, dtype=np.int32),
+                 species_names=np.array([speciesDict[str(iSp)] for iSp in speciesToUse]),
+                 offsets=offsets,
+                 names=names)
+
+class OrthologueStore(object):
+    """ Queries of the file written by OrthologueStoreWriter """
+    def __init__(self, fn):
+        with np.load(fn) as data:
+            self.gene0 = data["gene0"]
+            self.gene1 = data["gene1"]
+            self.og = data["og"]
+            self.relType = data["type"]
+            self.species = data["species"]
+            self.speciesNames = data["species_names"].tolist()
+            self.offsets = data["offsets"]
+            self.names = data["names"]
+        self.nameToIndex = None
+
+    def GeneIndex(self, gene):
+        """ gene - the gene's accession or its OrthoFinder ID, 'iSpecies_iSequence' """
+        if self.nameToIndex is None:
+            self.nameToIndex = {name:i for i, name in enumerate(self.names.tolist())}
+        if gene in self.nameToIndex: return self.nameToIndex[gene]
+        try:
+            iSp, iSeq = map(int, gene.split("_"))
+            return self.offsets[self.species.tolist().index(iSp)] + iSeq
+        except ValueError:
+            raise KeyError(gene)
+
+    def SpeciesIndex(self, species):
+        """ species - the species name or its OrthoFinder ID """
+        if species in self.speciesNames: return self.speciesNames.index(species)
+        try:
+            return self.species.tolist().index(int(species))
+        except ValueError:
+            raise KeyError(species)
+
+    def Orthologues(self, gene, qXenologues=False):
+        """
+        Returns list of (gene accession, orthogroup, relationship) for each orthologue of gene
+        """
+        i = self.GeneIndex(gene)
+        start, end = np.searchsorted(self.gene0, [i, i+1])
+        rel = self.relType[start:end]
+        select = slice(start, end) if qXenologues else start + np.flatnonzero(rel == ORTHOLOGUE)
+        return [(self.names[g], "OG%07d" % og, relationshipNames[t]) for g, og, t in zip(self.gene1[select], self.og[select], self.relType[select])]
+
+    def SpeciesPair(self, species0, species1, qXenologues=False):
+        """
+        Returns list of (orthogroup, gene from species0, gene from species1) for each pair of orthologues
+        """
+        i = self.SpeciesIndex(species0)
+        j = self.SpeciesIndex(species1)
+        start, end = np.searchsorted(self.gene0, self.offsets[i:i+2])
+        g1 = self.gene1[start:end]
+        select = (self.offsets[j] <= g1) & (g1 < self.offsets[j+1])
+        if not qXenologues: select &= (self.relType[start:end] == ORTHOLOGUE)
+        select = start + np.flatnonzero(select)
+        return [("OG%07d" % og, self.names[g0], self.names[g1]) for og, g0, g1 in zip(self.og[select], self.gene0[select], self.gene1[select])]
@@ -49,6 +49,8 @@ import trees_msa
 import wrapper_phyldog
 import stag
 import files
+import orthologue_store
+import tree_cache
 
 nThreads = util.nThreadsDefault
 
@@ -205,6 +207,17 @@ def lil_minmax(M):
         mins[kRow] = min(values.data[0])
         maxes[kRow] = max(values.data[0])
     return mins, maxes
+
+def csr_minmax(M):
+    n = M.shape[0]
+    mins = np.ones((n, 1), dtype = np.float64) * 9e99
+    maxes = np.zeros((n, 1), dtype = np.float64)
+    iRows = np.flatnonzero(np.diff(M.indptr))
+    if len(iRows) > 0:
+        starts = M.indptr[iRows]
+        mins[iRows, 0] = np.minimum.reduceat(M.data, starts)
+        maxes[iRows, 0] = np.maximum.reduceat(M.data, starts)
+    return mins, maxes
  
    
 # ==============================================================================================================================    
@@ -232,30 +245,89 @@ def GetSpeciesTreeRoot_TwoTaxa(taxa):
 # ==============================================================================================================================      
 # DendroBlast   
 
-def Worker_OGMatrices_ReadBLASTAndUpdateDistances(cmd_queue, worker_status_queue, iWorker, ogMatrices, nGenes, seqsInfo, blastDir_list, ogsPerSpecies, qDoubleBlast):
-    speciesToUse = seqsInfo.speciesToUse
-    with np.errstate(divide='ignore'):
-        while True:
-            try:
-                iiSp, sp1, nSeqs_sp1 = cmd_queue.get(True, 1)
-                worker_status_queue.put(("start", iWorker, iiSp))
-                Bs = [BlastFileProcessor.GetBLAST6Scores(seqsInfo, blastDir_list, sp1, sp2, qExcludeSelfHits = False, qDoubleBlast=qDoubleBlast) for sp2 in speciesToUse]    
-                mins = np.ones((nSeqs_sp1, 1), dtype=np.float64)*9e99 
-                maxes = np.zeros((nSeqs_sp1, 1), dtype=np.float64)
-                for B in Bs:
-                    m0, m1 = lil_minmax(B)
-                    mins = np.minimum(mins, m0)
-                    maxes = np.maximum(maxes, m1)
-                maxes_inv = 1./maxes
-                for jjSp, B  in enumerate(Bs):
-                    for og, m in zip(ogsPerSpecies, ogMatrices):
-                        for gi, i in og[iiSp]:
-                            for gj, j in og[jjSp]:
-                                    m[i][j] = 0.5*max(B[gi.iSeq, gj.iSeq], mins[gi.iSeq]) * maxes_inv[gi.iSeq]
-                worker_status_queue.put(("finish", iWorker, iiSp))
-            except Queue.Empty:
-                worker_status_queue.put(("empty", iWorker, None))
-                return 
+def Worker_OGMatrices_ReadBLASTAndUpdateDistances(cmd_queue, worker_status_queue, iWorker, ogMatrixBuffer, ogOffsets, nGenes, minsBuffer, maxesBuffer, locks, seqOffsets, seqsInfo, blastDir_list, ogMembersPerSpecies, qDoubleBlast):
+    """
+    One task per species pair (iiSp, jjSp): copies the BLAST scores for that pair into the OG matrices and combines 
+    the min and max of each row of scores with those of the other species pairs for iiSp. The OG matrices for 
+    different pairs don't overlap so the tasks write to the shared buffer independently, the row mins & maxes for 
+    species iiSp are only updated while holding locks[iiSp].
+    """
+    ogMatricesFlat = np.frombuffer(ogMatrixBuffer, dtype=np.float64)
+    mins_all = np.frombuffer(minsBuffer, dtype=np.float64)
+    maxes_all = np.frombuffer(maxesBuffer, dtype=np.float64)
+    while True:
+        try:
+            iTask, (iiSp, jjSp, sp1, sp2) = cmd_queue.get(True, 1)
+            worker_status_queue.put(("start", iWorker, iTask))
+            B = BlastFileProcessor.GetBLAST6Scores(seqsInfo, blastDir_list, sp1, sp2, qExcludeSelfHits = False, qDoubleBlast=qDoubleBlast)
+            m0, m1 = csr_minmax(B)
+            with locks[iiSp]:
+                mins = mins_all[seqOffsets[iiSp]:seqOffsets[iiSp+1]]
+                maxes = maxes_all[seqOffsets[iiSp]:seqOffsets[iiSp+1]]
+                np.minimum(mins, m0[:,0], out=mins)
+                np.maximum(maxes, m1[:,0], out=maxes)
+            FillOGMatrices(ogMatricesFlat, ogOffsets, nGenes, ogMembersPerSpecies[iiSp], ogMembersPerSpecies[jjSp], B)
+            worker_status_queue.put(("finish", iWorker, iTask))
+        except Queue.Empty:
+            worker_status_queue.put(("empty", iWorker, None))
+            return 
+
+def OGChunks(nEntries, nPerChunk):
+    """ (iOG, iEnd) for consecutive chunks of orthogroups with about nPerChunk entries, nEntries per orthogroup """
+    cumEntries = np.concatenate(([0], np.cumsum(nEntries)))
+    nOGs = len(nEntries)
+    iOG = 0
+    while iOG < nOGs:
+        iEnd = max(iOG + 1, np.searchsorted(cumEntries, cumEntries[iOG] + nPerChunk, side='right') - 1)
+        iEnd = min(iEnd, nOGs)
+        yield iOG, iEnd
+        iOG = iEnd
+
+def FillOGMatrices(ogMatricesFlat, ogOffsets, nGenes, members_i, members_j, B, nPairsPerChunk=10000000):
+    """
+    Set Mij = Bij for every gene i from species_i and gene j from species_j in each orthogroup
+    Args:
+        ogMatricesFlat - all the orthogroup matrices, flattened & concatenated
+        ogOffsets, nGenes - start of each orthogroup matrix in ogMatricesFlat & number of genes in the orthogroup
+        members_i, members_j - (iOG, position in OG, iSeq) arrays for the genes from the two species, ordered by iOG
+        B - the BLAST scores for species_i vs species_j
+    """
+    og_i, pos_i, seq_i = members_i
+    og_j, pos_j, seq_j = members_j
+    nOGs = len(nGenes)
+    n_i = np.bincount(og_i, minlength=nOGs)
+    n_j = np.bincount(og_j, minlength=nOGs)
+    start_i = np.cumsum(n_i) - n_i
+    start_j = np.cumsum(n_j) - n_j
+    nPairs = n_i * n_j
+    cumPairs = np.concatenate(([0], np.cumsum(nPairs)))
+    # process the gene pairs a chunk of orthogroups at a time so the index arrays stay small
+    for iOG, iEnd in OGChunks(nPairs, nPairsPerChunk):
+        nPairsChunk = nPairs[iOG:iEnd]
+        if cumPairs[iEnd] > cumPairs[iOG]:
+            ogOfPair = np.repeat(np.arange(iOG, iEnd), nPairsChunk)
+            p = np.arange(cumPairs[iEnd] - cumPairs[iOG]) - np.repeat(cumPairs[iOG:iEnd] - cumPairs[iOG], nPairsChunk)
+            a = start_i[ogOfPair] + p // n_j[ogOfPair]
+            b = start_j[ogOfPair] + p % n_j[ogOfPair]
+            ogMatricesFlat[ogOffsets[ogOfPair] + pos_i[a]*nGenes[ogOfPair] + pos_j[b]] = np.asarray(B[seq_i[a], seq_j[b]]).ravel()
+
+def NormaliseOGMatrices(ogMatricesFlat, ogOffsets, nGenes, rowSeqs, mins, maxes_inv, nEntriesPerChunk=10000000):
+    """
+    Set Mij = 0.5*max(Bij, Bmin_i)/Bmax_i for the matrices filled with the BLAST scores by FillOGMatrices
+    Args:
+        ogMatricesFlat, ogOffsets, nGenes - as for FillOGMatrices
+        rowSeqs - for each row of each orthogroup matrix, in order, the index of its gene in mins & maxes_inv
+        mins, maxes_inv - Bmin_i and 1/Bmax_i
+    """
+    nEntries = nGenes*nGenes
+    geneOffsets = np.cumsum(nGenes) - nGenes
+    for iOG, iEnd in OGChunks(nEntries, nEntriesPerChunk):
+        start, end = ogOffsets[iOG], ogOffsets[iEnd-1] + nEntries[iEnd-1]
+        if end == start: continue
+        ogOfEntry = np.repeat(np.arange(iOG, iEnd), nEntries[iOG:iEnd])
+        row = (np.arange(start, end) - ogOffsets[ogOfEntry]) // nGenes[ogOfEntry]
+        g = rowSeqs[geneOffsets[ogOfEntry] + row]
+        ogMatricesFlat[start:end] = 0.5*np.maximum(ogMatricesFlat[start:end], mins[g]) * maxes_inv[g]
 
 def GetRAMErrorText():
     text = "ERROR: The computer ran out of RAM and killed OrthoFinder processes\n"
@@ -264,10 +336,11 @@ def GetRAMErrorText():
     return text
                 
 class DendroBLASTTrees(object):
-    def __init__(self, ogSet, nProcesses, qDoubleBlast):
+    def __init__(self, ogSet, nProcesses, qDoubleBlast, qSTAG_BIONJ=False):
         self.ogSet = ogSet
         self.nProcesses = nProcesses
         self.qDoubleBlast = qDoubleBlast
+        self.qSTAG_BIONJ = qSTAG_BIONJ
         # Check files exist
     
     def TreeFilename_IDs(self, iog):
@@ -278,111 +351,137 @@ class DendroBLASTTrees(object):
         read the blast files as well, remove need for intermediate pickle and unpickle
         ogMatrices contains matrix M for each OG where:
             Mij = 0.5*max(Bij, Bmin_i)/Bmax_i
+        The matrices are filled with the BLAST scores by one task per species pair, largest first, which also finds 
+        the min & max of its rows of scores. Each BLAST matrix is only loaded once, the row normalisers Bmin_i & 
+        Bmax_i are combined across the species pairs as they finish and the matrices normalised once all are done.
         """
         with warnings.catch_warnings():         
             warnings.simplefilter("ignore")
             ogs = self.ogSet.OGs()
-            ogsPerSpecies = [[[(g, i) for i, g in enumerate(og) if g.iSp == iSp] for iSp in self.ogSet.seqsInfo.speciesToUse] for og in ogs]
-            nGenes = [len(og) for og in ogs]
+            ogMembersPerSpecies = self.GetOGMembersPerSpecies(ogs)
+            nGenes = np.array([len(og) for og in ogs], dtype=np.int64)
+            speciesToUse = self.ogSet.seqsInfo.speciesToUse
             nSeqs = self.ogSet.seqsInfo.nSeqsPerSpecies
-            ogMatrices = [[mp.Array('d', n, lock=False) for _ in xrange(n)] for n in nGenes]
+            ogOffsets = np.cumsum(nGenes*nGenes) - nGenes*nGenes
+            seqOffsets = np.cumsum([0] + [nSeqs[sp] for sp in speciesToUse])
+            try:
+                ogMatrixBuffer = mp.RawArray('d', int((nGenes*nGenes).sum()))    # a single shared array for all the matrices
+                minsBuffer = mp.RawArray('d', int(seqOffsets[-1]))
+                maxesBuffer = mp.RawArray('d', int(seqOffsets[-1]))
+            except (MemoryError, OSError):
+                files.FileHandler.LogFailAndExit(GetRAMErrorText())
+            mins = np.frombuffer(minsBuffer, dtype=np.float64)
+            maxes = np.frombuffer(maxesBuffer, dtype=np.float64)
+            mins[:] = 9e99
+            locks = [mp.Lock() for _ in speciesToUse]
             blastDir_list = files.FileHandler.GetBlastResultsDir()
-            cmd_queue = mp.Queue()
-            for iiSp, sp1 in enumerate(self.ogSet.seqsInfo.speciesToUse):
-                cmd_queue.put((iiSp, sp1, nSeqs[sp1]))
-            worker_status_queue = mp.Queue()
-            runningProcesses = [mp.Process(target=Worker_OGMatrices_ReadBLASTAndUpdateDistances, args=(cmd_queue, worker_status_queue, iWorker, ogMatrices, nGenes, self.ogSet.seqsInfo, blastDir_list, ogsPerSpecies, self.qDoubleBlast)) for iWorker in xrange(self.nProcesses)]
-            for proc in runningProcesses:
-                proc.start()
-            rota = [None for iWorker in xrange(self.nProcesses)]
-            unfinished = []
-            while True:
-                # get process alive/dead
-                time.sleep(1)
-                alive = [proc.is_alive() for proc in runningProcesses]
-                # read latest updates from queue, update rota
-                try:
-                    while True:
-                        status, iWorker, iTask = worker_status_queue.get(True, 0.1)
-                        if status == "start":
-                            rota[iWorker] = iTask
-                        elif status == "finish":
-                            rota[iWorker] = None
-                        elif status == "empty":
-                            rota[iWorker] = "empty"
-                except Queue.Empty:
-                    pass
-                # if worker is dead but didn't finish task, issue warning
-                for al, r in zip(alive, rota):
-                    if (not al) and (r != "empty"):
-                        text = GetRAMErrorText()
-                        files.FileHandler.LogFailAndExit(text)
-                        unfinished.append(r)
-                if not any(alive):
-                    break
-                
-            if len(unfinished) != 0:
-                files.FileHandler.LogFailAndExit()
-#                print("WARNING: Computer ran out of RAM and killed OrthoFinder processes")
-#                print("OrthoFinder will attempt to run these processes once more. If it is")
-#                print("unsuccessful again then it will have to exit. Consider using")
-#                print("the option '-a 1' or running on a machine with more RAM")
-            #ogMatrices = [np.matrix(m) for m in ogMatrices]
-            return ogs, ogMatrices      
+            speciesPairs = list(itertools.product(enumerate(speciesToUse), enumerate(speciesToUse)))
+            taskSizes = [nSeqs[sp1]*nSeqs[sp2] for (_, sp1), (_, sp2) in speciesPairs]
+            tasks = [(iiSp, jjSp, sp1, sp2) for (iiSp, sp1), (jjSp, sp2) in speciesPairs]
+            taskSizes, tasks = util.SortArrayPairByFirst(taskSizes, tasks, True)
+            self.RunOGMatrixWorkers(Worker_OGMatrices_ReadBLASTAndUpdateDistances, tasks, (ogMatrixBuffer, ogOffsets, nGenes, minsBuffer, maxesBuffer, locks, seqOffsets, self.ogSet.seqsInfo, blastDir_list, ogMembersPerSpecies, self.qDoubleBlast))
+            ogMatricesFlat = np.frombuffer(ogMatrixBuffer, dtype=np.float64)
+            # the row of the normalisers for each row of the OG matrices
+            geneOffsets = np.cumsum(nGenes) - nGenes
+            rowSeqs = np.zeros(int(nGenes.sum()), dtype=np.int64)
+            for iiSp, (og_sp, pos_sp, seq_sp) in enumerate(ogMembersPerSpecies):
+                rowSeqs[geneOffsets[og_sp] + pos_sp] = seqOffsets[iiSp] + seq_sp
+            with np.errstate(divide='ignore'):
+                maxes_inv = 1./maxes
+            NormaliseOGMatrices(ogMatricesFlat, ogOffsets, nGenes, rowSeqs, mins, maxes_inv)
+            ogMatrices = [ogMatricesFlat[offset:offset+n*n].reshape((n, n)) for offset, n in zip(ogOffsets, nGenes)]
+            return ogs, ogMatrices
+            
+    def RunOGMatrixWorkers(self, target, tasks, args):
+        """
+        Run the tasks on self.nProcesses worker processes, target(cmd_queue, worker_status_queue, iWorker, *args),
+        and exit with the RAM error message if a worker is killed before finishing its tasks
+        """
+        cmd_queue = mp.Queue()
+        for iTask, task in enumerate(tasks):
+            cmd_queue.put((iTask, task))
+        worker_status_queue = mp.Queue()
+        runningProcesses = [mp.Process(target=target, args=(cmd_queue, worker_status_queue, iWorker) + args) for iWorker in xrange(self.nProcesses)]
+        for proc in runningProcesses:
+            proc.start()
+        rota = [None for iWorker in xrange(self.nProcesses)]
+        unfinished = []
+        while True:
+            # get process alive/dead
+            time.sleep(1)
+            alive = [proc.is_alive() for proc in runningProcesses]
+            # read latest updates from queue, update rota
+            try:
+                while True:
+                    status, iWorker, iTask = worker_status_queue.get(True, 0.1)
+                    if status == "start":
+                        rota[iWorker] = iTask
+                    elif status == "finish":
+                        rota[iWorker] = None
+                    elif status == "empty":
+                        rota[iWorker] = "empty"
+            except Queue.Empty:
+                pass
+            # if worker is dead but didn't finish task, issue warning
+            for al, r in zip(alive, rota):
+                if (not al) and (r != "empty"):
+                    text = GetRAMErrorText()
+                    files.FileHandler.LogFailAndExit(text)
+                    unfinished.append(r)
+            if not any(alive):
+                break
+            
+        if len(unfinished) != 0:
+            files.FileHandler.LogFailAndExit()
+#            print("WARNING: Computer ran out of RAM and killed OrthoFinder processes")
+#            print("OrthoFinder will attempt to run these processes once more. If it is")
+#            print("unsuccessful again then it will have to exit. Consider using")
+#            print("the option '-a 1' or running on a machine with more RAM")
+     
+            
+    def GetOGMembersPerSpecies(self, ogs):
+        """
+        Returns for each species the (iOG, position in OG, iSeq) arrays of its genes in the orthogroups, ordered by iOG
+        """
+        members = [([], [], []) for _ in self.ogSet.seqsInfo.speciesToUse]
+        iiSpDict = {iSp:iiSp for iiSp, iSp in enumerate(self.ogSet.seqsInfo.speciesToUse)}
+        for iog, og in enumerate(ogs):
+            for i, g in enumerate(og):
+                og_sp, pos_sp, seq_sp = members[iiSpDict[g.iSp]]
+                og_sp.append(iog)
+                pos_sp.append(i)
+                seq_sp.append(g.iSeq)
+        return [tuple(np.array(x, dtype=np.int64) for x in m) for m in members]
                    
     def CompleteOGMatrices(self, ogs, ogMatrices):
         newMatrices = []
-        for iog, (og, m) in enumerate(zip(ogs, ogMatrices)):
-            # dendroblast scores
-            n = m.shape[0]
-            m2 = np.zeros(m.shape)
-            max_og = -9e99
-            for i in xrange(n):
-                for j in xrange(i):
-                    m2[i, j] = -np.log(m[i,j] + m[j,i])  
-                    m2[j, i] = m2[i, j]  
-                    max_og = max(max_og, m2[i,j])
-            newMatrices.append(m2)
+        with np.errstate(divide='ignore'):
+            for iog, (og, m) in enumerate(zip(ogs, ogMatrices)):
+                # dendroblast scores
+                m2 = -np.log(m + m.T)
+                np.fill_diagonal(m2, 0.)
+                newMatrices.append(m2)
         return newMatrices
         
     def CompleteAndWriteOGMatrices(self, ogs, ogMatrices):
         """
-        ogMatrices - each matrix is a list of mp.Array  (so that each represents an nSeq x nSeq matrix
+        ogMatrices - each matrix is a nSeq x nSeq numpy array, a view into the shared array of all the matrices. The
+        matrices are updated in place, the diagonal is left unchanged
         """
-        for iog, (og, m) in enumerate(zip(ogs, ogMatrices)):
-            # dendroblast scores
-            n = len(m)
-            max_og = -9e99
-            # Careful not to over-write a value and then attempt to try to use the old value
-            for i in xrange(n):
-                for j in xrange(i):
-                    m[i][j] = -np.log(m[i][j] + m[j][i])  
-                    m[j][i] = m[i][j]  
-                    max_og = max(max_og, m[i][j])
-            self.WritePhylipMatrix(m, [g.ToString() for g in og], files.FileHandler.GetOGsDistMatFN(iog), max_og)
+        with np.errstate(divide='ignore'):
+            for iog, (og, m) in enumerate(zip(ogs, ogMatrices)):
+                # dendroblast scores
+                n = len(m)
+                diag = m.diagonal().copy()
+                m[:] = -np.log(m + m.T)
+                m[np.diag_indices(n)] = diag
+                max_og = max(-9e99, m[np.tril_indices(n, -1)].max()) if n > 1 else -9e99
+                stag.WritePhylipMatrix(m, [g.ToString() for g in og], files.FileHandler.GetOGsDistMatFN(iog), 1.1*max_og, qAllowZero=True)
         return ogMatrices
     
-    @staticmethod
-    def WritePhylipMatrix(m, names, outFN, max_og):
-        """
-        m - list of mp.Array  (so that each represents an nSeq x nSeq matrix
-        """
-        max_og = 1.1*max_og
-        sliver = 1e-6
-        with open(outFN, 'wb') as outfile:
-            n = len(m)
-            outfile.write("%d\n" % n)
-            for i in xrange(n):
-                outfile.write(names[i] + " ")
-                # values could be -inf, these are the most distantly related so replace with max_og
-                V = [0. + (m[i][j] if m[i][j] > -9e99 else max_og) for j in range(n)] # "0. +": hack to avoid printing out "-0"
-                V = [sliver if 0 < v < sliver  else v for v in V]  # make sure scientific notation is not used (not accepted by fastme)
-                values = " ".join(["%.6f" % v for v in V])   
-                outfile.write(values + "\n")
-    
     def SpeciesTreeDistances(self, ogs, ogMatrices, method = 0):
         """
-        ogMatrices - each matrix is a list of mp.Array  (so that each represents an nSeq x nSeq matrix
+        ogMatrices - each matrix is a nSeq x nSeq numpy array
         """
         spPairs = list(itertools.combinations(self.ogSet.seqsInfo.speciesToUse, 2))
         D = [[] for _ in spPairs]
@@ -393,8 +492,7 @@ class DendroBLASTTrees(object):
                 for i, g in enumerate(og):
                     spDict[g.iSp].append(i)
                 for (sp1, sp2), d_list in zip(spPairs, D):
-                    distances = [m[i][j] for i in spDict[sp1] for j in spDict[sp2]]
-                    if len(distances) > 0: d_list.append(min(distances))
+                    if len(spDict[sp1]) > 0 and len(spDict[sp2]) > 0: d_list.append(m[np.ix_(spDict[sp1], spDict[sp2])].min())
 #                    d_list.append(min(distances) if len(distances) > 0 else None)
         return D, spPairs
     
@@ -408,15 +506,7 @@ class DendroBLASTTrees(object):
             M[sp1, sp2] = x
             M[sp2, sp1] = x
         speciesMatrixFN = files.FileHandler.GetSpeciesTreeMatrixFN(qPutInWorkingDir)  
-        sliver = 1e-6
-        with open(speciesMatrixFN, 'wb') as outfile:
-            outfile.write("%d\n" % n)
-            for i in xrange(n):
-                outfile.write(str(self.ogSet.seqsInfo.speciesToUse[i]) + " ")
-                V = [(0. + M[i,j]) for j in range(n)]  # hack to avoid printing out "-0"
-                V = [sliver if 0 < v < sliver else v for v in V]  # make sure scientific notation is not used (not accepted by fastme)
-                values = " ".join(["%.6f" % v for v in V])   
-                outfile.write(values + "\n")       
+        stag.WritePhylipMatrix(M, map(str, self.ogSet.seqsInfo.speciesToUse), speciesMatrixFN, qAllowZero=True)
         treeFN = files.FileHandler.GetSpeciesTreeUnrootedFN()
         cmd = " ".join(["fastme", "-i", speciesMatrixFN, "-o", treeFN, "-N", "-w", "O"] + (["-s"] if n < 1000 else []))
         return cmd, treeFN
@@ -457,14 +547,16 @@ class DendroBLASTTrees(object):
                 cmds_trees = [[cmd_spTree]] + cmds_trees
         util.PrintUnderline("Inferring gene and species trees" if qSpeciesTree else "Inferring gene trees")
         util.RunParallelOrderedCommandLists(self.nProcesses, cmds_trees)
+        tree_cache.GetTreeCache(files.FileHandler.GetOGsTreeDir()).Update(self.nProcesses)
         if qSTAG:
             # Trees must have been completed
             print("")
             spTreeFN_ids = files.FileHandler.GetSpeciesTreeUnrootedFN()
-            stag.Run_ForOrthoFinder(files.FileHandler.GetOGsTreeDir(), files.FileHandler.GetWorkingDirectory_Write(), self.ogSet.seqsInfo.speciesToUse, spTreeFN_ids)
+            stag.Run_ForOrthoFinder(files.FileHandler.GetOGsTreeDir(), files.FileHandler.GetWorkingDirectory_Write(), self.ogSet.seqsInfo.speciesToUse, spTreeFN_ids, qBIONJ=self.qSTAG_BIONJ)
         seqDict = self.ogSet.Spec_SeqDict()
-        for iog in xrange(len(self.ogSet.OGs())):
-            util.RenameTreeTaxa(files.FileHandler.GetOGsTreeFN(iog), files.FileHandler.GetOGsTreeFN(iog, True), seqDict, qSupport=False, qFixNegatives=True)
+        nOGs = len(self.ogSet.OGs())
+        with files.FileHandler.OGFileWriter(files.FileHandler.GetOGsTreeDir(True)) as writer:
+            util.RunExportParallel_Write(util.RenameTreeTaxa_Text, [(files.FileHandler.GetOGsTreeFN(iog), seqDict, False, True) for iog in xrange(nOGs)], [os.path.basename(files.FileHandler.GetOGsTreeFN(iog, True)) for iog in xrange(nOGs)], writer, self.nProcesses)
         if qSpeciesTree:
             util.RenameTreeTaxa(spTreeFN_ids, files.FileHandler.GetSpeciesTreeUnrootedFN(True), self.ogSet.SpeciesDict(), qSupport=False, qFixNegatives=True)        
             return spTreeFN_ids, qSTAG
@@ -656,7 +748,7 @@ def GetResultsFilesString(rootedSpeciesTreeFN, seqs_alignments_dirs=None, qHaveO
     if seqs_alignments_dirs != None:
         st += "\nSequences for orthogroups:\n   %s\n" % seqs_alignments_dirs[0]
         st += "\nMultiple sequence alignments:\n   %s\n" % seqs_alignments_dirs[1]
-    st += "\nGene trees:\n   %s\n" % (files.FileHandler.GetOGsTreeDir(True))
+    st += "\nGene trees:\n   %s\n" % (files.FileHandler.OGFilesLocation(files.FileHandler.GetOGsTreeDir(True)))
     if len(rootedSpeciesTreeFN) == 1:
         st += "\nRooted species tree:\n   %s\n" % rootedSpeciesTreeFN[0]
         if qHaveOrthologues: st += "\nSpecies-by-species orthologues directory:\n   %s\n" % (files.FileHandler.GetOrthologuesDirectory())
@@ -729,7 +821,7 @@ def WriteOrthologuesStats(ogSet, nOrtho_sp):
                 og = pat % i
                 writer.writerow([og, ogCount[og], ogCount_50[og]])
 
-def TwoAndThreeGeneOrthogroups(ogSet, resultsDir):
+def TwoAndThreeGeneOrthogroups(ogSet, resultsDir, store=None):
     speciesDict = ogSet.SpeciesDict()
     sequenceDict = ogSet.SequenceDict()
     ogs = ogSet.OGs(qInclAll=True)
@@ -777,17 +869,19 @@ def TwoAndThreeGeneOrthogroups(ogSet, resultsDir):
         elif n >= 4:
             continue
         all_orthologues.append((iog, orthologues))
-    nOrthologues_SpPair += trees2ologs_of.AppendOrthologuesToFiles(all_orthologues, speciesDict, ogSet.speciesToUse, sequenceDict, resultsDir, False)
+    nOrthologues_SpPair += trees2ologs_of.AppendOrthologuesToFiles(all_orthologues, speciesDict, ogSet.speciesToUse, sequenceDict, resultsDir, False, store=store)
     return nOrthologues_SpPair
     
-def ReconciliationAndOrthologues(recon_method, ogSet, nParallel, iSpeciesTree=None, all_stride_dup_genes=None):
+def ReconciliationAndOrthologues(recon_method, ogSet, nParallel, iSpeciesTree=None, all_stride_dup_genes=None, qOrthologueStore=False):
     """
     ogSet - info about the orthogroups, species etc
     resultsDir - where the Orthologues top level results directory will go (should exist already)
     reconTreesRenamedDir - where to put the reconcilled trees that use the gene accessions
     iSpeciesTree - which of the potential roots of the species tree is this
     method - can be dlcpar, dlcpar_deep, of_recon
+    qOrthologueStore - also write all the orthologues to a single binary file, see orthologue_store
     """
+    store = orthologue_store.OrthologueStoreWriter() if qOrthologueStore else None
     speciesTree_ids_fn = files.FileHandler.GetSpeciesTreeIDsRootedFN()
     labeled_tree_fn = files.FileHandler.GetSpeciesTreeResultsNodeLabelsFN()
     util.RenameTreeTaxa(speciesTree_ids_fn, labeled_tree_fn, ogSet.SpeciesDict(), qSupport=False, qFixNegatives=True, label='N')
@@ -800,29 +894,32 @@ def ReconciliationAndOrthologues(recon_method, ogSet, nParallel, iSpeciesTree=No
         dlcparResultsDir, dlcparLocusTreePat = trees2ologs_dlcpar.RunDlcpar(ogSet, speciesTree_ids_fn, workingDir, nParallel, qDeepSearch)
         util.PrintTime("Done DLCpar")
         spec_seq_dict = ogSet.Spec_SeqDict()
-        for iog in xrange(len(ogSet.OGs())):
-            util.RenameTreeTaxa(dlcparResultsDir + dlcparLocusTreePat % iog, files.FileHandler.GetOGsReconTreeFN(iog), spec_seq_dict, qSupport=False, qFixNegatives=False, inFormat=8, label='n')
+        with files.FileHandler.OGFileWriter(reconTreesRenamedDir) as writer:
+            for iog in xrange(len(ogSet.OGs())):
+                text = util.RenameTreeTaxa_Text(dlcparResultsDir + dlcparLocusTreePat % iog, spec_seq_dict, qSupport=False, qFixNegatives=False, inFormat=8, label='n')
+                if text != None: writer.Write(os.path.basename(files.FileHandler.GetOGsReconTreeFN(iog)), text)
     
         # Orthologue lists
         util.PrintUnderline("Inferring orthologues from gene trees" + (" (root %d)"%iSpeciesTree if iSpeciesTree != None else ""))
         pickleDir = files.FileHandler.GetPickleDir()
-        nOrthologues_SpPair = trees2ologs_dlcpar.create_orthologue_lists(ogSet, resultsDir_ologs, dlcparResultsDir, pickleDir)  
+        nOrthologues_SpPair = trees2ologs_dlcpar.create_orthologue_lists(ogSet, resultsDir_ologs, dlcparResultsDir, pickleDir, store)  
 
     elif "phyldog" == recon_method:
         util.PrintTime("Starting Orthologues from Phyldog")
-        nOrthologues_SpPair = trees2ologs_of.DoOrthologuesForOrthoFinder_Phyldog(ogSet, workingDir, trees2ologs_of.GeneToSpecies_dash, resultsDir_ologs, reconTreesRenamedDir)
+        nOrthologues_SpPair = trees2ologs_of.DoOrthologuesForOrthoFinder_Phyldog(ogSet, workingDir, trees2ologs_of.GeneToSpecies_dash, resultsDir_ologs, reconTreesRenamedDir, store, trees2ologs_of.BufferedFilesLimits())
         util.PrintTime("Done Orthologues from Phyldog")
     else:
         util.PrintTime("Starting OF Orthologues")
         qNoRecon = ("only_overlap" == recon_method)
-        nOrthologues_SpPair = trees2ologs_of.DoOrthologuesForOrthoFinder(ogSet, speciesTree_ids_fn, trees2ologs_of.GeneToSpecies_dash, all_stride_dup_genes, qNoRecon)
+        nOrthologues_SpPair = trees2ologs_of.DoOrthologuesForOrthoFinder(ogSet, speciesTree_ids_fn, trees2ologs_of.GeneToSpecies_dash, all_stride_dup_genes, qNoRecon, nParallel, store, trees2ologs_of.BufferedFilesLimits())
         util.PrintTime("Done OF Orthologues")
-    nOrthologues_SpPair += TwoAndThreeGeneOrthogroups(ogSet, resultsDir_ologs)
+    nOrthologues_SpPair += TwoAndThreeGeneOrthogroups(ogSet, resultsDir_ologs, store)
+    if store != None: store.Write(files.FileHandler.GetOrthologueStoreFN(), ogSet)
     WriteOrthologuesStats(ogSet, nOrthologues_SpPair)
 #    print("Identified %d orthologues" % nOrthologues)
         
                 
-def OrthologuesFromTrees(recon_method, nHighParallel, userSpeciesTree_fn, qAddSpeciesToIDs):
+def OrthologuesFromTrees(recon_method, nHighParallel, userSpeciesTree_fn, qAddSpeciesToIDs, qOrthologueStore=False):
     """
     userSpeciesTree_fn - None if not supplied otherwise rooted tree using user species names (not orthofinder IDs)
     qUserSpTree - is the speciesTree_fn user-supplied
@@ -839,7 +936,7 @@ def OrthologuesFromTrees(recon_method, nHighParallel, userSpeciesTree_fn, qAddSp
         ConvertUserSpeciesTree(userSpeciesTree_fn, speciesDict, speciesTreeFN_ids)
     util.PrintUnderline("Running Orthologue Prediction", True)
     util.PrintUnderline("Reconciling gene and species trees") 
-    ReconciliationAndOrthologues(recon_method, ogSet, nHighParallel)
+    ReconciliationAndOrthologues(recon_method, ogSet, nHighParallel, qOrthologueStore=qOrthologueStore)
     util.PrintUnderline("Writing results files")
     util.PrintTime("Writing results files")
     files.FileHandler.CleanWorkingDir2()
@@ -860,7 +957,9 @@ def OrthologuesWorkflow(speciesToUse, nSpAll,
                        qStopAfterTrees = False, 
                        qMSA = False,
                        qPhyldog = False,
-                       results_name = ""):
+                       results_name = "",
+                       qOrthologueStore = False,
+                       qSTAG_BIONJ = False):
     """
     1. Setup:
         - ogSet, directories
@@ -905,6 +1004,8 @@ def OrthologuesWorkflow(speciesToUse, nSpAll,
         util.PrintTime("Starting MSA/Trees")
         seqs_alignments_dirs = treeGen.DoTrees(ogSet.OGs(qInclAll=True), ogSet.OrthogroupMatrix(), ogSet.Spec_SeqDict(), ogSet.SpeciesDict(), ogSet.speciesToUse, nHighParallel, qStopAfterSeqs, qStopAfterAlign or qPhyldog, qDoSpeciesTree=qDoMSASpeciesTree) 
         util.PrintTime("Done MSA/Trees")
+        if not (qStopAfterSeqs or qStopAfterAlign or qPhyldog):
+            tree_cache.GetTreeCache(files.FileHandler.GetOGsTreeDir()).Update(nHighParallel)
         if qDoMSASpeciesTree:
             spTreeFN_ids = files.FileHandler.GetSpeciesTreeUnrootedFN()
         if qStopAfterSeqs:
@@ -928,7 +1029,7 @@ def OrthologuesWorkflow(speciesToUse, nSpAll,
             util.PrintTime("Starting phyldog")
             species_tree_ids_labelled_phyldog = wrapper_phyldog.RunPhyldogAnalysis(files.FileHandler.GetPhyldogWorkingDirectory(), ogSet.OGs(), speciesToUse, nHighParallel)
     else:
-        db = DendroBLASTTrees(ogSet, nLowParrallel, qDoubleBlast)
+        db = DendroBLASTTrees(ogSet, nLowParrallel, qDoubleBlast, qSTAG_BIONJ)
         spTreeFN_ids, qSTAG = db.RunAnalysis(userSpeciesTree == None)
         if userSpeciesTree != None:
             spTreeFN_ids = files.FileHandler.GetSpeciesTreeUnrootedFN()
@@ -1003,7 +1104,7 @@ def OrthologuesWorkflow(speciesToUse, nSpAll,
             if qMSA:
                 st += "\nSequences for orthogroups:\n   %s\n" % seqs_alignments_dirs[0]
                 st += "\nMultiple sequence alignments:\n   %s\n" % seqs_alignments_dirs[1]
-            st += "\nGene trees:\n   %s\n" % (files.FileHandler.GetResultsTreesDir())
+            st += "\nGene trees:\n   %s\n" % (files.FileHandler.OGFilesLocation(files.FileHandler.GetResultsTreesDir()))
             return st
         # otherwise, root species tree
         resultsSpeciesTrees = []
@@ -1026,7 +1127,7 @@ def OrthologuesWorkflow(speciesToUse, nSpAll,
         print("Outgroup: " + (", ".join([spDict[s] for s in r])))
     util.RenameTreeTaxa(speciesTree_fn, resultsSpeciesTrees[-1], db.ogSet.SpeciesDict(), qSupport=qSpeciesTreeSupports, qFixNegatives=True)
     util.PrintTime("Starting Recon and orthologues")
-    ReconciliationAndOrthologues(recon_method, db.ogSet, nHighParallel, i if qMultiple else None, all_stride_dup_genes=all_stride_dup_genes) 
+    ReconciliationAndOrthologues(recon_method, db.ogSet, nHighParallel, i if qMultiple else None, all_stride_dup_genes=all_stride_dup_genes, qOrthologueStore=qOrthologueStore) 
     util.PrintTime("Done Recon")
     
     if qMultiple:
@@ -328,27 +328,18 @@ def resolve(n, M):
     return n.get_tree_root()
 
 def SpeciesOverlapDuplications(tree, GeneToSpecies):
-    import numpy as np
     import itertools
-    species = list(set(map(GeneToSpecies, tree.get_leaf_names())))
-    genes = tree.get_leaf_names()
-    gDict = {gene:i for i,gene in enumerate(genes)}
-    sDict = {sp:i for i,sp in enumerate(species)}
+    mask = om1.LeafIndex(tree, GeneToSpecies).mask
     for n in tree.traverse('postorder'):
         if n.is_leaf(): continue
         ch = n.get_children()
         if len(ch) == 2:
-            l0 = ch[0].get_leaf_names()
-            l1 = ch[1].get_leaf_names()
-            s0 = {GeneToSpecies(l) for l in l0}
-            s1 = {GeneToSpecies(l) for l in l1}
-            if s0&s1:
+            if mask[ch[0]] & mask[ch[1]]:
                 n.name = "D"
             else:
                 n.name = "S"
         elif len(ch) > 2:
-            sp = [{GeneToSpecies(l) for l in c.get_leaf_names()} for c in ch]
-            if any(sp0&sp1 for sp0, sp1 in itertools.combinations(sp, 2)):
+            if any(mask[ch0] & mask[ch1] for ch0, ch1 in itertools.combinations(ch, 2)):
                 n.name = "D"
             else:
                 n.name = "S"
@@ -356,42 +347,21 @@ def SpeciesOverlapDuplications(tree, GeneToSpecies):
 def NumberOfOrthologues(tree, GeneToSpecies):
     import numpy as np
     import itertools
-    species = list(set(map(GeneToSpecies, tree.get_leaf_names())))
-    genes = tree.get_leaf_names()
-    gDict = {gene:i for i,gene in enumerate(genes)}
-    sDict = {sp:i for i,sp in enumerate(species)}
-    orthologues = np.zeros((len(genes), len(species)))
+    leafIndex = om1.LeafIndex(tree, GeneToSpecies)
+    mask = leafIndex.mask
+    nSpecies = len(leafIndex.species)
+    orthologues = np.zeros((len(leafIndex.leaves), nSpecies))    # gene x species (the bits of the species masks)
     nOrtho = 0
     for n in tree.traverse('postorder'):
         if n.is_leaf(): continue
         ch = n.get_children()        
-        if len(ch) == 2: 
-            l0 = ch[0].get_leaf_names()
-            l1 = ch[1].get_leaf_names()
-            s0 = {GeneToSpecies(l) for l in l0}
-            s1 = {GeneToSpecies(l) for l in l1}
-            if s0&s1: continue
-            nOrtho += len(l0)*len(l1)
-            for g0 in l0:
-                for s in s1:
-                    orthologues[gDict[g0], sDict[s]] = 1
-            for g1 in l1:
-                for s in s0:
-                    orthologues[gDict[g1], sDict[s]] = 1
-        elif len(ch) > 2:
-            for ch0, ch1 in itertools.combinations(ch, 2):
-                l0 = ch0.get_leaf_names()
-                l1 = ch1.get_leaf_names()
-                s0 = {GeneToSpecies(l) for l in l0}
-                s1 = {GeneToSpecies(l) for l in l1}
-                if s0&s1: continue
-                nOrtho += len(l0)*len(l1)
-                for g0 in l0:
-                    for s in s1:
-                        orthologues[gDict[g0], sDict[s]] = 1
-                for g1 in l1:
-                    for s in s0:
-                        orthologues[gDict[g1], sDict[s]] = 1
+        for ch0, ch1 in itertools.combinations(ch, 2):
+            if mask[ch0] & mask[ch1]: continue
+            start0, end0 = leafIndex.range[ch0]
+            start1, end1 = leafIndex.range[ch1]
+            nOrtho += (end0-start0)*(end1-start1)
+            orthologues[start0:end0, [i for i in xrange(nSpecies) if (mask[ch1] >> i) & 1]] = 1
+            orthologues[start1:end1, [i for i in xrange(nSpecies) if (mask[ch0] >> i) & 1]] = 1
                 
 #    print(nOrtho)
 #    N = (len(species)-1)*len(genes)
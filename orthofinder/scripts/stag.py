@@ -30,7 +30,7 @@ import subprocess
 import numpy as np
 from itertools import combinations
 
-import tree, newick
+import tree, newick, tree_cache
 import consensus_tree as cons
         
 def CanRunCommand(command, qAllowStderr = False, qPrint = True):
@@ -62,21 +62,32 @@ def CheckFastME(workingDir):
     fastme_stat_fn = workingDir + "SimpleTest.phy_fastme_stat.txt"
     if os.path.exists(fastme_stat_fn): os.remove(fastme_stat_fn)
 
-def WritePhylipMatrix(m, names, outFN, max_og=1e6):
+def PhylipMatrixValues(m, max_og=1e6, qAllowZero=False):
+    """ The values of m as they are written by WritePhylipMatrix, before rounding """
+    sliver = 1e-6
+    with np.errstate(invalid='ignore'):
+        M = np.asarray(m, dtype=np.float64)
+        M = 0. + np.where(M > -9e99, M, max_og)     # "0. +": avoid printing out "-0"
+        if qAllowZero:
+            M[(0. < M) & (M < sliver)] = sliver
+        else:
+            M[M < sliver] = sliver
+    return M
+
+def WritePhylipMatrix(m, names, outFN, max_og=1e6, qAllowZero=False):
     """
-    m - list of mp.Array  (so that each represents an nSeq x nSeq matrix
+    m - nSeq x nSeq matrix, a numpy array or a list of rows
+    Values of -inf are the most distantly related so are replaced with max_og. Values below the sliver are raised to it
+    so that they are not written as zero, or only the positive ones with qAllowZero. Values are written with "%.6f", 
+    scientific notation is not accepted by fastme.
     """
-    sliver = 1e-6
+    M = PhylipMatrixValues(m, max_og, qAllowZero)
+    n = len(M)
+    rowFormat = "%s " + " ".join(["%.6f"] * n) + "\n"
     with open(outFN, 'wb') as outfile:
-        n = len(m)
         outfile.write("%d\n" % n)
-        for i in xrange(n):
-            outfile.write(names[i] + " ")
-            # values could be -inf, these are the most distantly related so replace with max_og
-            V = [0. + (m[i][j] if m[i][j] > -9e99 else max_og) for j in range(n)] # "0. +": hack to avoid printing out "-0"
-            V = [sliver if v < sliver  else v for v in V]  # make sure scientific notation is not used (not accepted by fastme)
-            values = " ".join(["%.6f" % v for v in V])   
-            outfile.write(values + "\n")
+        for name, row in zip(names, M.tolist()):
+            outfile.write(rowFormat % ((name,) + tuple(row)))
 
 class UnrecognisedGene(Exception):
     pass
@@ -154,29 +165,99 @@ def CreateNewWorkingDirectory(baseDirectoryName):
     return newDirectoryName
 
 def GetDistances_fast(t, nSp, g_to_i):
+    """ The species distance matrix for tree t, the minimum distance between genes from each pair of species """
+    nodes = list(t.traverse('preorder'))
+    index = {id(n):i for i, n in enumerate(nodes)}
+    parents = [-1] + [index[id(n.up)] for n in nodes[1:]]
+    dists = [n.dist for n in nodes]
+    species = [g_to_i[n.name] if n.is_leaf() else -1 for n in nodes]
+    return GetDistances_arrays(parents, dists, species, nSp)
+
+def GetDistances_arrays(parents, dists, species, nSp):
+    """
+    The species distance matrix for a tree given as arrays, see GetDistances_fast
+    Args:
+        parents - for each node in preorder the index of its parent, -1 for the root
+        dists - the branch length of each node, negative lengths are taken as zero
+        species - the species index of each leaf, -1 for internal nodes
+        nSp - number of species
+    Each node has the minimum distance from the top of its branch to each species below it, as an array of species
+    indices and an array of distances. For each pair of children of a node the distances between their species are 
+    the outer sum of their distance arrays.
+    """
     D = np.ones((nSp, nSp)) * 9e99
-    for n in t.traverse('postorder'):
-        if n.is_leaf():
-            n.add_feature('d', {g_to_i[n.name]:max(0.0, n.dist)})
-        else:
-            children = n.get_children()
-            for ch0, ch1 in combinations(children,2):
-                for sp0,dist0 in ch0.d.items():
-                    for sp1,dist1 in ch1.d.items():
-                        if sp0==sp1: continue
-                        i = sp0 if sp0<sp1 else sp1
-                        j = sp1 if sp0<sp1 else sp0
-                        D[i,j] = min(D[i,j], dist0+dist1)
-                spp = {k for ch in children for k in ch.d.keys()}
-                d = {k:(min([ch.d[k] for ch in children if k in ch.d])+max(0.0, n.dist)) for k in spp}
-                n.add_feature('d', d)
-    for i in xrange(nSp):
-        for j in xrange(i):
-            D[i,j] = D[j, i]
-        D[i,i]=0.
+    dists = np.maximum(0.0, np.asarray(dists, dtype=np.float64))
+    children = [[] for _ in parents]
+    for i in xrange(1, len(parents)):
+        children[parents[i]].append(i)
+    spDists = dict()    # node -> (species, distances), for the nodes whose parent hasn't been processed yet
+    scratch = np.empty(nSp)
+    for i in xrange(len(parents)-1, -1, -1):
+        if len(children[i]) == 0:
+            spDists[i] = (np.array([species[i]]), dists[i:i+1])
+            continue
+        ch = [spDists.pop(j) for j in children[i]]
+        for (sp0, d0), (sp1, d1) in combinations(ch, 2):
+            rows = sp0[:,None]
+            D[rows, sp1] = np.minimum(D[rows, sp1], d0[:,None] + d1)
+        sp = np.concatenate([c[0] for c in ch])
+        d = np.concatenate([c[1] for c in ch])
+        scratch[sp] = np.inf
+        np.minimum.at(scratch, sp, d)
+        sp = np.unique(sp)
+        spDists[i] = (sp, scratch[sp] + dists[i])
+    D = np.minimum(D, D.T)
+    D[np.diag_indices(nSp)] = 0.
     return D
 
-def ProcessTrees(dir_in, dir_matrices, dir_trees_out, GeneToSpecies, qVerbose=True, qSkipSingleCopy=False, qForOF=False):
+def NeighbourJoining(D, names, qBIONJ=True):
+    """
+    The BIONJ tree (Gascuel, 1997) for the distance matrix D, or the NJ tree if not qBIONJ, as an unrooted tree with
+    its leaves named by names. These are the trees of "fastme -m I -w n" and "fastme -m N -w n" respectively.
+    """
+    D = np.array(D, dtype=np.float64)
+    V = D.copy()    # BIONJ's estimates of the variances of the distances
+    nodes = [tree.TreeNode(name=name) for name in names]
+    while len(nodes) > 3:
+        r = len(nodes)
+        S = D.sum(1)
+        Q = (r-2)*D - S[:,None] - S[None,:]
+        Q[np.triu_indices(r)] = np.inf
+        # as FastME: the first pair within 1e-6 of the minimum, the new node replaces the later of the two
+        i, j = divmod(int(np.flatnonzero(Q < Q.min() + 1e-6)[0]), r)
+        di = 0.5*D[i,j] + (S[i] - S[j]) / (2.*(r-2))
+        dj = D[i,j] - di
+        lam = 0.5
+        if qBIONJ and V[i,j] > 0.:
+            lam = min(1., max(0., 0.5 + (V[j].sum() - V[i].sum()) / (2.*(r-2)*V[i,j])))
+        d_new = lam*(D[i] - di) + (1.-lam)*(D[j] - dj)
+        v_new = lam*V[i] + (1.-lam)*V[j] - lam*(1.-lam)*V[i,j]
+        node = tree.TreeNode()
+        node.add_child(nodes[i], dist=di)
+        node.add_child(nodes[j], dist=dj)
+        for M, new in ((D, d_new), (V, v_new)):
+            M[i,:] = new
+            M[:,i] = new
+            M[i,i] = 0.
+        D = np.delete(np.delete(D, j, 0), j, 1)
+        V = np.delete(np.delete(V, j, 0), j, 1)
+        nodes[i] = node
+        del nodes[j]
+    root = tree.TreeNode()
+    if len(nodes) == 3:
+        for i, j, k in ((0, 1, 2), (1, 0, 2), (2, 0, 1)):
+            root.add_child(nodes[i], dist=0.5*(D[i,j] + D[i,k] - D[j,k]))
+    else:
+        for n in nodes:
+            root.add_child(n, dist=0.5*D[0,-1])
+    return root
+
+def ProcessTrees(dir_in, dir_matrices, dir_trees_out, GeneToSpecies, qVerbose=True, qSkipSingleCopy=False, qForOF=False, qBIONJ=False):
+    """
+    Infer a species tree from each gene tree that has all species present. These are written to dir_trees_out by 
+    fastme, or with qBIONJ they are built by NeighbourJoining and returned instead, no files are written.
+    """
+    trees = [] if qBIONJ else None
     nSp = GeneToSpecies.NumberOfSpecies()
     s_to_i = GeneToSpecies.SpeciesToIndexDict()
     nSuccess = 0
@@ -185,7 +266,7 @@ def ProcessTrees(dir_in, dir_matrices, dir_trees_out, GeneToSpecies, qVerbose=Tr
     if qVerbose: print("\nProcessing gene trees:")
     for fn in glob.glob(dir_in + "/*"):
         try:
-            t = tree.Tree(fn)
+            t = tree_cache.ReadTree(fn)
         except newick.NewickError:
             print(os.path.split(fn)[1] + " - WARNING: ETE could not interpret tree file, it will be ignored")
             nFail += 1
@@ -204,15 +285,25 @@ def ProcessTrees(dir_in, dir_matrices, dir_trees_out, GeneToSpecies, qVerbose=Tr
             continue
         if qSkipSingleCopy and nThis == len(genes):
             # Single copy - don't recalculate the tree
-            treeOutFN = dir_trees_out + os.path.split(fn)[1] + ".tre"
             for n in t:
                 n.name = s_to_i[GeneToSpecies.ToSpecies(n.name)]
-            t.write(outfile = treeOutFN, format=5)
+            if qBIONJ:
+                for n in t:
+                    n.name = str(n.name)
+                trees.append(t)
+            else:
+                t.write(outfile = dir_trees_out + os.path.split(fn)[1] + ".tre", format=5)
             if qVerbose: print(os.path.split(fn)[1] + " - Processed")
             continue
         g_to_i = {g:s_to_i[s] for g,s in zip(genes, species)}
         D = GetDistances_fast(t, nSp, g_to_i)
         species_names_fastme = map(str,xrange(nSp))
+        if qBIONJ:
+            # from the distances fastme would have read
+            trees.append(NeighbourJoining(np.round(PhylipMatrixValues(D, max_og=1e6), 6), species_names_fastme))
+            nSuccess += 1
+            if qVerbose: print(os.path.split(fn)[1] + " - Processed")
+            continue
         matrixFN = dir_matrices + os.path.split(fn)[1] + ".dist.phylip"
         treeOutFN = dir_trees_out + os.path.split(fn)[1] + ".tre"
         WritePhylipMatrix(D, species_names_fastme, matrixFN, max_og=1e6)
@@ -227,6 +318,7 @@ def ProcessTrees(dir_in, dir_matrices, dir_trees_out, GeneToSpecies, qVerbose=Tr
         if qVerbose: print(os.path.split(fn)[1] + " - Processed")
     if qVerbose: print("\nExamined %d trees" % (nSuccess + nNotAllPresent + nFail))
     print("%d trees had all species present and will be used by STAG to infer the species tree\n" % nSuccess)
+    return trees
       
 def Astral(tree_dir, astral_jar_file, qForOF=False):
     treesFN = tree_dir + "../TreesFile.txt"
@@ -244,6 +336,7 @@ def Astral(tree_dir, astral_jar_file, qForOF=False):
     return tree.Tree(speciesTreeFN)     
       
 def InferSpeciesTree(tree_dir, species, outputFN, astral_jar=None):
+    """ tree_dir - directory of the species trees for the gene trees, or a list of the trees """
     if astral_jar == None:
         t = cons.ConsensusTree(tree_dir)
     else:
@@ -252,12 +345,16 @@ def InferSpeciesTree(tree_dir, species, outputFN, astral_jar=None):
         n.name = species[int(n.name)]
     t.write(outfile=outputFN)
 
-def Run_ForOrthoFinder(dir_in, d_working, speciesToUse, speciesTreeIds_FN_out):
+def Run_ForOrthoFinder(dir_in, d_working, speciesToUse, speciesTreeIds_FN_out, qBIONJ=False):
+    gene_to_species = GeneToSpecies_OrthoFinder(speciesToUse)
+    if qBIONJ:
+        trees = ProcessTrees(dir_in, None, None, gene_to_species, qVerbose=False, qForOF=True, qBIONJ=True)
+        InferSpeciesTree(trees, gene_to_species.species, speciesTreeIds_FN_out)
+        return
     dir_matrices = d_working + "Distances_SpeciesTree/"
     os.mkdir(dir_matrices)
     dir_trees_out = d_working + "SpeciesTrees_ids/"
     os.mkdir(dir_trees_out)
-    gene_to_species = GeneToSpecies_OrthoFinder(speciesToUse)
     ProcessTrees(dir_in, dir_matrices, dir_trees_out, gene_to_species, qVerbose=False, qForOF=True)
     InferSpeciesTree(dir_trees_out, gene_to_species.species, speciesTreeIds_FN_out)
     
@@ -266,13 +363,18 @@ def main(args):
     astral_jar = None
     gene_to_species = GeneToSpecies(args.species_map)
     dir_out = CreateNewWorkingDirectory(dir_in + "/../STAG_Results")
+    outputFN = dir_out + "SpeciesTree.tre"
+    if args.bionj:
+        trees = ProcessTrees(dir_in, None, None, gene_to_species, qVerbose=(not args.quiet), qBIONJ=True)
+        InferSpeciesTree(trees, gene_to_species.species, outputFN)
+        print("STAG species tree: " + os.path.abspath(outputFN) + "\n")
+        return
     CheckFastME(dir_out)
     dir_matrices = dir_out + "DistanceMatrices/"
     os.mkdir(dir_matrices)
     dir_trees_out = dir_out + "Trees/"
     os.mkdir(dir_trees_out)
     ProcessTrees(dir_in, dir_matrices, dir_trees_out, gene_to_species, qVerbose=(not args.quiet))
-    outputFN = dir_out + "SpeciesTree.tre"
 #    if args.astral_jar == None:
     if astral_jar == None:
         InferSpeciesTree(dir_trees_out, gene_to_species.species, outputFN)
@@ -292,6 +394,7 @@ if __name__ == "__main__":
     parser.add_argument("species_map", help = "Map file from gene names to species names, or SpeciesIDs.txt file from OrthoFinder")
     parser.add_argument("gene_trees", help = "Directory conaining gene trees")
     parser.add_argument("-q", "--quiet", help = "Only print sparse output", action="store_true")
+    parser.add_argument("-b", "--bionj", help = "Build the species tree for each gene tree with the built-in BIONJ rather than fastme", action="store_true")
 #    parser.add_argument("-a", "--astral_jar", help = "ASTRAL jar file. Use ASTRAL to combine STAG species tree estimates instead of greedy consensus tree.")
     args = parser.parse_args()
     main(args)
\ No newline at end of file
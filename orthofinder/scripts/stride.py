@@ -38,6 +38,7 @@ from collections import Counter, defaultdict
 
 import probroot
 import tree 
+import tree_cache
 
 def compare(exp, act):
     """exp - expected set of species
@@ -415,7 +416,7 @@ Parallelisation wrappers
 def SupportedHierachies_wrapper(treeName, GeneToSpecies, species, dict_clades, clade_names, qWriteDupTrees=False):
     if not os.path.exists(treeName): return [], []
     try:
-        t = tree.Tree(treeName, format=1)
+        t = tree_cache.ReadTree(treeName, format=1)
     except:
         return [], []
     G = set(t.get_leaf_names())
@@ -504,6 +505,7 @@ def GetRoot(speciesTreeFN, treesDir, GeneToSpeciesMap, nProcessors, qWriteDupTre
     except:
         speciesTree = tree.Tree(speciesTreeFN, format=1)                    
     species, dict_clades, clade_names = AnalyseSpeciesTree(speciesTree)
+    tree_cache.GetTreeCache(treesDir)   # load before the worker processes are forked
     pool = mp.Pool(nProcessors, maxtasksperchild=1)       
     list_of_dicts = pool.map(SupportedHierachies_wrapper2, [(fn, GeneToSpeciesMap, species, dict_clades, clade_names, qWriteDupTrees) for fn in glob.glob(treesDir + "/*")])
     clusters = Counter()
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for reading the BLAST results files
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+from collections import namedtuple
+
+import files
+import blast_file_processor
+import parallel_task_manager
+
+SeqsInfo = namedtuple("SeqsInfo", "nSeqsPerSpecies")
+
+def Line(q, h, score):
+    return "\t".join([q, h, "90.0", "100", "10", "0", "1", "100", "1", "100", "1e-10", score]) + "\n"
+
+class TestGetBLAST6Scores(unittest.TestCase):
+    def setUp(self):
+        self.d = tempfile.mkdtemp() + os.sep
+        self.wd_current = files.FileHandler.wd_current
+        files.FileHandler.wd_current = self.d
+        self.seqsInfo = SeqsInfo({0:2, 1:2})
+
+    def tearDown(self):
+        files.FileHandler.wd_current = self.wd_current
+        shutil.rmtree(self.d)
+
+    def Scores(self, lines):
+        with open(self.d + "Blast0_1.txt", 'wb') as outfile:
+            outfile.write("".join(lines))
+        return blast_file_processor.GetBLAST6Scores(self.seqsInfo, [self.d], 0, 1)
+
+    def test_Scores(self):
+        B = self.Scores([Line("0_0", "1_1", "50.5"), Line("0_0", "1_1", "60.0"), Line("0_1", "1_0", "0")])
+        self.assertEqual(B.toarray().tolist(), [[0., 60.], [0., 0.]])
+        self.assertTrue(os.path.exists(self.d + "BlastHits/BlastHits0_1.npz"))
+        # read from the cache
+        self.assertEqual(blast_file_processor.GetBLAST6Scores(self.seqsInfo, [self.d], 0, 1).toarray().tolist(), [[0., 60.], [0., 0.]])
+
+    def test_InconsistentIDs(self):
+        # a hit with a zero score is still an error if the sequence isn't in the species
+        for line in [Line("0_1", "1_7", "0"), Line("0_2", "1_0", "50.0")]:
+            with self.assertRaises(SystemExit):
+                self.Scores([Line("0_0", "1_1", "50.5"), line])
+            self.assertFalse(os.path.exists(self.d + "BlastHits/BlastHits0_1.npz"))
+
+def tearDownModule():
+    # importing files starts the parallel task manager
+    parallel_task_manager.ParallelTaskManager_singleton().Stop()
+
+if __name__ == "__main__":
+    unittest.main()
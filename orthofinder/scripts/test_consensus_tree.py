@@ -23,6 +23,10 @@ c = ct.BitVector(taxa_index, "c")
 d = ct.BitVector(taxa_index, "d")
 e = ct.BitVector(taxa_index, "e")
 
+def LeafSplits(nTrees):
+    """ split_counts for the leaves seen in each of nTrees trees """
+    return {ct.BitVector(taxa_index, taxon).Canonical():[nTrees, float(nTrees)] for taxon in taxa}
+
 class TestConsensusTree(unittest.TestCase):
     def test_BitVector(self):
         taxa = "a b c d e".split()
@@ -59,7 +63,7 @@ class TestConsensusTree(unittest.TestCase):
         self.assertFalse(z.Is("e"))
         
     def test_UpdateSplits(self):
-        all_splits = []
+        all_splits = dict()
         t = tree.Tree("((a,b),(c,d));")
         taxa = "abcd"
         taxa_index = {t:i for i, t in enumerate(taxa)}
@@ -81,13 +85,13 @@ class TestConsensusTree(unittest.TestCase):
         y.Add(ct.BitVector(taxa_index, "b"))
         z = ct.BitVector(taxa_index, "b")
         z.Add(ct.BitVector(taxa_index, "e"))
-        all_splits = [x.Canonical(), x.Canonical(), z.Canonical(), y.Canonical(), y.Canonical(), y.Canonical()]
+        all_splits = {x.Canonical():[2, 0.], z.Canonical():[1, 0.], y.Canonical():[3, 0.]}
         # x 0b00111 -> 0b11000
         # y 0b00011 -> 0b11100 
         com_sp = ct.GetCompatibleSplits(all_splits)
         self.assertEqual(len(com_sp),  2)
-        self.assertEqual(bin(com_sp[0]), "0b11100")
-        self.assertEqual(bin(com_sp[1]), "0b11000")
+        self.assertEqual(bin(com_sp[0][0]), "0b11100")
+        self.assertEqual(bin(com_sp[1][0]), "0b11000")
         
     def test_GetConstructTree(self):
         x = ct.BitVector(taxa_index, "a")
@@ -97,9 +101,10 @@ class TestConsensusTree(unittest.TestCase):
         y.Add(ct.BitVector(taxa_index, "b"))
         z = ct.BitVector(taxa_index, "b")
         z.Add(ct.BitVector(taxa_index, "e"))
-        all_splits = [x.Canonical(), x.Canonical(), z.Canonical(), y.Canonical(), y.Canonical(), y.Canonical()]
+        all_splits = LeafSplits(3)
+        all_splits.update({x.Canonical():[2, 0.], z.Canonical():[1, 0.], y.Canonical():[3, 0.]})
         com_sp = ct.GetCompatibleSplits(all_splits)
-        t = ct.ConstructTree(com_sp, taxa_index, taxa)
+        t = ct.ConstructTree(com_sp, all_splits, taxa_index, taxa, 3)
         self.assertTrue(ti.IsIso_labelled_ete_nonbinary(t, tree.Tree("(((d,e),c),a,b);"), ti.Identity))
         
     def test_GetConstructTree2(self):
@@ -109,8 +114,10 @@ class TestConsensusTree(unittest.TestCase):
         y = ct.BitVector(taxa_index)
         y.Add(c)
         y.Add(e)
-        com_sp = [x.Canonical(), y.Canonical()]
-        t = ct.ConstructTree(com_sp, taxa_index, taxa)
+        all_splits = LeafSplits(1)
+        all_splits.update({x.Canonical():[1, 0.], y.Canonical():[1, 0.]})
+        com_sp = ct.GetCompatibleSplits(all_splits)
+        t = ct.ConstructTree(com_sp, all_splits, taxa_index, taxa, 1)
         self.assertTrue(ti.IsIso_labelled_ete_nonbinary(t, tree.Tree("(a,b,((c,e),d));"), ti.Identity))
         
 if __name__ == "__main__":
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the indexed FASTA files
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import fasta_store
+
+fastas = [">0_0\nMKV\nLLA\n>0_1\n>0_2  \nAC\r\nDE\n\n>0_3\nWW", 
+          "intro\n>1_0\nPP\n>0_1\nDUP\n>1_1\nQ\n",
+          ""]
+
+def ReadSequences(fns):
+    """ The sequence lines for each accession read as trees_msa.FastaWriter did before it used the index """
+    seqs = dict()
+    for fn in fns:
+        accession = None
+        with open(fn, 'rb') as infile:
+            for line in infile:
+                if line[0] == ">":
+                    accession = line[1:].rstrip()
+                    seqs[accession] = ""
+                elif accession is not None:
+                    seqs[accession] += line
+    return seqs
+
+class TestFastaStore(unittest.TestCase):
+    def setUp(self):
+        self.d = tempfile.mkdtemp() + os.sep
+        self.fns = []
+        for i, text in enumerate(fastas):
+            self.fns.append(self.d + "Species%d.fa" % i)
+            with open(self.fns[-1], 'wb') as outfile:
+                outfile.write(text)
+
+    def tearDown(self):
+        shutil.rmtree(self.d)
+
+    def test_Sequences(self):
+        expected = ReadSequences(self.fns)
+        for store in (fasta_store.FastaStore(self.fns), fasta_store.FastaStore(self.fns)):
+            self.assertEqual(len(store), len(expected))
+            for accession, seq in expected.items():
+                self.assertEqual(store.Sequence(accession), seq)
+        self.assertEqual(fasta_store.FastaStore(self.fns).Sequence("0_1"), "DUP\n")
+        self.assertEqual(fasta_store.FastaStore(self.fns[:1]).Sequence("0_1"), "")
+        self.assertEqual(fasta_store.FastaStore(self.fns).Sequence("0_10"), None)
+        self.assertFalse("intro" in fasta_store.FastaStore(self.fns))
+
+    def test_Index(self):
+        fasta_store.FastaStore(self.fns)
+        for fn in self.fns:
+            self.assertTrue(os.path.exists(fn + fasta_store.indexSuffix))
+        # a changed file is reindexed
+        with open(self.fns[0], 'wb') as outfile:
+            outfile.write(">0_0\nMKVL\n>0_5\nA\n")
+        store = fasta_store.FastaStore(self.fns[:1])
+        self.assertEqual(store.Sequence("0_0"), "MKVL\n")
+        self.assertEqual(store.Sequence("0_5"), "A\n")
+        self.assertEqual(store.Sequence("0_3"), None)
+
+if __name__ == "__main__":
+    unittest.main()
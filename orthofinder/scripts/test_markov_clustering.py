@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the in-process MCL implementation
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from scipy import sparse
+
+import mcl
+import markov_clustering as mc
+
+def TwoCliquesGraph():
+    """ Two 4-node cliques, 0-3 & 4-7, joined by a single weak edge, plus an isolated node 8 """
+    edges = [(i, j, 10.) for clique in (range(4), range(4, 8)) for i in clique for j in clique if i != j]
+    edges += [(3, 4, 0.5), (4, 3, 0.5)]
+    I, J, W = zip(*edges)
+    return sparse.csr_matrix((W, (I, J)), shape=(9, 9))
+
+class TestMarkovClustering(unittest.TestCase):
+    def test_Clusters(self):
+        clusters = mc.MCL(TwoCliquesGraph(), 1.5)
+        self.assertEqual(clusters, [[0, 1, 2, 3], [4, 5, 6, 7], [8]])
+        
+    def test_Parallel(self):
+        self.assertEqual(mc.MCL(TwoCliquesGraph(), 1.5), mc.MCL(TwoCliquesGraph(), 1.5, nProcesses=2))
+        
+    def test_Prune(self):
+        M = sparse.csr_matrix(np.array([[0.5, 0.3, 0.15, 0.05], [0.25, 0.25, 0.25, 0.25]]))
+        M = mc.Prune(M, 0.1, 2)
+        self.assertEqual(M.toarray().tolist(), [[0.5, 0.3, 0., 0.], [0.25, 0.25, 0., 0.]])
+        
+    def test_WriteClusters(self):
+        d = tempfile.mkdtemp()
+        try:
+            fn = os.path.join(d, "clusters.txt")
+            mc.WriteClusters([[0, 1, 2, 3], [4, 5, 6, 7], [8]], 9, fn)
+            ogs = mcl.GetPredictedOGs(fn)
+            self.assertEqual(ogs, [set("0 1 2 3".split()), set("4 5 6 7".split()), set(["8"])])
+        finally:
+            shutil.rmtree(d)
+        
+if __name__ == "__main__":
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestMarkovClustering)
+    unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the archives of per-orthogroup files
+"""
+
+import os
+import shutil
+import zipfile
+import tempfile
+import unittest
+
+import util
+import og_archive
+import parallel_task_manager
+
+files = {
+    "OG0000000.fa":">0_0\nMKV\n>1_0\nMKI\n",
+    "OG0000001.fa":"",
+    "OG0000012.fa":">2_5\nMAAAAA\nAAA\n",
+    "OG12345678.fa":">0_1\nM\n",
+    "SpeciesTreeAlignment.fa":">0\nMKV\n",
+}
+
+class TestOGArchive(unittest.TestCase):
+    def setUp(self):
+        self.d = tempfile.mkdtemp() + os.sep
+        self.seqsDir = self.d + "Orthogroup_Sequences" + os.sep
+        os.mkdir(self.seqsDir)
+        for fn, text in files.items():
+            with open(self.seqsDir + fn, 'wb') as outfile:
+                outfile.write(text)
+
+    def tearDown(self):
+        shutil.rmtree(self.d)
+
+    def test_Pack(self):
+        archiveFN = og_archive.PackDirectory(self.seqsDir)
+        self.assertEqual(archiveFN, self.d + "Orthogroup_Sequences.zip")
+        self.assertEqual(os.listdir(self.seqsDir), ["SpeciesTreeAlignment.fa"])
+        self.assertTrue(os.path.exists(archiveFN + og_archive.indexSuffix))
+        with zipfile.ZipFile(archiveFN) as z:
+            for fn, text in files.items():
+                if fn != "SpeciesTreeAlignment.fa":
+                    self.assertEqual(z.read(fn), text)
+        archive = og_archive.OGArchive(archiveFN)
+        self.assertEqual(archive.OGs(), [0, 1, 12, 12345678])
+        self.assertEqual(archive.Read(0), files["OG0000000.fa"])
+        self.assertEqual(archive.Read(1), "")
+        self.assertEqual(archive.Read(12), files["OG0000012.fa"])
+        self.assertEqual(archive.Read(12345678), files["OG12345678.fa"])
+        self.assertEqual(archive.Filename(12), "OG0000012.fa")
+        self.assertEqual(archive.Read(2), None)
+        self.assertFalse(13 in archive)
+
+    def test_Append(self):
+        archiveFN = og_archive.PackDirectory(self.seqsDir)
+        os.remove(self.seqsDir + "SpeciesTreeAlignment.fa")
+        with open(self.seqsDir + "OG0000012.fa", 'wb') as outfile:
+            outfile.write(">3_0\nMV\n")
+        with open(self.seqsDir + "OG0000002.fa", 'wb') as outfile:
+            outfile.write(">3_1\nMW\n")
+        self.assertEqual(og_archive.PackDirectory(self.seqsDir), archiveFN)
+        self.assertFalse(os.path.exists(self.seqsDir))
+        archive = og_archive.OGArchive(archiveFN)
+        self.assertEqual(archive.OGs(), [0, 1, 2, 12, 12345678])
+        self.assertEqual(archive.Read(0), files["OG0000000.fa"])
+        self.assertEqual(archive.Read(2), ">3_1\nMW\n")
+        self.assertEqual(archive.Read(12), ">3_0\nMV\n")
+
+    def test_IndexRebuilt(self):
+        archiveFN = og_archive.PackDirectory(self.seqsDir)
+        os.remove(archiveFN + og_archive.indexSuffix)
+        self.assertEqual(og_archive.OGArchive(archiveFN).Read(12), files["OG0000012.fa"])
+        self.assertTrue(os.path.exists(archiveFN + og_archive.indexSuffix))
+
+    def test_Writer(self):
+        d = self.d + "Gene_Trees" + os.sep
+        with og_archive.OGFileWriter(d, True) as writer:
+            for fn, text in sorted(files.items()):
+                writer.Write(fn, text)
+        archiveFN = self.d + "Gene_Trees.zip"
+        self.assertEqual(sorted(os.listdir(self.d)), ["Gene_Trees", "Gene_Trees.zip", "Gene_Trees.zip.idx", "Orthogroup_Sequences"])
+        self.assertEqual(os.listdir(d), ["SpeciesTreeAlignment.fa"])
+        archive = og_archive.OGArchive(archiveFN)
+        self.assertEqual(archive.OGs(), [0, 1, 12, 12345678])
+        self.assertEqual(archive.Read(12), files["OG0000012.fa"])
+        # replaces the files it writes again
+        with og_archive.OGFileWriter(d, True) as writer:
+            writer.Write("OG0000002.fa", ">3_1\nMW\n")
+            writer.Write("OG0000012.fa", ">3_0\nMV\n")
+        archive = og_archive.OGArchive(archiveFN)
+        self.assertEqual(archive.OGs(), [0, 1, 2, 12, 12345678])
+        self.assertEqual(archive.Read(0), files["OG0000000.fa"])
+        self.assertEqual(archive.Read(12), ">3_0\nMV\n")
+        self.assertTrue(og_archive.Exists(d, "OG0000002.fa"))
+        self.assertFalse(og_archive.Exists(d, "OG0000003.fa"))
+        # nothing is left if the writing fails
+        with self.assertRaises(ValueError):
+            with og_archive.OGFileWriter(self.d + "MultipleSequenceAlignments" + os.sep, True) as writer:
+                writer.Write("OG0000000.fa", "")
+                raise ValueError
+        self.assertEqual(len(os.listdir(self.d)), 4)
+
+    def test_Files(self):
+        d = self.d + "Gene_Trees" + os.sep
+        with og_archive.OGFileWriter(d, False) as writer:
+            writer.Write("OG0000000.fa", files["OG0000000.fa"])
+        self.assertEqual(os.listdir(d), ["OG0000000.fa"])
+        self.assertFalse(os.path.exists(self.d + "Gene_Trees.zip"))
+        self.assertTrue(og_archive.Exists(d, "OG0000000.fa"))
+
+    def test_Reader(self):
+        reader = og_archive.OGFileReader(self.seqsDir)
+        self.assertEqual(reader.Read("OG0000012.fa"), files["OG0000012.fa"])
+        self.assertEqual(reader.Read("OG0000002.fa"), None)
+        og_archive.PackDirectory(self.seqsDir)
+        reader = og_archive.OGFileReader(self.seqsDir)
+        for fn, text in files.items():
+            self.assertEqual(reader.Read(fn), text)
+        self.assertEqual(reader.Read("OG0000002.fa"), None)
+        reader.Close()
+
+    def test_WriteParallel(self):
+        fns = sorted(files)
+        Text = lambda fn: None if fn == "OG0000001.fa" else files[fn]
+        for qPack in (False, True):
+            for nProcesses in (1, 3):
+                d = self.d + "Out_%d_%d" % (qPack, nProcesses) + os.sep
+                with og_archive.OGFileWriter(d, qPack) as writer:
+                    util.RunExportParallel_Write(Text, [(fn,) for fn in fns], fns, writer, nProcesses)
+                reader = og_archive.OGFileReader(d)
+                for fn in fns:
+                    self.assertEqual(reader.Read(fn), Text(fn))
+                reader.Close()
+
+def tearDownModule():
+    # importing util starts the parallel task manager
+    parallel_task_manager.ParallelTaskManager_singleton().Stop()
+
+if __name__ == "__main__":
+    unittest.main()
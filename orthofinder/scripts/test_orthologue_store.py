@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the binary orthologue store
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import orthologue_store as ostore
+
+class SeqsInfo(object):
+    nSeqsPerSpecies = {0:3, 2:2}
+
+class OGSet(object):
+    """ The parts of orthologues.OrthoGroupsSet used by OrthologueStoreWriter.Write, species 0 & 2 (species 1 excluded) """
+    speciesToUse = [0, 2]
+    seqsInfo = SeqsInfo()
+    def SpeciesDict(self):
+        return {"0":"Mouse", "1":"Rat", "2":"Human"}
+    def SequenceDict(self):
+        return {"0_0":"m0", "0_1":"m1", "0_2":"m2", "2_0":"h0", "2_1":"h1"}
+
+class TestOrthologueStore(unittest.TestCase):
+    def setUp(self):
+        self.d = tempfile.mkdtemp()
+        self.fn = os.path.join(self.d, "Orthologues.npz")
+        writer = ostore.OrthologueStoreWriter()
+        writer.Add(4, 0, [0, 2], 2, [1])
+        writer.Add(7, 0, [1], 2, [0], ostore.XENOLOGUE)
+        writer.Write(self.fn, OGSet())
+        self.store = ostore.OrthologueStore(self.fn)
+
+    def tearDown(self):
+        shutil.rmtree(self.d)
+
+    def test_Orthologues(self):
+        self.assertEqual(self.store.Orthologues("h1"), [("m0", "OG0000004", "Orthologue"), ("m2", "OG0000004", "Orthologue")])
+        self.assertEqual(self.store.Orthologues("0_2"), [("h1", "OG0000004", "Orthologue")])
+        self.assertEqual(self.store.Orthologues("m1"), [])
+        self.assertEqual(self.store.Orthologues("m1", qXenologues=True), [("h0", "OG0000007", "Putative xenologue")])
+
+    def test_SpeciesPair(self):
+        self.assertEqual(self.store.SpeciesPair("Mouse", "Human"), [("OG0000004", "m0", "h1"), ("OG0000004", "m2", "h1")])
+        self.assertEqual(self.store.SpeciesPair("2", "0", qXenologues=True), [("OG0000007", "h0", "m1"), ("OG0000004", "h1", "m0"), ("OG0000004", "h1", "m2")])
+        self.assertRaises(KeyError, self.store.SpeciesPair, "Rat", "Human")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for renaming the taxa in tree files without the full newick parser
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import tree
+import newick
+import util
+import tree_cache
+import parallel_task_manager
+
+trees = {
+    "OG0000000_tree_id.txt":"((0_0:0.1,1_0:0.2):0.05,(2_0:0.3,(3_0:0.1,3_1:-1e-05):0.2):0.05,0_1:0.4);",
+    "OG0000001_tree_id.txt":"((0_0:0.1,1_0:0.2)0.95:0.05,(2_0:0.3,3_0:0.1)1.000:-0.05,0_1:0.4);",
+    "OG0000002_tree_id.txt":"((0_0:0.1,1_0:0.2)n1:0.05,2_0:0.3)n0;",
+    "OG0000003_tree_id.txt":"((0_0:0.1,1_0:0.2):0.05[&&NHX:S=A],2_0:0.3);",
+    "OG0000004_tree_id.txt":"((0_0,1_0),(2_0,3_0));",
+}
+
+ids = {"0_0":"A_a", "0_1":"A_b", "1_0":"B:a", "2_0":"C_a", "3_0":"D_a", "3_1":"D_b"}
+
+def Rename(fn, *args, **kwargs):
+    """ The tree written by RenameTreeTaxa for the file & when the tree is read with the full parser """
+    d = os.path.dirname(fn) + os.sep
+    util.RenameTreeTaxa(fn, d + "out.txt", ids, *args, **kwargs)
+    with open(d + "out.txt", 'rb') as infile:
+        text = infile.read()
+    inFormat = kwargs.get("inFormat", None)
+    try:
+        t = tree.Tree(fn, format=2 if inFormat == None else inFormat)
+        qHaveSupport = inFormat == None
+    except newick.NewickError:
+        t = tree.Tree(fn)
+        qHaveSupport = False
+    if qHaveSupport and not args[0]:
+        args = (True,) + args[1:]
+    util.RenameTreeTaxa(t, d + "out.txt", ids, *args, **kwargs)
+    with open(d + "out.txt", 'rb') as infile:
+        expected = infile.read()
+    return text, expected
+
+class TestRenameTreeTaxa(unittest.TestCase):
+    def setUp(self):
+        self.d = tempfile.mkdtemp() + os.sep
+        for fn, nw in trees.items():
+            with open(self.d + fn, 'wb') as outfile:
+                outfile.write(nw)
+
+    def tearDown(self):
+        shutil.rmtree(self.d)
+
+    def test_SameAsParsedTree(self):
+        for qCache in (False, True):
+            if qCache: tree_cache.GetTreeCache(self.d).Update()
+            for fn in sorted(trees):
+                for args, kwargs in [((False, True), {}), ((True, True), {}), ((False, False), {}),
+                                     ((False, True), {"label":"n"}), ((False, False), {"inFormat":1})]:
+                    text, expected = Rename(self.d + fn, *args, **kwargs)
+                    self.assertEqual(text, expected)
+
+    def test_Text(self):
+        fn = self.d + "OG0000001_tree_id.txt"
+        self.assertEqual(util.RenamedTreeText(fn, ids, False, True), "((A_a:0.1,B_a:0.2)0.95:0.05,(C_a:0.3,D_a:0.1)1:1.1e-06,A_b:0.4);")
+        self.assertEqual(util.RenamedTreeText(fn, ids, False, True, label="N"), "((A_a:0.1,B_a:0.2)N1:0.05,(C_a:0.3,D_a:0.1)N2:1.1e-06,A_b:0.4)N0;")
+        self.assertEqual(util.RenamedTreeText(self.d + "OG0000002_tree_id.txt", ids, False, True), None)
+        self.assertEqual(util.RenamedTreeText(self.d + "OG0000003_tree_id.txt", ids, False, True), None)
+        self.assertEqual(util.RenamedTreeText(self.d + "OG0000004_tree_id.txt", ids, False, True), "((A_a:1,B_a:1):1,(C_a:1,D_a:1):1);")
+
+    def test_Errors(self):
+        fn = self.d + "OG0000000_tree_id.txt"
+        self.assertRaises(KeyError, util.RenameTreeTaxa, fn, self.d + "out.txt", {"0_0":"A_a"}, False, True)
+        self.assertFalse(os.path.exists(self.d + "out.txt"))
+        # no tree for the orthogroup
+        util.RenameTreeTaxa(self.d + "OG0000005_tree_id.txt", self.d + "out.txt", ids, False, True)
+        open(self.d + "OG0000006_tree_id.txt", 'wb').close()
+        util.RenameTreeTaxa(self.d + "OG0000006_tree_id.txt", self.d + "out.txt", ids, False, True)
+        self.assertFalse(os.path.exists(self.d + "out.txt"))
+        with open(self.d + "OG0000007_tree_id.txt", 'wb') as outfile:
+            outfile.write("((0_0,1_0),(2_0,3_0);")
+        self.assertRaises(newick.NewickError, util.RenameTreeTaxa, self.d + "OG0000007_tree_id.txt", self.d + "out.txt", ids, False, True)
+
+def tearDownModule():
+    # importing util starts the parallel task manager
+    parallel_task_manager.ParallelTaskManager_singleton().Stop()
+
+if __name__ == "__main__":
+    unittest.main()
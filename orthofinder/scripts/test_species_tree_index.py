@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the species tree index used to root the gene trees
+"""
+
+import unittest
+
+import tree
+import trees2ologs_of
+import parallel_task_manager
+
+GeneToSpecies = trees2ologs_of.GeneToSpecies_dash
+
+class TestSpeciesTreeIndex(unittest.TestCase):
+    def setUp(self):
+        self.species_tree = tree.Tree("((0,1)N2,(2,(3,4,5)N4)N3)N0;", format=1)
+        self.index = trees2ologs_of.GetSpeciesTreeIndex(self.species_tree)
+
+    def test_Masks(self):
+        self.assertEqual(sorted(self.index.bits.values()), [1 << i for i in xrange(6)])
+        self.assertEqual(self.index.mask[self.species_tree], (1 << 6) - 1)
+        self.assertEqual(self.index.Mask(["3", "4", "5"]), self.index.mask[self.species_tree & "N4"])
+        self.assertTrue(trees2ologs_of.GetSpeciesTreeIndex(self.species_tree) is self.index)
+
+    def test_LCA(self):
+        for species, name in [(["0", "1"], "N2"), (["3", "5"], "N4"), (["2", "5"], "N3"), (["0", "5"], "N0"), (["4"], "4")]:
+            self.assertEqual(self.index.LCA(self.index.Mask(species)).name, name)
+            if len(species) > 1:
+                self.assertTrue(self.index.LCA(self.index.Mask(species)) is self.species_tree.get_common_ancestor(species))
+
+    def test_GetRoots(self):
+        t = tree.Tree("((0_0:1,1_0:1):1,((2_0:1,3_0:1):1,(3_1:1,5_0:1):1):1);")
+        roots = trees2ologs_of.GetRoots(t, self.species_tree, GeneToSpecies)
+        self.assertEqual(len(roots), 1)
+        self.assertEqual(sorted(roots[0].get_leaf_names()), ["0_0", "1_0"])
+        # two copies of the genes of the N4 clade, rooted between them
+        t = tree.Tree("(((3_0:1,4_0:1):1,5_0:1):1,((3_1:1,4_1:1):1,5_1:1):1);")
+        roots = trees2ologs_of.GetRoots(t, self.species_tree, GeneToSpecies)
+        self.assertEqual(roots, [t.children[0]])
+        t = tree.Tree("(3_0:1,3_1:1);")
+        self.assertEqual(trees2ologs_of.GetRoots(t, self.species_tree, GeneToSpecies), [t.children[0]])
+
+def tearDownModule():
+    # importing trees2ologs_of starts the parallel task manager
+    parallel_task_manager.ParallelTaskManager_singleton().Stop()
+
+if __name__ == "__main__":
+    unittest.main()
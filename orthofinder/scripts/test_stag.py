@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the neighbour joining used by STAG
+"""
+
+import unittest
+import numpy as np
+
+import tree
+import stag
+
+# an unrooted tree with distinct branch lengths, the distances between its leaves are additive
+species_tree = "((0:0.1,1:0.3):0.2,(2:0.25,(3:0.05,4:0.4):0.15):0.1,5:0.6);"
+
+def Distances(t, names):
+    leaves = {n.name:n for n in t}
+    return np.array([[t.get_distance(leaves[a], leaves[b]) for b in names] for a in names])
+
+def Splits(t):
+    """ The splits of the unrooted tree with their branch lengths, each given by the side without leaf "0" """
+    leaves = frozenset(t.get_leaf_names())
+    splits = dict()
+    for n in t.traverse():
+        if n.up is None: continue
+        x = frozenset(n.get_leaf_names())
+        if "0" in x: x = leaves - x
+        splits[x] = splits.get(x, 0.) + n.dist
+    return splits
+
+class TestNeighbourJoining(unittest.TestCase):
+    def setUp(self):
+        self.t = tree.Tree(species_tree)
+        self.names = map(str, range(6))
+        self.D = Distances(self.t, self.names)
+
+    def assertSameTree(self, t1, t2):
+        s1, s2 = Splits(t1), Splits(t2)
+        self.assertEqual(set(s1), set(s2))
+        for x in s1:
+            self.assertAlmostEqual(s1[x], s2[x])
+
+    def test_Additive(self):
+        # both methods recover a tree exactly from its additive distances
+        self.assertSameTree(stag.NeighbourJoining(self.D, self.names), self.t)
+        self.assertSameTree(stag.NeighbourJoining(self.D, self.names, qBIONJ=False), self.t)
+
+    def test_Unrooted(self):
+        t = stag.NeighbourJoining(self.D, self.names)
+        self.assertEqual(len(t.get_children()), 3)
+        self.assertEqual(sorted(t.get_leaf_names()), self.names)
+
+    def test_LeafOrder(self):
+        order = [3, 0, 5, 1, 4, 2]
+        names = [self.names[i] for i in order]
+        self.assertSameTree(stag.NeighbourJoining(self.D[np.ix_(order, order)], names), self.t)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the gene tree cache
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import tree
+import newick
+import tree_cache
+
+trees = {
+    "OG0000000_tree_id.txt":"((0_0:0.1,1_0:0.2):0.05,(2_0:0.3,(3_0:0.1,3_1:1e-05):0.2):0.05,0_1:0.4);",
+    "OG0000001_tree_id.txt":"((0_0:0.1,1_0:0.2)0.95:0.05,(2_0:0.3,3_0:0.1)1.000:0.05,0_1:0.4);",
+    "OG0000002_tree_id.txt":"((0_0:0.1,1_0:0.2)n1:0.05,2_0:0.3)n0;",
+    "OG0000003_tree_id.txt":"((0_0:0.1,1_0:0.2):0.05[&&NHX:S=A],2_0:0.3);",
+    "OG0000004_tree_id.txt":"((0_0:0.1,1_0:0.2):0.05,2_0:0.3;",
+}
+
+def Describe(t):
+    return [(n.name, n.dist, n.support, len(n.children)) for n in t.traverse("preorder")]
+
+def Read(f, *args):
+    try:
+        return Describe(f(*args))
+    except newick.NewickError:
+        return "NewickError"
+
+class TestTreeCache(unittest.TestCase):
+    def setUp(self):
+        self.d = tempfile.mkdtemp() + os.sep
+        for fn, nw in trees.items():
+            with open(self.d + fn, 'wb') as outfile:
+                outfile.write(nw)
+        self.cache = tree_cache.TreeCache(self.d)
+        self.cache.Update()
+
+    def tearDown(self):
+        shutil.rmtree(self.d)
+
+    def test_SameAsFile(self):
+        for fn in trees:
+            for format in (0, 1, 2, 3, 5, 8):
+                self.assertEqual(Read(self.cache.Tree, self.d + fn, format), Read(tree.Tree, self.d + fn, format))
+
+    def test_Cached(self):
+        cache = tree_cache.TreeCache(self.d)
+        self.assertTrue(cache.Arrays(self.d + "OG0000000_tree_id.txt")[-1] & 1)
+        self.assertTrue(cache.Arrays(self.d + "OG0000001_tree_id.txt")[-1] & (1 << 2))
+        self.assertEqual(cache.Arrays(self.d + "OG0000003_tree_id.txt"), None)
+        self.assertEqual(cache.Arrays(self.d + "OG0000004_tree_id.txt"), None)
+        self.assertRaises(newick.NewickError, cache.Tree, self.d + "OG0000000_tree_id.txt", 2)
+
+    def test_NotReparsed(self):
+        # the formats the arrays can't be used for are known to fail without reading the tree with the full parser
+        Tree = tree_cache.tree.Tree
+        tree_cache.tree.Tree = None
+        try:
+            for format in (2, 3):
+                self.assertRaises(newick.NewickError, self.cache.Tree, self.d + "OG0000000_tree_id.txt", format)
+            self.assertEqual(Describe(self.cache.Tree(self.d + "OG0000000_tree_id.txt", 5)), Describe(Tree(self.d + "OG0000000_tree_id.txt", format=5)))
+        finally:
+            tree_cache.tree.Tree = Tree
+        self.assertEqual(newick.array_format_errors(self.cache.Arrays(self.d + "OG0000001_tree_id.txt")[-1]), 1 << 5)
+
+    def test_Changed(self):
+        fn = self.d + "OG0000002_tree_id.txt"
+        with open(fn, 'wb') as outfile:
+            outfile.write("((0_0:0.1,1_0:0.2)n1:0.05,2_10:0.3)n0;")
+        self.assertFalse(self.cache.IsCurrent(fn))
+        self.assertEqual(tree_cache.TreeCache(self.d).Tree(fn).get_leaf_names(), ["0_0", "1_0", "2_10"])
+        self.cache.Update()
+        self.assertTrue(self.cache.IsCurrent(fn))
+        self.assertTrue(self.cache.IsCurrent(self.d + "OG0000000_tree_id.txt"))
+        self.assertEqual(self.cache.Tree(fn, 1).get_leaf_names(), ["0_0", "1_0", "2_10"])
+
+if __name__ == "__main__":
+    unittest.main()
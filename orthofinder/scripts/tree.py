@@ -126,6 +126,9 @@ class TreeNode(object):
         t2 = Tree('(A:1,(B:1,(C:1,D:1):0.5):0.5);')
         t3 = Tree('/home/user/myNewickFile.txt')
     """
+    # Fixed attributes are slots. Other features are stored in the instance __dict__, which is only created once the 
+    # first one is added, and the features set is likewise only created on first use.
+    __slots__ = ["_children", "_up", "_dist", "_support", "_img_style", "_features", "name", "__dict__"]
 
     def _get_dist(self):
         return self._dist
@@ -160,6 +163,13 @@ class TreeNode(object):
         else:
             raise ValueError("bad children type")
 
+    def _get_features(self):
+        if self._features is None:
+            self._features = set(["dist", "support", "name"])
+        return self._features
+    def _set_features(self, value):
+        self._features = value
+
     def _get_style(self):
         if self._img_style is None:
             self._set_style(None)
@@ -180,6 +190,8 @@ class TreeNode(object):
     up = property(fget=_get_up, fset=_set_up)
     #: A list of children nodes
     children = property(fget=_get_children, fset=_set_children)
+    #: The names of the node's features
+    features = property(fget=_get_features, fset=_set_features)
 
     def _set_face_areas(self, value):
         if isinstance(value, _FaceAreas):
@@ -202,9 +214,7 @@ class TreeNode(object):
         self._dist = DEFAULT_DIST
         self._support = DEFAULT_SUPPORT
         self._img_style = None
-        self.features = set([])
-        # Add basic features
-        self.features.update(["dist", "support", "name"])
+        self._features = None   # basic features: dist, support & name
         if dist is not None:
             self.dist = dist
         if support is not None:
@@ -220,6 +230,16 @@ class TreeNode(object):
     def __nonzero__(self):
         return True
 
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        for attr in TreeNode.__slots__[:-1]:
+            state[attr] = getattr(self, attr)
+        return state
+
+    def __setstate__(self, state):
+        for attr, value in state.iteritems():
+            object.__setattr__(self, attr, value)
+
     def __repr__(self):
         return "Tree node '%s' (%s)" %(self.name, hex(self.__hash__()))
 
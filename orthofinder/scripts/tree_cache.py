@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2014 David Emms
+#
+# This program (OrthoFinder) is distributed under the terms of the GNU General Public License v3
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#  When publishing work that uses OrthoFinder please cite:
+#      Emms, D.M. and Kelly, S. (2015) OrthoFinder: solving fundamental biases in whole genome comparisons dramatically
+#      improves orthogroup inference accuracy, Genome Biology 16:157
+#
+# For any enquiries send an email to David Emms
+# david_emms@hotmail.com
+
+"""
+The gene trees in a directory parsed once and stored in a single file alongside them, so that each of the later stages
+(STAG, STRIDE, the orthologue inference & the renaming of the trees) doesn't need to parse the newick files again.
+
+The cache file is an .npz holding each tree as arrays (see newick.read_newick_arrays): the index of the parent of
+each node in preorder, the branch lengths, the support values and the leaf and node names. Each tree is stored with the
+modification time and size of its file and is only read from the cache if these are unchanged, otherwise, or if the
+tree isn't in the cache, the file is read as before.
+
+Usage:
+    GetTreeCache(treesDir).Update(nProcesses)       # once the trees have been inferred
+    t = ReadTree(treeFN, format)                    # in place of tree.Tree(treeFN, format=format)
+"""
+import os
+import glob
+import numpy as np
+import multiprocessing as mp
+
+import tree, newick
+
+cacheFilename = ".trees_cache.npz"    # hidden so that it isn't one of the trees in glob.glob(treesDir + "/*")
+arrayFormats = (0, 1, 2, 3, 5)        # the newick formats that newick.read_newick_arrays can read
+
+_caches = dict()    # the TreeCache for each directory, loaded before processes are forked are shared by them
+
+def GetTreeCache(treesDir):
+    """ The TreeCache for the directory, loaded from its cache file the first time it's requested by this process """
+    d = os.path.abspath(treesDir)
+    if d not in _caches:
+        _caches[d] = TreeCache(d)
+    return _caches[d]
+
+def ReadTree(treeFN, format=0):
+    """ As tree.Tree(treeFN, format=format) but using the cache for the directory of the file if it is up to date """
+    if isinstance(treeFN, basestring) and os.path.isfile(treeFN):
+        return GetTreeCache(os.path.dirname(treeFN)).Tree(treeFN, format)
+    return tree.Tree(treeFN, format=format)
+
+def ReadTreeArrays(treeFN):
+    """ Returns (filename, mtime, size, arrays) for a tree file, None if newick.read_newick_arrays can't read it """
+    st = os.stat(treeFN)
+    with open(treeFN, 'rU') as infile:
+        nw = infile.read()
+    try:
+        arrays = newick.read_newick_arrays(nw)
+    except newick.NewickError:
+        return None
+    return os.path.basename(treeFN), st.st_mtime, st.st_size, arrays
+
+class TreeCache(object):
+    def __init__(self, treesDir):
+        self.treesDir = os.path.abspath(treesDir)
+        self.cacheFN = os.path.join(self.treesDir, cacheFilename)
+        self.index = dict()
+        self.Load()
+
+    def Load(self):
+        if not os.path.exists(self.cacheFN): return
+        try:
+            with np.load(self.cacheFN) as data:
+                filenames = data["filenames"].tolist()
+                self.mtimes = data["mtimes"]
+                self.sizes = data["sizes"]
+                self.formats = data["formats"]
+                self.nodeOffsets = data["node_offsets"]
+                self.parents = data["parents"]
+                self.dists = data["dists"]
+                self.supports = data["supports"]
+                self.named = data["named"]
+                self.names = data["names"].tostring()
+                self.nameOffsets = data["name_offsets"]
+        except (IOError, KeyError, ValueError):
+            # unreadable, e.g. if written by a process that was killed, the trees will be read from their files
+            return
+        self.index = {fn:i for i, fn in enumerate(filenames)}
+
+    def IsCurrent(self, treeFN):
+        i = self.index.get(os.path.basename(treeFN), None)
+        if i is None: return False
+        try:
+            st = os.stat(treeFN)
+        except OSError:
+            return False
+        return st.st_mtime == self.mtimes[i] and st.st_size == self.sizes[i]
+
+    def Arrays(self, treeFN):
+        """ (parents, names, dists, supports, formats) for the tree if it is in the cache & up to date, otherwise None """
+        if os.path.dirname(os.path.abspath(treeFN)) != self.treesDir or not self.IsCurrent(treeFN): return None
+        i = self.index[os.path.basename(treeFN)]
+        start, end = self.nodeOffsets[i:i+2]
+        names = self.names[self.nameOffsets[i]:self.nameOffsets[i+1]].split("\n")
+        names = [name if named else None for name, named in zip(names, self.named[start:end])]
+        return self.parents[start:end].tolist(), names, self.dists[start:end].tolist(), self.supports[start:end].tolist(), int(self.formats[i])
+
+    def Tree(self, treeFN, format=0):
+        """
+        As tree.Tree(treeFN, format=format), the tree is only read from its file if the cached copy can't be used: if 
+        it isn't in the cache or the format is one the arrays aren't for, e.g. format 0 when there are internal node names
+        """
+        arrays = self.Arrays(treeFN)
+        if arrays is None:
+            return tree.Tree(treeFN, format=format)
+        formats = arrays[-1]
+        if formats & (1 << format):
+            return newick.tree_from_arrays(tree.TreeNode(), *(arrays[:-1] + (format,)))
+        if newick.array_format_errors(formats) & (1 << format):
+            raise newick.NewickError("Tree can't be read in newick format %d" % format)
+        return tree.Tree(treeFN, format=format)
+
+    def Update(self, nProcesses=1):
+        """ Parse the trees that aren't in the cache or have changed since they were added and rewrite the cache file """
+        treeFNs = sorted(glob.glob(self.treesDir + "/*"))
+        toRead = [fn for fn in treeFNs if not self.IsCurrent(fn)]
+        current = set(os.path.basename(fn) for fn in treeFNs).difference(map(os.path.basename, toRead))
+        if len(toRead) == 0: return
+        if nProcesses == 1:
+            results = map(ReadTreeArrays, toRead)
+        else:
+            pool = mp.Pool(nProcesses)
+            results = pool.map(ReadTreeArrays, toRead, chunksize=max(1, len(toRead) // (10*nProcesses)))
+            pool.close()
+            pool.join()
+        newTrees = {r[0]:r for r in results if r is not None}
+        filenames, mtimes, sizes, formats, nNodes = [], [], [], [], []
+        parents, dists, supports, named, names = [], [], [], [], []
+        for fn in map(os.path.basename, treeFNs):
+            if fn in newTrees:
+                _, mtime, size, (p, n, d, s, f) = newTrees[fn]
+            elif fn in current:
+                i = self.index[fn]
+                mtime, size = self.mtimes[i], self.sizes[i]
+                p, n, d, s, f = self.Arrays(os.path.join(self.treesDir, fn))
+            else:
+                continue
+            filenames.append(fn)
+            mtimes.append(mtime)
+            sizes.append(size)
+            formats.append(f)
+            nNodes.append(len(p))
+            parents.extend(p)
+            dists.extend(d)
+            supports.extend(s)
+            named.extend(name is not None for name in n)
+            names.append("\n".join(name if name is not None else "" for name in n))
+        nameLengths = [len(n) for n in names]
+        tempFN = self.cacheFN + ".%d.tmp" % os.getpid()
+        with open(tempFN, 'wb') as outfile:
+            np.savez(outfile,
+                     filenames=np.array(filenames),
+                     mtimes=np.array(mtimes, dtype=np.float64),
+                     sizes=np.array(sizes, dtype=np.int64),
+                     formats=np.array(formats, dtype=np.int32),
+                     node_offsets=np.cumsum([0] + nNodes),
+                     parents=np.array(parents, dtype=np.int32),
+                     dists=np.array(dists, dtype=np.float64),
+                     supports=np.array(supports, dtype=np.float64),
+                     named=np.array(named, dtype=bool),
+                     names=np.frombuffer("".join(names), dtype=np.uint8),
+                     name_offsets=np.cumsum([0] + nameLengths))
+        os.rename(tempFN, self.cacheFN)
+        self.index = dict()
+        self.Load()
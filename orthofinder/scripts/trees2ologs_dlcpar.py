@@ -195,12 +195,13 @@ def multiply(specmin, specmax, pickleDir):
     product = M.dot(M.transpose())
     return product, M
 
-def WriteOrthologues(resultsDir, spec1, spec2, orthologues, ogSet, nOrtho_sp, i, j): 
+def WriteOrthologues(resultsDir, spec1, spec2, orthologues, ogSet, nOrtho_sp, i, j, store=None): 
     """
     spec1 (int) - the ID for the first species
     spec2 (int) - the ID for the second species
     i (int) - the ordinal for the first species (after excluded species have been removed)
     j (int) - the ordinal for the second species (after excluded species have been removed)
+    store - OrthologueStoreWriter to add the orthologues to as well, or None
     """
     speciesDict = ogSet.SpeciesDict()
     id_to_og = ogSet.ID_to_OG_Dict()
@@ -229,9 +230,11 @@ def WriteOrthologues(resultsDir, spec1, spec2, orthologues, ogSet, nOrtho_sp, i,
             else:
                 nOrtho_sp.n_m2m[i, j] += n1
                 nOrtho_sp.n_m2m[j, i] += n2
-            og = "OG%07d" % id_to_og["%d_%d" % (spec1, genes1[0])]
+            iog = id_to_og["%d_%d" % (spec1, genes1[0])]
+            og = "OG%07d" % iog
             writer1.writerow((og, ", ".join([sequenceDict["%d_%d" % (spec1, o)] for o in genes1]), ", ".join([sequenceDict["%d_%d" % (spec2, o)] for o in genes2])))
             writer2.writerow((og, ", ".join([sequenceDict["%d_%d" % (spec2, o)] for o in genes2]), ", ".join([sequenceDict["%d_%d" % (spec1, o)] for o in genes1])))
+            if store != None: store.Add(iog, spec1, genes1, spec2, genes2)
 
 def GetOrthologues(orig_matrix, orig_matrix_csc, index):
     orthologues = orig_matrix.getrowview(index).nonzero()[1]
@@ -252,7 +255,7 @@ def find_all(matrix, orig_matrix):
         orthologues.append((orthologuesSp1, orthologuesSp2))
     return orthologues
         
-def species_write_all(ogSet, pickleDir, resultsDir):
+def species_write_all(ogSet, pickleDir, resultsDir, store=None):
     speciesDict = ogSet.SpeciesDict()
     # Calls multiply and find_all on each species pair, and appends the numbers from find_all's output to the relevant csv lists.
     speciesIDs = ogSet.speciesToUse
@@ -265,10 +268,10 @@ def species_write_all(ogSet, pickleDir, resultsDir):
         if index1 >= index2: continue
         product, M = multiply(index1, index2, pickleDir)
         orthologues = find_all(product, M)
-        WriteOrthologues(resultsDir, speciesIDs[index2], speciesIDs[index1], orthologues, ogSet, nOrthologues_SpPair, index2 ,index1)   
+        WriteOrthologues(resultsDir, speciesIDs[index2], speciesIDs[index1], orthologues, ogSet, nOrthologues_SpPair, index2 ,index1, store)   
     return nOrthologues_SpPair
     
-def create_orthologue_lists(ogSet, resultsDir, dlcparResultsDir, pickleDir):
+def create_orthologue_lists(ogSet, resultsDir, dlcparResultsDir, pickleDir, store=None):
     # -> Matrices
 #    matrixDir = workingDir + "matrices_orthologues/" 
     orthodict = make_dicts(dlcparResultsDir)
@@ -279,7 +282,7 @@ def create_orthologue_lists(ogSet, resultsDir, dlcparResultsDir, pickleDir):
         one_to_one_efficient(orthodict, genenumbers, speciesLabels, iSpecies, pickleDir)
         
     # -> csv files
-    nOrthologues_SpPair = species_write_all(ogSet, pickleDir, resultsDir)
+    nOrthologues_SpPair = species_write_all(ogSet, pickleDir, resultsDir, store)
     for fn in glob.glob(pickleDir + "ortholog_*.pic"):
         if os.path.exists(fn): os.remove(fn)
     return nOrthologues_SpPair
@@ -16,10 +16,27 @@ import argparse
 import operator
 import itertools
 import multiprocessing as mp
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 
 import tree as tree_lib
 import resolve, util, files
+import orthologue_store
+import tree_cache
+
+maxBufferedBytesDefault = 200*1024*1024  # memory budget for the orthologue text waiting to be written
+maxOpenFilesDefault = 256
+nOgChunk = 100         # orthogroups per process dispatched at once, bounds the results waiting to be written in order
+
+def BufferedFilesLimits():
+    """
+    (maxBufferedBytes, maxOpenFiles) for the BufferedFiles the orthologues are written with, from this machine's 
+    memory and open file limit (ulimit -n). A 20th of the memory and half of the file limit are used, leaving the rest 
+    for the analysis, the defaults are used if the limits aren't known.
+    """
+    nBytes, nFiles = util.SystemLimits()
+    maxBufferedBytes = maxBufferedBytesDefault if nBytes is None else max(nBytes // 20, 1024*1024)
+    maxOpenFiles = maxOpenFilesDefault if nFiles is None else max(nFiles // 2, 8)
+    return maxBufferedBytes, maxOpenFiles
 
 def GeneToSpecies_dash(g):
   return g.split("_", 1)[0]
@@ -38,21 +55,47 @@ def GeneToSpecies_dot(g):
 def GeneToSpecies_hyphen(g):
   return g.split("-", 1)[0]  
     
-class RootMap(object):
-    def __init__(self, setA, setB, GeneToSpecies):
-        self.setA = setA
-        self.setB = setB
-        self.GeneToSpecies = GeneToSpecies
-        
-    def GeneMap(self, gene_name):
-        sp = self.GeneToSpecies(gene_name)
-        if sp in self.setA: return True 
-        elif sp in self.setB: return False
-        else: 
-            print(gene_name)
-            print(sp)
-            raise Exception
-        
+class SpeciesTreeIndex(object):
+    """
+    The species in a rooted species tree as bits and the species below each node as a bitmask, so that the clades of
+    the species tree can be compared with those of the gene trees using integer operations. The species tree mustn't be
+    changed after it is built.
+    """
+    def __init__(self, species_tree_rooted):
+        self.tree = species_tree_rooted
+        self.bits = dict()      # species -> bit
+        self.mask = dict()      # node -> bitmask of species
+        for n in species_tree_rooted.traverse('postorder'):
+            if n.is_leaf():
+                if n.name not in self.bits: self.bits[n.name] = 1 << len(self.bits)
+                self.mask[n] = self.bits[n.name]
+            else:
+                m = 0
+                for c in n.children: m |= self.mask[c]
+                self.mask[n] = m
+
+    def Mask(self, species):
+        """ The bitmask of a collection of species """
+        m = 0
+        for sp in species: m |= self.bits[sp]
+        return m
+
+    def LCA(self, mask):
+        """ The smallest clade of the species tree containing all the species in the mask """
+        n = self.tree
+        while True:
+            below = [ch for ch in n.children if self.mask[ch] & mask]
+            if len(below) != 1: return n
+            n = below[0]
+
+_speciesTreeIndexes = dict()    # the SpeciesTreeIndex for each species tree, built before processes are forked are shared by them
+
+def GetSpeciesTreeIndex(species_tree_rooted):
+    """ The SpeciesTreeIndex for the species tree, built the first time it's requested by this process """
+    if species_tree_rooted not in _speciesTreeIndexes:
+        _speciesTreeIndexes[species_tree_rooted] = SpeciesTreeIndex(species_tree_rooted)
+    return _speciesTreeIndexes[species_tree_rooted]
+
 def StoreSpeciesSets(t, GeneMap, tag="sp_"):
     tag_up = tag + "up"
     tag_down = tag + "down"  
@@ -77,10 +120,12 @@ def StoreSpeciesSets(t, GeneMap, tag="sp_"):
                 node.add_feature(tag_up, parent.__getattribute__(tag_up).union(sp_downs))
     t.add_feature(tag_down, set.union(*[ch.__getattribute__(tag_down) for ch in t.get_children()]))
 
-def OutgroupIngroupSeparationScore(sp_up, sp_down, sett1, sett2, N_recip, n1, n2):
-    f_dup = len(sp_up.intersection(sett1)) * len(sp_up.intersection(sett2)) * len(sp_down.intersection(sett1)) * len(sp_down.intersection(sett2)) * N_recip
-    f_a = len(sp_up.intersection(sett1)) * (n2-len(sp_up.intersection(sett2))) * (n1-len(sp_down.intersection(sett1))) * len(sp_down.intersection(sett2)) * N_recip
-    f_b = (n1-len(sp_up.intersection(sett1))) * len(sp_up.intersection(sett2)) * len(sp_down.intersection(sett1)) * (n2-len(sp_down.intersection(sett2))) * N_recip
+def OutgroupIngroupSeparationScore(sp_up, sp_down, t1, t2, N_recip, n1, n2):
+    """ sp_up, sp_down, t1 & t2 are bitmasks of species """
+    up1, up2, down1, down2 = [LeafIndex.NumberOfSpecies(x) for x in (sp_up & t1, sp_up & t2, sp_down & t1, sp_down & t2)]
+    f_dup = up1 * up2 * down1 * down2 * N_recip
+    f_a = up1 * (n2-up2) * (n1-down1) * down2 * N_recip
+    f_b = (n1-up1) * up2 * down1 * (n2-down2) * N_recip
     choice = (f_dup, f_a, f_b)
 #    print(choice)
     return max(choice)
@@ -97,54 +142,63 @@ def GetRoots(tree, species_tree_rooted, GeneToSpecies):
         return [next(n for n in tree)] # arbitrary root if all genes are from the same species
     
     # use species tree to find correct outgroup according to what species are present in the gene tree
-    n = species_tree_rooted
-    children = n.get_children()
-    leaves = [set(ch.get_leaf_names()) for ch in children]
-    have = [len(l.intersection(speciesObserved)) != 0 for l in leaves]
-    while sum(have) < 2:
-        n = children[have.index(True)]
-        children = n.get_children()
-        leaves = [set(ch.get_leaf_names()) for ch in children]
-        have = [len(l.intersection(speciesObserved)) != 0 for l in leaves]
+    index = GetSpeciesTreeIndex(species_tree_rooted)
+    n = index.LCA(index.Mask(speciesObserved))
+    clades_st = [index.mask[ch] for ch in n.children]
+    
+    # the species below (sp_down) and not below (sp_up) each node of the gene tree, as bitmasks
+    sp_down = dict()
+    sp_up = dict()
+    for m in tree.traverse('postorder'):
+        if m.is_leaf():
+            sp_down[m] = index.bits[GeneToSpecies(m.name)]
+        else:
+            x = 0
+            for ch in m.children: x |= sp_down[ch]
+            sp_down[m] = x
+    for m in tree.traverse('preorder'):
+        if m.is_root():
+            sp_up[m] = 0
+        else:
+            x = sp_up[m.up]
+            for ch in m.up.children:
+                if ch is not m: x |= sp_down[ch]
+            sp_up[m] = x
 
     # Get splits to look for
     roots_list = []
     scores_list = []   # the fraction completeness of the two clades
-#    roots_set = set()
-    for i in xrange(len(leaves)):
-        t1 = leaves[i]
-        t2 = set.union(*[l for j,l in enumerate(leaves) if j!=i])
+    for i in xrange(len(clades_st)):
+        t1 = clades_st[i]
+        t2 = 0
+        for j, x in enumerate(clades_st):
+            if j != i: t2 |= x
         # G - set of species in gene tree
         # First relevant split in species tree is (A,B), such that A \cap G \neq \emptyset and A \cap G \neq \emptyset
-        # label all nodes in gene tree according the whether subsets of A, B or both lie below node
-        StoreSpeciesSets(tree, GeneToSpecies)   # sets of species
-        root_mapper = RootMap(t1, t2, GeneToSpecies)    
-        sett1 = set(t1)
-        sett2 = set(t2)
-        nt1 = float(len(t1))
-        nt2 = float(len(t2))
+        # label all nodes in gene tree according the whether subsets of A (T), B (F) or both (TF) lie below node
+        nt1 = float(LeafIndex.NumberOfSpecies(t1))
+        nt2 = float(LeafIndex.NumberOfSpecies(t2))
         N_recip = 1./(nt1*nt1*nt2*nt2)
-        GeneMap = root_mapper.GeneMap
-        StoreSpeciesSets(tree, GeneMap, "inout_") # ingroup/outgroup identification
+        T, F, TF = 1, 2, 3
+        inout_down = {m:(T if x & t1 else 0) | (F if x & t2 else 0) for m, x in sp_down.items()}
+        inout_up = {m:(T if x & t1 else 0) | (F if x & t2 else 0) for m, x in sp_up.items()}
         # find all possible locations in the gene tree at which the root should be
-
-        T = {True,}
-        F = {False,}
-        TF = set([True, False])
         for m in tree.traverse('postorder'):
+            up = inout_up[m]
             if m.is_leaf(): 
-                if len(m.inout_up) == 1 and m.inout_up != m.inout_down:
+                if (up == T or up == F) and up != inout_down[m]:
                     # this is the unique root
                     return [m]
             else:
-                if len(m.inout_up) == 1 and len(m.inout_down) == 1 and m.inout_up != m.inout_down:
+                down = inout_down[m]
+                if (up == T or up == F) and (down == T or down == F) and up != down:
                     # this is the unique root
                     return [m]
                 nodes = m.get_children() if m.is_root() else [m] + m.get_children()
-                clades = [ch.inout_down for ch in nodes] if m.is_root() else ([m.inout_up] + [ch.inout_down for ch in m.get_children()])
+                clades = [inout_down[ch] for ch in nodes] if m.is_root() else ([up] + [inout_down[ch] for ch in m.get_children()])
                 # do we have the situation A | B or (A,B),S?
                 if len(nodes) == 3:
-                    if all([len(c) == 1 for c in clades]) and T in clades and F in clades:
+                    if all([c == T or c == F for c in clades]) and T in clades and F in clades:
                         # unique root
                         if clades.count(T) == 1:
                             return [nodes[clades.index(T)]]
@@ -152,28 +206,21 @@ def GetRoots(tree, species_tree_rooted, GeneToSpecies):
                             return [nodes[clades.index(F)]]
                     elif T in clades and F in clades:
                         #AB-(A,B) or B-(AB,A)
-                        ab = [c == TF for c in clades]
-                        i = ab.index(True)
-                        roots_list.append(nodes[i])
-                        sp_down = nodes[i].sp_down
-                        sp_up = nodes[i].sp_up
-#                        print(m)
-                        scores_list.append(OutgroupIngroupSeparationScore(sp_up, sp_down, sett1, sett2, N_recip, nt1, nt2))
+                        k = clades.index(TF)
+                        roots_list.append(nodes[k])
+                        scores_list.append(OutgroupIngroupSeparationScore(sp_up[nodes[k]], sp_down[nodes[k]], t1, t2, N_recip, nt1, nt2))
                     elif clades.count(TF) >= 2:  
                         # (A,A,A)-excluded, (A,A,AB)-ignore as want A to be bigest without including B, (A,AB,AB), (AB,AB,AB) 
-                        i = 0
-                        roots_list.append(nodes[i])
-                        sp_down = nodes[i].sp_down
-                        sp_up = nodes[i].sp_up
-#                        print(m)
-                        scores_list.append(OutgroupIngroupSeparationScore(sp_up, sp_down, sett1, sett2, N_recip, nt1, nt2))
+                        roots_list.append(nodes[0])
+                        scores_list.append(OutgroupIngroupSeparationScore(sp_up[nodes[0]], sp_down[nodes[0]], t1, t2, N_recip, nt1, nt2))
                 elif T in clades and F in clades:
                     roots_list.append(m)
                     scores_list.append(0)  # last choice
     # If we haven't found a unique root then use the scores for completeness of ingroup/outgroup to root
     if len(roots_list) == 0: 
         return [] # This shouldn't occur
-    return [sorted(zip(scores_list, roots_list), reverse=True)[0][1]]
+    # the first of the best scoring roots
+    return [roots_list[max(xrange(len(scores_list)), key=lambda k: scores_list[k])]]
                 
 def WriteQfO2(orthologues_list_pairs_list, outfilename, qAppend = True):
     """ takes a list where each entry is a pair, (genes1, genes2), which are orthologues of one another
@@ -198,12 +245,59 @@ def GetGeneToSpeciesMap(args):
         GeneToSpecies = GeneToSpecies_hyphen  
     return GeneToSpecies
   
-def OverlapSize(node, GeneToSpecies):  
-    descendents = [{GeneToSpecies(l) for l in n.get_leaf_names()} for n in node.get_children()]
-    intersection = descendents[0].intersection(descendents[1])
-    return len(intersection), intersection, descendents[0], descendents[1]
+class LeafIndex(object):
+    """
+    The leaves of a tree in a single list, in the order of get_leaf_names, so that the leaves below each node are a slice 
+    of it, and the species below each node as a bitmask. Built in one postorder pass, so the tree mustn't be changed 
+    afterwards.
+    """
+    def __init__(self, tree, GeneToSpecies):
+        self.leaves = []        # leaf names
+        self.leafNodes = []
+        self.species = []       # the species for each bit
+        self.range = dict()     # node -> (start, end) in leaves
+        self.mask = dict()      # node -> bitmask of species
+        bits = dict()
+        for n in tree.traverse('postorder'):
+            if n.is_leaf():
+                sp = GeneToSpecies(n.name)
+                if sp not in bits:
+                    bits[sp] = 1 << len(self.species)
+                    self.species.append(sp)
+                self.range[n] = (len(self.leaves), len(self.leaves) + 1)
+                self.mask[n] = bits[sp]
+                self.leaves.append(n.name)
+                self.leafNodes.append(n)
+            else:
+                ch = n.children
+                self.range[n] = (self.range[ch[0]][0], self.range[ch[-1]][1])
+                m = 0
+                for c in ch: m |= self.mask[c]
+                self.mask[n] = m
+                
+    def LeafNames(self, node):
+        start, end = self.range[node]
+        return self.leaves[start:end]
+        
+    def LeafNodes(self, node):
+        start, end = self.range[node]
+        return self.leafNodes[start:end]
+        
+    def Species(self, mask):
+        """ The set of species in a bitmask """
+        return {sp for i, sp in enumerate(self.species) if (mask >> i) & 1}
+        
+    @staticmethod
+    def NumberOfSpecies(mask):
+        return bin(mask).count("1")
 
-def ResolveOverlap(overlap, sp0, sp1, ch, tree, neighbours, GeneToSpecies, relOverlapCutoff=4):
+def OverlapSize(node, GeneToSpecies, leafIndex=None):  
+    if leafIndex is None: leafIndex = LeafIndex(node, GeneToSpecies)
+    m0, m1 = [leafIndex.mask[n] for n in node.get_children()]
+    intersection = leafIndex.Species(m0 & m1)
+    return len(intersection), intersection, leafIndex.Species(m0), leafIndex.Species(m1)
+
+def ResolveOverlap(overlap, sp0, sp1, ch, tree, neighbours, GeneToSpecies, relOverlapCutoff=4, leafIndex=None):
     """
     Is an overlap suspicious and if so can ift be resolved by identifying genes that are out of place?
     Args:
@@ -213,6 +307,7 @@ def ResolveOverlap(overlap, sp0, sp1, ch, tree, neighbours, GeneToSpecies, relOv
         ch - the two child nodes
         tree - the gene tree
         neighbours - dictionary species->neighbours, where neighbours is a list of the sets of species observed at successive topological distances from the species
+        leafIndex - LeafIndex for tree, if None it will be created
     Returns:
         qSuccess - has the overlap been resolved
         genes_removed - the out-of-place genes that have been removed so as to resolve the overlap
@@ -226,25 +321,23 @@ def ResolveOverlap(overlap, sp0, sp1, ch, tree, neighbours, GeneToSpecies, relOv
     if relOverlapCutoff*oSize >= len(sp0) and relOverlapCutoff*oSize >= len(sp1): return False, []
     # The overlap looks suspect, misplaced genes?
     # for each species, we'd need to be able to determine that all genes from A or all genes from B are misplaced
+    if leafIndex is None: leafIndex = LeafIndex(tree, GeneToSpecies)
+    mask = leafIndex.mask
     genes_removed = []
     nA_removed = 0
     nB_removed = 0
     qResolved = True
     for sp in overlap:
-        A = [g for g in ch[0].get_leaf_names() if GeneToSpecies(g) == sp]
-        B = [g for g in ch[1].get_leaf_names() if GeneToSpecies(g) == sp]
+        A = [g for g in leafIndex.LeafNodes(ch[0]) if GeneToSpecies(g.name) == sp]
+        B = [g for g in leafIndex.LeafNodes(ch[1]) if GeneToSpecies(g.name) == sp]
         A_levels = []
         B_levels = []
         for X, level in zip((A,B),(A_levels, B_levels)):
-            for g in X:
-                gene_node = tree & g
+            for gene_node in X:
                 r = gene_node.up
-                nextSpecies = set([GeneToSpecies(gg) for gg in r.get_leaf_names()])
-                while len(nextSpecies) == 1:
+                while mask[r] == mask[gene_node]:
                     r = r.up
-                    nextSpecies = set([GeneToSpecies(gg) for gg in r.get_leaf_names()])
-#                print((g, sp,nextSpecies))
-                nextSpecies.remove(sp)
+                nextSpecies = leafIndex.Species(mask[r] & ~mask[gene_node])
                 # get the level
                 # the sum of the closest and furthest expected distance toplological distance for the closest genes in the gene tree (based on species tree topology)
                 neigh = neighbours[sp]
@@ -254,10 +347,10 @@ def ResolveOverlap(overlap, sp0, sp1, ch, tree, neighbours, GeneToSpecies, relOv
         qRemoveB = max(A_levels) < min(B_levels)                            
         if qRemoveA and relOverlapCutoff*oSize < len(sp0):
             nA_removed += len(A_levels)
-            genes_removed.extend(A)
+            genes_removed.extend([g.name for g in A])
         elif qRemoveB and relOverlapCutoff*oSize < len(sp1):
             nB_removed += len(B_levels)
-            genes_removed.extend(B)
+            genes_removed.extend([g.name for g in B])
         else:
             qResolved = False
             break
@@ -281,9 +374,9 @@ def GetOrthologues_from_tree(iog, treeFN, species_tree_rooted, GeneToSpecies, ne
     orthologues = []
     if (not os.path.exists(treeFN)) or os.stat(treeFN).st_size == 0: return set(orthologues), treeFN, set()
     try:
-        tree = tree_lib.Tree(treeFN)
+        tree = tree_cache.ReadTree(treeFN)
     except:
-        tree = tree_lib.Tree(treeFN, format=3)
+        tree = tree_cache.ReadTree(treeFN, format=3)
 #    if qPrune: tree.prune(tree.get_leaf_names())
     if len(tree) == 1: return set(orthologues), tree, set()
     root = GetRoot(tree, species_tree_rooted, GeneToSpecies)
@@ -301,6 +394,9 @@ def GetOrthologues_from_tree(iog, treeFN, species_tree_rooted, GeneToSpecies, ne
     tree.name = "n0"
     suspect_genes = set()
     empty_set = set()
+    leafIndex = LeafIndex(tree, GeneToSpecies)
+    mask = leafIndex.mask
+    spTreeIndex = GetSpeciesTreeIndex(species_tree_rooted)
     # preorder traverse so that suspect genes can be identified first, before their closer ortholgoues are proposed
     for n in tree.traverse('preorder'):
         if n.is_leaf(): continue
@@ -309,27 +405,27 @@ def GetOrthologues_from_tree(iog, treeFN, species_tree_rooted, GeneToSpecies, ne
             iNode += 1
         ch = n.get_children()
         if len(ch) == 2: 
-            oSize, overlap, sp0, sp1 = OverlapSize(n, GeneToSpecies)
-            if oSize != 0:
-                qResolved, misplaced_genes = ResolveOverlap(overlap, sp0, sp1, ch, tree, neighbours, GeneToSpecies)
+            qOverlap = (mask[ch[0]] & mask[ch[1]]) != 0
+            if qOverlap:
+                oSize, overlap, sp0, sp1 = OverlapSize(n, GeneToSpecies, leafIndex)
+                qResolved, misplaced_genes = ResolveOverlap(overlap, sp0, sp1, ch, tree, neighbours, GeneToSpecies, leafIndex=leafIndex)
             else:
                 misplaced_genes = empty_set
-            if oSize != 0 and not qResolved:
+            if qOverlap and not qResolved:
                 if dupsWriter != None:
                     sp_present = sp0.union(sp1)
+                    stNode = spTreeIndex.LCA(spTreeIndex.Mask(sp_present))
                     if len(sp_present) == 1:
-                        stNode = species_tree_rooted & next(sp for sp in sp_present)
                         isSTRIDE = "Terminal"
                     else:
-                        stNode = species_tree_rooted.get_common_ancestor(sp_present)
-                        isSTRIDE = "Non-Terminal" if all_stride_dup_genes == None else "Non-Terminal: STRIDE" if frozenset(n.get_leaf_names()) in all_stride_dup_genes else "Non-Terminal"
-                    dupsWriter.writerow(["OG%07d" % iog, spIDs[stNode.name] if len(stNode) == 1 else stNode.name, n.name, float(oSize)/(len(stNode)), isSTRIDE, ", ".join([seqIDs[g] for g in ch[0].get_leaf_names()]), ", ".join([seqIDs[g] for g in ch[1].get_leaf_names()])]) 
+                        isSTRIDE = "Non-Terminal" if all_stride_dup_genes == None else "Non-Terminal: STRIDE" if frozenset(leafIndex.LeafNames(n)) in all_stride_dup_genes else "Non-Terminal"
+                    dupsWriter.writerow(["OG%07d" % iog, spIDs[stNode.name] if len(stNode) == 1 else stNode.name, n.name, float(oSize)/(len(stNode)), isSTRIDE, ", ".join([seqIDs[g] for g in leafIndex.LeafNames(ch[0])]), ", ".join([seqIDs[g] for g in leafIndex.LeafNames(ch[1])])]) 
             else:
                 # sort out bad genes - no orthology for all the misplaced genes at this level (misplaced_genes). 
                 # For previous levels, (suspect_genes) have their orthologues written to suspect orthologues file
                 d0 = defaultdict(list)
                 d0_sus = defaultdict(list)
-                for g in [g for g in ch[0].get_leaf_names() if g not in misplaced_genes]:
+                for g in [g for g in leafIndex.LeafNames(ch[0]) if g not in misplaced_genes]:
                     sp, seq = g.split("_")
                     if g in suspect_genes:
                         d0_sus[sp].append(seq)
@@ -338,7 +434,7 @@ def GetOrthologues_from_tree(iog, treeFN, species_tree_rooted, GeneToSpecies, ne
 #                if len(d0_sus) > 0: print(d0_sus)
                 d1 = defaultdict(list)
                 d1_sus = defaultdict(list)
-                for g in [g for g in ch[1].get_leaf_names() if g not in misplaced_genes]:
+                for g in [g for g in leafIndex.LeafNames(ch[1]) if g not in misplaced_genes]:
                     sp, seq = g.split("_")
                     if g in suspect_genes:
                         d1_sus[sp].append(seq)
@@ -347,12 +443,11 @@ def GetOrthologues_from_tree(iog, treeFN, species_tree_rooted, GeneToSpecies, ne
                 orthologues.append((d0, d1, d0_sus, d1_sus))
                 suspect_genes.update(misplaced_genes)
         elif len(ch) > 2:
-            species = [{GeneToSpecies(l) for l in n.get_leaf_names()} for n in ch]
-            for (n0, s0), (n1, s1) in itertools.combinations(zip(ch, species), 2):
-                if len(s0.intersection(s1)) == 0:
+            for n0, n1 in itertools.combinations(ch, 2):
+                if (mask[n0] & mask[n1]) == 0:
                     d0 = defaultdict(list)
                     d0_sus = defaultdict(list)
-                    for g in n0.get_leaf_names():
+                    for g in leafIndex.LeafNames(n0):
                         sp, seq = g.split("_")
                         if g in suspect_genes:
                             d0_sus[sp].append(seq)
@@ -360,7 +455,7 @@ def GetOrthologues_from_tree(iog, treeFN, species_tree_rooted, GeneToSpecies, ne
                             d0[sp].append(seq)
                     d1 = defaultdict(list)
                     d1_sus = defaultdict(list)
-                    for g in n1.get_leaf_names():
+                    for g in leafIndex.LeafNames(n1):
                         sp, seq = g.split("_")
                         if g in suspect_genes:
                             d1_sus[sp].append(seq)
@@ -373,7 +468,70 @@ def GetOrthologues_from_tree(iog, treeFN, species_tree_rooted, GeneToSpecies, ne
         WriteQfO2(orthologues, directory + "/../Orthologues_M3/" + os.path.split(treeFN)[1], qAppend=False)
     return orthologues, tree, suspect_genes
 
-def AppendOrthologuesToFiles(orthologues_alltrees, speciesDict, iSpeciesToUse, sequenceDict, resultsDir, qContainsSuspectOlogs):
+class BufferedFiles(object):
+    """
+    Appends to many files at once. The text is kept in memory, up to maxBufferedBytes in total across all the files, and
+    then written out with one sequential write per file. At most maxOpenFiles are kept open, the least recently used 
+    is closed first.
+    """
+    def __init__(self, maxBufferedBytes=maxBufferedBytesDefault, maxOpenFiles=maxOpenFilesDefault):
+        self.maxBufferedBytes = maxBufferedBytes
+        self.maxOpenFiles = maxOpenFiles
+        self.buffers = defaultdict(list)
+        self.nBytes = 0
+        self.handles = OrderedDict()
+        self.writers = dict()
+        
+    def write(self, fn, text):
+        self.buffers[fn].append(text)
+        self.nBytes += len(text)
+        if self.nBytes > self.maxBufferedBytes: self.Flush()
+        
+    def Writer(self, fn):
+        """ A csv writer (tab delimited) that appends to the file fn """
+        if fn not in self.writers:
+            self.writers[fn] = csv.writer(BufferedFile(self, fn), delimiter="\t")
+        return self.writers[fn]
+        
+    def Flush(self):
+        for fn in sorted(self.buffers):
+            self.Handle(fn).write("".join(self.buffers[fn]))
+        self.buffers = defaultdict(list)
+        self.nBytes = 0
+        
+    def Handle(self, fn):
+        if fn in self.handles:
+            fh = self.handles.pop(fn)
+        else:
+            if len(self.handles) >= self.maxOpenFiles:
+                _, fh_lru = self.handles.popitem(last=False)
+                fh_lru.close()
+            fh = open(fn, 'ab')
+        self.handles[fn] = fh
+        return fh
+        
+    def Close(self):
+        self.Flush()
+        for fh in self.handles.values():
+            fh.close()
+        self.handles = OrderedDict()
+        
+class BufferedFile(object):
+    """ File-like object for one of the files of a BufferedFiles """
+    def __init__(self, bufferedFiles, fn):
+        self.bufferedFiles = bufferedFiles
+        self.fn = fn
+        
+    def write(self, text):
+        self.bufferedFiles.write(self.fn, text)
+
+def AppendOrthologuesToFiles(orthologues_alltrees, speciesDict, iSpeciesToUse, sequenceDict, resultsDir, qContainsSuspectOlogs, outputFiles=None, store=None):
+    """
+    outputFiles - BufferedFiles to append to, if None the files are written to before returning
+    store - OrthologueStoreWriter to add the orthologues to as well, or None
+    """
+    qCloseFiles = outputFiles is None
+    if qCloseFiles: outputFiles = BufferedFiles()
     # Sort the orthologues according to speices pairs
     sp_to_index = {str(sp):i for i, sp in enumerate(iSpeciesToUse)}
     nOrtho = util.nOrtho_sp(len(iSpeciesToUse))   
@@ -388,8 +546,7 @@ def AppendOrthologuesToFiles(orthologues_alltrees, speciesDict, iSpeciesToUse, s
     for i in xrange(nSpecies):
         sp0 = str(iSpeciesToUse[i])
         if qContainsSuspectOlogs: 
-            outfile1_sus = open(dSuspect + "%s.tsv" % speciesDict[sp0], 'ab')
-            writer1_sus = csv.writer(outfile1_sus, delimiter="\t")
+            writer1_sus = outputFiles.Writer(dSuspect + "%s.tsv" % speciesDict[sp0])
         strsp0 = sp0 + "_"
         isp0 = sp_to_index[sp0]
         d0 = resultsDir + "Orthologues_" + speciesDict[sp0] + "/"
@@ -399,70 +556,67 @@ def AppendOrthologuesToFiles(orthologues_alltrees, speciesDict, iSpeciesToUse, s
             strsp1 = sp1 + "_"
             isp1 = sp_to_index[sp1]
             d1 = resultsDir + "Orthologues_" + speciesDict[sp1] + "/"
-            with open(d0 + '%s__v__%s.tsv' % (speciesDict[sp0], speciesDict[sp1]), 'ab') as outfile1, open(d1 + '%s__v__%s.tsv' % (speciesDict[sp1], speciesDict[sp0]), 'ab') as outfile2:
-                if qContainsSuspectOlogs:
-                    outfile2_sus = open(dSuspect + "%s.tsv" % speciesDict[sp1], 'ab')
-                    writer2_sus = csv.writer(outfile2_sus, delimiter="\t")
-                writer1 = csv.writer(outfile1, delimiter="\t")
-                writer2 = csv.writer(outfile2, delimiter="\t")
-                for iog, ortholouges_onetree in orthologues_alltrees:                   
-                    og = "OG%07d" % iog
-                    for leavesL, leavesR, leavesL_sus, leavesR_sus  in ortholouges_onetree:
-                        # suspect_genes are the genes which, for this level, the orthologues should be considered suspect as the gene appears misplaced (at this level)
-                        nL0 = len(leavesL[sp0])
-                        nR0 = len(leavesR[sp0])
-                        nL1 = len(leavesL[sp1])
-                        nR1 = len(leavesR[sp1])
-                        if nL0*nR1 + nL1*nR0 != 0: 
-                            # each species can be in only one of L and R at most: they might both be in the same half
-                            if nL0 > 0:
-                                # then nR0 == 0 so nR1 > 0 since checked (nL0*nR1 + nL1*nR0 != 0)
-                                n0 = nL0
-                                n1 = nR1
-                                text0 = ", ".join([sequenceDict[strsp0 + g] for g in leavesL[sp0]])
-                                text1 = ", ".join([sequenceDict[strsp1 + g] for g in leavesR[sp1]])
-                            else:
-                                n0 = nR0
-                                n1 = nL1
-                                text0 = ", ".join([sequenceDict[strsp0 + g] for g in leavesR[sp0]])
-                                text1 = ", ".join([sequenceDict[strsp1 + g] for g in leavesL[sp1]])
-                            writer1.writerow((og, text0, text1))
-                            writer2.writerow((og, text1, text0))
-                            nOrtho.n[isp0, isp1] += n0
-                            nOrtho.n[isp1, isp0] += n1
-                            if n0 == 1 and n1 == 1:
-                                nOrtho.n_121[isp0, isp1] += 1
-                                nOrtho.n_121[isp1, isp0] += 1
-                            elif n0 == 1:
-                                nOrtho.n_12m[isp0, isp1] += 1
-                                nOrtho.n_m21[isp1, isp0] += n1
-                            elif n1 == 1:
-                                nOrtho.n_m21[isp0, isp1] += n0
-                                nOrtho.n_12m[isp1, isp0] += 1
-                            else:
-                                nOrtho.n_m2m[isp0, isp1] += n0
-                                nOrtho.n_m2m[isp1, isp0] += n1
-                        # Write suspect orthologues
-                        if not qContainsSuspectOlogs: continue
-                        nL0s = len(leavesL_sus[sp0])
-                        nR0s = len(leavesR_sus[sp0])
-                        nL1s = len(leavesL_sus[sp1])
-                        nR1s = len(leavesR_sus[sp1])
-                        if nL0s*(nR1+nR1s) + (nL1+nL1s)*nR0s != 0: 
-                            # each species can be in only one of L and R at most: they might both be in the same half
-                            if nL0s > 0:
-                                # then nR0 == 0 so nR1 > 0 since checked (nL0*nR1 + nL1*nR0 != 0)
-                                text0 = ", ".join([sequenceDict[strsp0 + g] for g in leavesL_sus[sp0]])
-                                text1 = ", ".join([sequenceDict[strsp1 + g] for g in leavesR[sp1]+leavesR_sus[sp1]])
-                            else:
-                                text0 = ", ".join([sequenceDict[strsp0 + g] for g in leavesR_sus[sp0]])
-                                text1 = ", ".join([sequenceDict[strsp1 + g] for g in leavesL[sp1]+leavesL_sus[sp1]])
-                            writer1_sus.writerow((og, text0, text1))
-                            writer2_sus.writerow((og, text1, text0))
-                if qContainsSuspectOlogs:
-                    outfile2_sus.close()
-        if qContainsSuspectOlogs:
-            outfile1_sus.close()
+            if qContainsSuspectOlogs:
+                writer2_sus = outputFiles.Writer(dSuspect + "%s.tsv" % speciesDict[sp1])
+            writer1 = outputFiles.Writer(d0 + '%s__v__%s.tsv' % (speciesDict[sp0], speciesDict[sp1]))
+            writer2 = outputFiles.Writer(d1 + '%s__v__%s.tsv' % (speciesDict[sp1], speciesDict[sp0]))
+            for iog, ortholouges_onetree in orthologues_alltrees:                   
+                og = "OG%07d" % iog
+                for leavesL, leavesR, leavesL_sus, leavesR_sus  in ortholouges_onetree:
+                    # suspect_genes are the genes which, for this level, the orthologues should be considered suspect as the gene appears misplaced (at this level)
+                    nL0 = len(leavesL[sp0])
+                    nR0 = len(leavesR[sp0])
+                    nL1 = len(leavesL[sp1])
+                    nR1 = len(leavesR[sp1])
+                    if nL0*nR1 + nL1*nR0 != 0: 
+                        # each species can be in only one of L and R at most: they might both be in the same half
+                        if nL0 > 0:
+                            # then nR0 == 0 so nR1 > 0 since checked (nL0*nR1 + nL1*nR0 != 0)
+                            n0 = nL0
+                            n1 = nR1
+                            genes0, genes1 = leavesL[sp0], leavesR[sp1]
+                        else:
+                            n0 = nR0
+                            n1 = nL1
+                            genes0, genes1 = leavesR[sp0], leavesL[sp1]
+                        text0 = ", ".join([sequenceDict[strsp0 + g] for g in genes0])
+                        text1 = ", ".join([sequenceDict[strsp1 + g] for g in genes1])
+                        writer1.writerow((og, text0, text1))
+                        writer2.writerow((og, text1, text0))
+                        if store != None: store.Add(iog, int(sp0), map(int, genes0), int(sp1), map(int, genes1))
+                        nOrtho.n[isp0, isp1] += n0
+                        nOrtho.n[isp1, isp0] += n1
+                        if n0 == 1 and n1 == 1:
+                            nOrtho.n_121[isp0, isp1] += 1
+                            nOrtho.n_121[isp1, isp0] += 1
+                        elif n0 == 1:
+                            nOrtho.n_12m[isp0, isp1] += 1
+                            nOrtho.n_m21[isp1, isp0] += n1
+                        elif n1 == 1:
+                            nOrtho.n_m21[isp0, isp1] += n0
+                            nOrtho.n_12m[isp1, isp0] += 1
+                        else:
+                            nOrtho.n_m2m[isp0, isp1] += n0
+                            nOrtho.n_m2m[isp1, isp0] += n1
+                    # Write suspect orthologues
+                    if not qContainsSuspectOlogs: continue
+                    nL0s = len(leavesL_sus[sp0])
+                    nR0s = len(leavesR_sus[sp0])
+                    nL1s = len(leavesL_sus[sp1])
+                    nR1s = len(leavesR_sus[sp1])
+                    if nL0s*(nR1+nR1s) + (nL1+nL1s)*nR0s != 0: 
+                        # each species can be in only one of L and R at most: they might both be in the same half
+                        if nL0s > 0:
+                            # then nR0 == 0 so nR1 > 0 since checked (nL0*nR1 + nL1*nR0 != 0)
+                            genes0, genes1 = leavesL_sus[sp0], leavesR[sp1]+leavesR_sus[sp1]
+                        else:
+                            genes0, genes1 = leavesR_sus[sp0], leavesL[sp1]+leavesL_sus[sp1]
+                        text0 = ", ".join([sequenceDict[strsp0 + g] for g in genes0])
+                        text1 = ", ".join([sequenceDict[strsp1 + g] for g in genes1])
+                        writer1_sus.writerow((og, text0, text1))
+                        writer2_sus.writerow((og, text1, text0))
+                        if store != None: store.Add(iog, int(sp0), map(int, genes0), int(sp1), map(int, genes1), orthologue_store.XENOLOGUE)
+    if qCloseFiles: outputFiles.Close()
     return nOrtho   
                                       
 def Resolve(tree, GeneToSpecies):
@@ -523,8 +677,58 @@ def GetOrthologuesStandalone_Serial(trees_dir, species_tree_rooted_fn, GeneToSpe
         print(treeFn)
         GetOrthologues_from_tree(0, treeFn, species_tree_rooted, GeneToSpecies, neighbours, True)        
         
-def DoOrthologuesForOrthoFinder(ogSet, species_tree_rooted_fn, GeneToSpecies, all_stride_dup_genes, qNoRecon):   
+class RowsWriter(object):
+    """ Takes the place of a csv.writer, keeping the rows so they can be written out later """
+    def __init__(self):
+        self.rows = []
+        
+    def writerow(self, row):
+        self.rows.append(row)
+
+_og_args = None     # the arguments shared by all orthogroups, set once per worker process
+
+def Worker_InitOrthologues(args):
+    global _og_args
+    _og_args = args
+
+def GetOrthologues_ForOG(iog):
     """
+    Infer the orthologues for one orthogroup and write its resolved tree, unless it is going into an archive
+    Returns:
+        iog, orthologues, suspect_genes, the rows for the duplications file, the resolved tree text to be written or None
+    """
+    species_tree_rooted, GeneToSpecies, neighbours, seqIDs, spIDs, all_stride_dup_genes, qNoRecon, reconTreesWriter = _og_args
+    dupWriter = RowsWriter()
+    orthologues, recon_tree, suspect_genes = GetOrthologues_from_tree(iog, files.FileHandler.GetOGsTreeFN(iog), species_tree_rooted, GeneToSpecies, neighbours, dupsWriter=dupWriter, seqIDs=seqIDs, spIDs=spIDs, all_stride_dup_genes=all_stride_dup_genes, qNoRecon=qNoRecon)
+    # don't relabel nodes, they've already been done
+    text = util.RenameTreeTaxa_Text(recon_tree, seqIDs, qSupport=False, qFixNegatives=True)
+    if text != None and not reconTreesWriter.qPack:
+        reconTreesWriter.Write("OG%07d_tree.txt" % iog, text)
+        text = None
+    return iog, orthologues, suspect_genes, dupWriter.rows, text
+
+def InOrder(results, iNext=0):
+    """ Yield results (iog, ...) received in any order in order of iog, starting from iNext """
+    pending = dict()
+    for result in results:
+        pending[result[0]] = result
+        while iNext in pending:
+            yield pending.pop(iNext)
+            iNext += 1
+        
+def SizeSortedChunks(sizes, nChunk):
+    """ The indices of sizes in consecutive chunks of (up to) nChunk, each chunk sorted largest first """
+    for iStart in xrange(0, len(sizes), nChunk):
+        chunk = range(iStart, min(iStart + nChunk, len(sizes)))
+        yield sorted(chunk, key=lambda i: sizes[i], reverse=True)
+
+def DoOrthologuesForOrthoFinder(ogSet, species_tree_rooted_fn, GeneToSpecies, all_stride_dup_genes, qNoRecon, nProcesses=1, store=None, bufferLimits=(maxBufferedBytesDefault, maxOpenFilesDefault)):   
+    """
+    nProcesses - the orthogroups are analysed in parallel if greater than 1, in chunks of consecutive orthogroups 
+                 with the largest in a chunk first. The results are written in orthogroup order so the output is the 
+                 same as with a single process, at most a chunk of them are held waiting to be written.
+    store - OrthologueStoreWriter to add the orthologues to as well, or None
+    bufferLimits - (maxBufferedBytes, maxOpenFiles) for writing the orthologue files, see BufferedFilesLimits
     """
      # Create directory structure
     speciesDict = ogSet.SpeciesDict()
@@ -552,37 +756,56 @@ def DoOrthologuesForOrthoFinder(ogSet, species_tree_rooted_fn, GeneToSpecies, al
         if (not n.is_leaf()) and (not n.is_root()):
             n.name = "N%d" % iNode
             iNode += 1
-    nOgs = len(ogSet.OGs())
+    ogs = ogSet.OGs()
+    nOgs = len(ogs)
     nOrthologues_SpPair = util.nOrtho_sp(nspecies) 
     species = speciesDict.keys()
-    reconTreesRenamedDir = files.FileHandler.GetOGsReconTreeDir(True)
-    with open(files.FileHandler.GetDuplicationsFN(), 'wb') as outfile:
-        dupWriter = csv.writer(outfile, delimiter="\t")
-        dupWriter.writerow(["Orthogroup", "Species Tree Node", "Gene Tree Node", "Support", "Type",	"Genes 1", "Genes 2"])
-        for iog in xrange(nOgs):
-            orthologues, recon_tree, suspect_genes = GetOrthologues_from_tree(iog, files.FileHandler.GetOGsTreeFN(iog), species_tree_rooted, GeneToSpecies, neighbours, dupsWriter=dupWriter, seqIDs=ogSet.Spec_SeqDict(), spIDs=ogSet.SpeciesDict(), all_stride_dup_genes=all_stride_dup_genes, qNoRecon=qNoRecon)
-            qContainsSuspectGenes = len(suspect_genes) > 0
-            if (not qInitialisedSuspectGenesDirs) and qContainsSuspectGenes:
-                qInitialisedSuspectGenesDirs = True
-                dSuspectGenes = files.FileHandler.GetSuspectGenesDir()
-                dSuspectOrthologues = files.FileHandler.GetPutativeXenelogsDir()
-                for index1 in xrange(nspecies):
-                    with open(dSuspectOrthologues + '%s.tsv' % speciesDict[str(speciesIDs[index1])], 'wb') as outfile:
-                        writer1 = csv.writer(outfile, delimiter="\t")
-                        writer1.writerow(("Orthogroup", speciesDict[str(speciesIDs[index1])], "Other"))
-            for index0 in xrange(nspecies):
-                strsp0 = species[index0]
-                strsp0_ = strsp0+"_"
-                these_genes = [g for g in suspect_genes if g.startswith(strsp0_)]
-                if len(these_genes) > 0:
-                    with open(dSuspectGenes + speciesDict[strsp0] + ".txt", 'ab') as outfile:
-                        outfile.write("\n".join([SequenceDict[g]]) + "\n")
-            allOrthologues = [(iog, orthologues)]
-            # don't relabel nodes, they've already been done
-            util.RenameTreeTaxa(recon_tree, reconTreesRenamedDir + "OG%07d_tree.txt" % iog, ogSet.Spec_SeqDict(), qSupport=False, qFixNegatives=True)
-            if iog >= 0 and divmod(iog, 10 if nOgs <= 200 else 100 if nOgs <= 2000 else 1000)[1] == 0:
-                util.PrintTime("Done %d of %d" % (iog, nOgs))
-            nOrthologues_SpPair += AppendOrthologuesToFiles(allOrthologues, speciesDict, ogSet.speciesToUse, SequenceDict, dResultsOrthologues, qContainsSuspectGenes)
+    reconTreesWriter = files.FileHandler.OGFileWriter(files.FileHandler.GetOGsReconTreeDir(True))
+    og_args = (species_tree_rooted, GeneToSpecies, neighbours, ogSet.Spec_SeqDict(), ogSet.SpeciesDict(), all_stride_dup_genes, qNoRecon, reconTreesWriter)
+    tree_cache.GetTreeCache(files.FileHandler.GetOGsTreeDir())   # load before the worker processes are forked
+    GetSpeciesTreeIndex(species_tree_rooted)                     # likewise the species tree index
+    pool = None
+    try:
+        if nProcesses > 1:
+            pool = mp.Pool(nProcesses, Worker_InitOrthologues, (og_args,))
+            chunks = SizeSortedChunks([len(og) for og in ogs], nOgChunk*nProcesses)
+            results = itertools.chain.from_iterable(InOrder(pool.imap_unordered(GetOrthologues_ForOG, chunk), min(chunk)) for chunk in chunks)
+        else:
+            Worker_InitOrthologues(og_args)
+            results = itertools.imap(GetOrthologues_ForOG, xrange(nOgs))
+        outputFiles = BufferedFiles(*bufferLimits)
+        with open(files.FileHandler.GetDuplicationsFN(), 'wb') as outfile:
+            dupWriter = csv.writer(outfile, delimiter="\t")
+            dupWriter.writerow(["Orthogroup", "Species Tree Node", "Gene Tree Node", "Support", "Type",	"Genes 1", "Genes 2"])
+            for iog, orthologues, suspect_genes, dupRows, reconTree in results:
+                dupWriter.writerows(dupRows)
+                if reconTree != None: reconTreesWriter.Write("OG%07d_tree.txt" % iog, reconTree)
+                qContainsSuspectGenes = len(suspect_genes) > 0
+                if (not qInitialisedSuspectGenesDirs) and qContainsSuspectGenes:
+                    qInitialisedSuspectGenesDirs = True
+                    dSuspectGenes = files.FileHandler.GetSuspectGenesDir()
+                    dSuspectOrthologues = files.FileHandler.GetPutativeXenelogsDir()
+                    for index1 in xrange(nspecies):
+                        with open(dSuspectOrthologues + '%s.tsv' % speciesDict[str(speciesIDs[index1])], 'wb') as outfile:
+                            writer1 = csv.writer(outfile, delimiter="\t")
+                            writer1.writerow(("Orthogroup", speciesDict[str(speciesIDs[index1])], "Other"))
+                for index0 in xrange(nspecies):
+                    strsp0 = species[index0]
+                    strsp0_ = strsp0+"_"
+                    these_genes = [g for g in suspect_genes if g.startswith(strsp0_)]
+                    if len(these_genes) > 0:
+                        outputFiles.write(dSuspectGenes + speciesDict[strsp0] + ".txt", "\n".join([SequenceDict[g]]) + "\n")
+                allOrthologues = [(iog, orthologues)]
+                if iog >= 0 and divmod(iog, 10 if nOgs <= 200 else 100 if nOgs <= 2000 else 1000)[1] == 0:
+                    util.PrintTime("Done %d of %d" % (iog, nOgs))
+                nOrthologues_SpPair += AppendOrthologuesToFiles(allOrthologues, speciesDict, ogSet.speciesToUse, SequenceDict, dResultsOrthologues, qContainsSuspectGenes, outputFiles, store)
+        outputFiles.Close()
+        reconTreesWriter.Close()
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+        reconTreesWriter.Abort()
     return nOrthologues_SpPair
 
 
@@ -595,6 +818,7 @@ def GetOrthologues_from_phyldog_tree(iog, treeFN, GeneToSpecies, qWrite=False, d
     """ At this point need to label the tree nodes """
     leaf_labels = dict()
     empty_dict = dict()
+    leafIndex = LeafIndex(tree, GeneToSpecies)
     for n in tree.traverse('preorder'):
         if n.is_leaf(): 
             leaf_labels[n.name] = ("n" + n.ND)
@@ -603,7 +827,7 @@ def GetOrthologues_from_phyldog_tree(iog, treeFN, GeneToSpecies, qWrite=False, d
             n.name = "n" + n.ND
         ch = n.get_children()
         if len(ch) == 2:       
-            oSize, overlap, sp0, sp1 = OverlapSize(n, GeneToSpecies)
+            oSize, overlap, sp0, sp1 = OverlapSize(n, GeneToSpecies, leafIndex)
             if n.Ev == "D":
                 if dupsWriter != None:
                     sp_present = sp0.union(sp1)
@@ -612,14 +836,14 @@ def GetOrthologues_from_phyldog_tree(iog, treeFN, GeneToSpecies, qWrite=False, d
                         isSTRIDE = "Terminal"
                     else:
                         isSTRIDE = "Non-Terminal"
-                    dupsWriter.writerow(["OG%07d" % iog, spIDs[stNode] if len(stNode) == 1 else stNode, n.name, "-", isSTRIDE, ", ".join([seqIDs[g] for g in ch[0].get_leaf_names()]), ", ".join([seqIDs[g] for g in ch[1].get_leaf_names()])]) 
+                    dupsWriter.writerow(["OG%07d" % iog, spIDs[stNode] if len(stNode) == 1 else stNode, n.name, "-", isSTRIDE, ", ".join([seqIDs[g] for g in leafIndex.LeafNames(ch[0])]), ", ".join([seqIDs[g] for g in leafIndex.LeafNames(ch[1])])]) 
             else:
                 d0 = defaultdict(list)
-                for g in ch[0].get_leaf_names():
+                for g in leafIndex.LeafNames(ch[0]):
                     sp, seq = g.split("_")
                     d0[sp].append(seq)
                 d1 = defaultdict(list)
-                for g in ch[1].get_leaf_names():
+                for g in leafIndex.LeafNames(ch[1]):
                     sp, seq = g.split("_")
                     d1[sp].append(seq)
                 orthologues.append((d0, d1, empty_dict, empty_dict))
@@ -631,7 +855,7 @@ def GetOrthologues_from_phyldog_tree(iog, treeFN, GeneToSpecies, qWrite=False, d
         WriteQfO2(orthologues, directory + "/../Orthologues_M3/" + os.path.split(treeFN)[1], qAppend=False)
     return orthologues
     
-def DoOrthologuesForOrthoFinder_Phyldog(ogSet, workingDirectory, GeneToSpecies, output_dir, reconTreesRenamedDir):    # Create directory structure
+def DoOrthologuesForOrthoFinder_Phyldog(ogSet, workingDirectory, GeneToSpecies, output_dir, reconTreesRenamedDir, store=None, bufferLimits=(maxBufferedBytesDefault, maxOpenFilesDefault)):    # Create directory structure
     speciesDict = ogSet.SpeciesDict()
     SequenceDict = ogSet.SequenceDict()
     # Write directory and file structure
@@ -647,17 +871,20 @@ def DoOrthologuesForOrthoFinder_Phyldog(ogSet, workingDirectory, GeneToSpecies,
                 writer1.writerow(("Orthogroup", speciesDict[str(speciesIDs[index1])], speciesDict[str(speciesIDs[index2])]))
     nOgs = len(ogSet.OGs())
     nOrthologues_SpPair = util.nOrtho_sp(nspecies) 
-    with open(files.FileHandler.GetDuplicationsFN(), 'wb') as outfile:
+    outputFiles = BufferedFiles(*bufferLimits)
+    with open(files.FileHandler.GetDuplicationsFN(), 'wb') as outfile, files.FileHandler.OGFileWriter(reconTreesRenamedDir) as reconTreesWriter:
         dupWriter = csv.writer(outfile, delimiter="\t")
         dupWriter.writerow(["Orthogroup", "Species Tree Node", "Gene Tree Node", "Support", "Type",	"Genes 1", "Genes 2"])
         for iog in xrange(nOgs):
             recon_tree = files.FileHandler.GetPhyldogOGResultsTreeFN(iog)
             orthologues = GetOrthologues_from_phyldog_tree(iog, recon_tree, GeneToSpecies, dupsWriter=dupWriter, seqIDs=ogSet.Spec_SeqDict(), spIDs=ogSet.SpeciesDict())
             allOrthologues = [(iog, orthologues)]
-            util.RenameTreeTaxa(recon_tree, reconTreesRenamedDir + "OG%07d_tree.txt" % iog, ogSet.Spec_SeqDict(), qSupport=False, qFixNegatives=True, label='n') 
+            text = util.RenameTreeTaxa_Text(recon_tree, ogSet.Spec_SeqDict(), qSupport=False, qFixNegatives=True, label='n') 
+            if text != None: reconTreesWriter.Write("OG%07d_tree.txt" % iog, text)
             if iog >= 0 and divmod(iog, 10 if nOgs <= 200 else 100 if nOgs <= 2000 else 1000)[1] == 0:
                 util.PrintTime("Done %d of %d" % (iog, nOgs))
-            nOrthologues_SpPair += AppendOrthologuesToFiles(allOrthologues, speciesDict, ogSet.speciesToUse, SequenceDict, output_dir, False)
+            nOrthologues_SpPair += AppendOrthologuesToFiles(allOrthologues, speciesDict, ogSet.speciesToUse, SequenceDict, output_dir, False, outputFiles, store)
+    outputFiles.Close()
     return nOrthologues_SpPair
     
 def RootAllTrees():
@@ -36,55 +36,57 @@ import numpy as np
 from collections import Counter, defaultdict
 
 import util, program_caller as pc
-import files
+import files, fasta_store, og_archive
 
 class FastaWriter(object):
     def __init__(self, fastaFileDir_list, speciesToUse):
         """
         The ist of previous directories could incude species that are no longer used, 
         but not ones that are conflicting
+        The sequences are read from the files as they are written, see fasta_store
         """
-        self.SeqLists = dict()
-        qFirst = True
-        accession = ""
-        sequence = ""
         required_files = set(["Species%d.fa" %i for i in speciesToUse])
+        fastaFNs = []
         for d in fastaFileDir_list:
             for fn in glob.glob(d + "Species*.fa"):
                 if os.path.basename(fn) not in required_files: continue
-                with open(fn, 'rb') as fastaFile:
-                    for line in fastaFile:
-                        if line[0] == ">":
-                            # deal with old sequence
-                            if not qFirst:
-                                self.SeqLists[accession] = sequence
-                                sequence = ""
-                            qFirst = False
-                            # get id for new sequence
-                            accession = line[1:].rstrip()
-                        else:
-                            sequence += line
-                    self.SeqLists[accession] = sequence
+                fastaFNs.append(fn)
+        self.store = fasta_store.FastaStore(fastaFNs)
     
     def WriteSeqsToFasta(self, seqs, outFilename):
-        with open(outFilename, 'wb') as outFile:
+        with util.AtomicWrite(outFilename) as outFile:
             for seq in self.SortSeqs([s.ToString() for s in seqs]):
-                if seq in self.SeqLists:
+                sequence = self.store.Sequence(seq)
+                if sequence is not None:
                     outFile.write(">%s\n" % seq)
-                    outFile.write(self.SeqLists[seq])
+                    outFile.write(sequence)
                 else:
                     print("ERROR: %s not found" % seq)
                                 
-    def WriteSeqsToFasta_withNewAccessions(self, seqs, outFilename, idDict):
-        with open(outFilename, 'wb') as outFile:
-            for seq in self.SortSeqs([s.ToString() for s in seqs]):
-                if seq in self.SeqLists:
-                    outFile.write(">%s\n" % idDict[seq])
-                    outFile.write(self.SeqLists[seq])
+    def SeqsText_withNewAccessions(self, seqs, idDict):
+        """ The fasta file text for the sequences, with the sequence IDs replaced using idDict """
+        text = []
+        for seq in self.SortSeqs([s.ToString() for s in seqs]):
+            sequence = self.store.Sequence(seq)
+            if sequence is not None:
+                text.append(">%s\n" % idDict[seq])
+                text.append(sequence)
+        return "".join(text)
                     
     def SortSeqs(self, seqs):
         return sorted(seqs, key=lambda x: map(int, x.split("_")))
 
+def RenamedAlignment(alignFN, idsDict):
+    """ The text of the alignment with the sequence IDs replaced using idsDict """
+    text = []
+    with open(alignFN, 'rb') as infile:
+        for line in infile:
+            if line.startswith(">"):
+                text.append(">" + idsDict[line[1:].rstrip()] + "\n")
+            else:
+                text.append(line)
+    return "".join(text)
+
 def WriteTestFile(workingDir):
     d = workingDir + "/_dependencies_check/"
     if not os.path.exists(d):
@@ -271,14 +273,14 @@ class TreesForOrthogroups(object):
     def GetTreeFilename(self, iOG, qResults=False):
         return files.FileHandler.GetOGsTreeFN(iOG, qResults)
         
-    def WriteFastaFiles(self, fastaWriter, ogs, idDict, qBoth):
+    def WriteFastaFiles(self, fastaWriter, ogs, idDict, qBoth, nProcesses=1):
         # The results ones are now written by default after orthogroups, check they're not already there
-        if not os.path.exists(self.GetFastaFilename(0, True)):
-            for iOg, og in enumerate(ogs):
-                fastaWriter.WriteSeqsToFasta_withNewAccessions(og, self.GetFastaFilename(iOg, True), idDict)
+        d = files.FileHandler.GetResultsSeqsDir()
+        if not og_archive.Exists(d, os.path.basename(self.GetFastaFilename(0, True))):
+            with files.FileHandler.OGFileWriter(d) as writer:
+                util.RunExportParallel_Write(fastaWriter.SeqsText_withNewAccessions, [(og, idDict) for og in ogs], [os.path.basename(self.GetFastaFilename(iOg, True)) for iOg in xrange(len(ogs))], writer, nProcesses)
         if qBoth: 
-            for iOg, og in enumerate(ogs):
-                fastaWriter.WriteSeqsToFasta(og, self.GetFastaFilename(iOg))
+            util.RunExportParallel(fastaWriter.WriteSeqsToFasta, [(og, self.GetFastaFilename(iOg)) for iOg, og in enumerate(ogs)], nProcesses)
               
     def GetAlignmentCommandsAndNewFilenames(self, ogs):
 #        if self.msa_program != "mafft":
@@ -294,23 +296,19 @@ class TreesForOrthogroups(object):
         nSeqs = [len(og) for og in ogs if len(og) >= 3]
         return self.program_caller.GetTreeCommands(self.tree_program, alignmentsForTree, outfn_list, id_list, nSeqs) 
      
-    def RenameAlignmentTaxa(self, idsAlignFNS, accAlignFNs, idsDict):
-        for i, (alignFN, outAlignFN) in enumerate(zip(idsAlignFNS, accAlignFNs)):
-            with open(alignFN, 'rb') as infile, open(outAlignFN, 'wb') as outfile:
-                for line in infile:
-                    if line.startswith(">"):
-                        outfile.write(">" + idsDict[line[1:].rstrip()] + "\n")
-                    else:
-                        outfile.write(line)
+    def RenameAlignmentTaxa(self, idsAlignFNS, accAlignFNs, idsDict, nProcesses=1):
+        """ Write the alignments, with the sequence IDs replaced, to the files accAlignFNs in the results directory """
+        with files.FileHandler.OGFileWriter(files.FileHandler.GetResultsAlignDir()) as writer:
+            util.RunExportParallel_Write(RenamedAlignment, [(alignFN, idsDict) for alignFN in idsAlignFNS], [os.path.basename(fn) for fn in accAlignFNs], writer, nProcesses)
           
     def DoTrees(self, ogs, ogMatrix, idDict, speciesIdDict, speciesToUse, nProcesses, qStopAfterSeqs, qStopAfterAlignments, qDoSpeciesTree):
         idDict.update(speciesIdDict) # smae code will then also convert concatenated alignment for species tree
         # 0       
-        resultsDirsFullPath = [files.FileHandler.GetResultsSeqsDir(), files.FileHandler.GetResultsAlignDir(), files.FileHandler.GetResultsTreesDir()]
+        resultsDirsFullPath = [files.FileHandler.OGFilesLocation(d) for d in [files.FileHandler.GetResultsSeqsDir(), files.FileHandler.GetResultsAlignDir(), files.FileHandler.GetResultsTreesDir()]]
         
         # 1.
         fastaWriter = FastaWriter(files.FileHandler.GetSpeciesSeqsDir(), speciesToUse)
-        self.WriteFastaFiles(fastaWriter, ogs, idDict, True)
+        self.WriteFastaFiles(fastaWriter, ogs, idDict, True, nProcesses)
         if qStopAfterSeqs: return resultsDirsFullPath
 
         # 3
@@ -336,7 +334,7 @@ class TreesForOrthogroups(object):
             if qDoSpeciesTree: 
                 alignmentFilesToUse.append(concatenated_algn_fn)
                 accessionAlignmentFNs.append(files.FileHandler.GetSpeciesTreeConcatAlignFN(True))
-            self.RenameAlignmentTaxa(alignmentFilesToUse, accessionAlignmentFNs, idDict)
+            self.RenameAlignmentTaxa(alignmentFilesToUse, accessionAlignmentFNs, idDict, nProcesses)
             return resultsDirsFullPath[:2]
         
         # Otherwise, alignments and trees
@@ -388,11 +386,11 @@ class TreesForOrthogroups(object):
             else:
                 text = "ERROR: Species tree inference failed"
                 files.FileHandler.LogFailAndExit(text)
-        self.RenameAlignmentTaxa(alignmentFilesToUse, accessionAlignmentFNs, idDict)
-        qHaveSupport = None
-        for i in xrange(len(treeCommands_and_filenames)):
-            infn = self.GetTreeFilename(i)
-            if os.path.exists(infn):
-                if qHaveSupport == None: qHaveSupport = util.HaveSupportValues(infn)
-                util.RenameTreeTaxa(infn, self.GetTreeFilename(i, True), idDict, qSupport=qHaveSupport, qFixNegatives=True)       
+        self.RenameAlignmentTaxa(alignmentFilesToUse, accessionAlignmentFNs, idDict, nProcesses)
+        treeFNs = [(self.GetTreeFilename(i), self.GetTreeFilename(i, True)) for i in xrange(len(treeCommands_and_filenames))]
+        treeFNs = [(infn, outfn) for infn, outfn in treeFNs if os.path.exists(infn)]
+        if len(treeFNs) > 0:
+            qHaveSupport = util.HaveSupportValues(treeFNs[0][0])
+            with files.FileHandler.OGFileWriter(files.FileHandler.GetResultsTreesDir()) as writer:
+                util.RunExportParallel_Write(util.RenameTreeTaxa_Text, [(infn, idDict, qHaveSupport, True) for infn, _ in treeFNs], [os.path.basename(outfn) for _, outfn in treeFNs], writer, nProcesses)
         return resultsDirsFullPath[:2]
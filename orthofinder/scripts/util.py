@@ -26,19 +26,22 @@
 
 
 import os
+import re
 import sys
 import time
 import numpy as np
 import subprocess
 import datetime
 import Queue
+import itertools
+import contextlib
 import multiprocessing as mp
 from collections import namedtuple
 
 nAlgDefault = 1
 nThreadsDefault = mp.cpu_count()
 
-import tree, parallel_task_manager
+import tree, newick, tree_cache, parallel_task_manager
 
 """
 Utilities
@@ -244,11 +247,79 @@ def ExampleRunMethodParallel():
     args_queue = mp.Queue()
     for i in xrange(100): args_queue.put((3,i))
     RunMethodParallel(F, args_queue, 16)
+
+_export = None      # (Function, args_list) for the export worker processes
+
+def Worker_InitExport(export):
+    global _export
+    _export = export
+
+def Worker_Export(i):
+    Function, args_list = _export
+    return Function(*args_list[i])
+
+def RunExportParallel(Function, args_list, nProcesses):
+    """
+    Calls Function(*args) for each args in args_list, e.g. to write a file for each orthogroup, using nProcesses
+    Function and args_list are inherited by the forked worker processes rather than pickled, so they can refer to 
+    large or unpicklable objects. Any exception raised by Function is raised here.
+    """
+    if nProcesses <= 1 or len(args_list) <= 1:
+        for args in args_list:
+            Function(*args)
+        return
+    pool = mp.Pool(min(nProcesses, len(args_list)), Worker_InitExport, ((Function, args_list),))
+    try:
+        pool.map(Worker_Export, xrange(len(args_list)), chunksize=max(1, len(args_list) // (10*nProcesses)))
+    finally:
+        pool.close()
+        pool.join()
+
+def WriteText(writer, fn, Function, args):
+    """ Writes the text Function(*args) to the file fn using writer, nothing is written if the text is None """
+    text = Function(*args)
+    if text is not None: writer.Write(fn, text)
+
+def RunExportParallel_Write(Function, args_list, filenames, writer, nProcesses):
+    """
+    Writes each file in filenames with writer (an og_archive.OGFileWriter), where the text of the ith file is 
+    Function(*args_list[i]), using nProcesses. Nothing is written for a file if its text is None. The worker processes
+    write the files themselves, unless they are going into an archive, which only this process writes to. 
+    """
+    if not writer.qPack:
+        RunExportParallel(WriteText, [(writer, fn, Function, args) for fn, args in zip(filenames, args_list)], nProcesses)
+        return
+    if nProcesses <= 1 or len(args_list) <= 1:
+        for fn, args in zip(filenames, args_list):
+            WriteText(writer, fn, Function, args)
+        return
+    pool = mp.Pool(min(nProcesses, len(args_list)), Worker_InitExport, ((Function, args_list),))
+    try:
+        texts = pool.imap(Worker_Export, xrange(len(args_list)), chunksize=max(1, len(args_list) // (10*nProcesses)))
+        for fn, text in itertools.izip(filenames, texts):
+            if text is not None: writer.Write(fn, text)
+    finally:
+        pool.terminate()
+        pool.join()
        
 """
 Directory and file management
 -------------------------------------------------------------------------------
-"""               
+"""
+
+@contextlib.contextmanager
+def AtomicWrite(filename):
+    """
+    with AtomicWrite(fn) as outfile: - the file is written under a temporary name and only renamed to filename once it
+    has been written without error, so an incomplete file is never left at filename
+    """
+    tempFN = filename + ".%d.tmp" % os.getpid()
+    try:
+        with open(tempFN, 'wb') as outfile:
+            yield outfile
+        os.rename(tempFN, filename)
+    finally:
+        if os.path.exists(tempFN): os.remove(tempFN)               
                
 def GetDirectoryName(baseDirName, i):
     if i == 0:
@@ -295,6 +366,20 @@ def SortArrayPairByFirst(useForSortAr, keepAlignedAr, qLargestFirst=False):
     return useForSortAr, keepAlignedAr      
 
 # Get Info from seqs IDs file?
+def SystemLimits():
+    """ (physical memory in bytes, soft limit on open files i.e. ulimit -n), either is None if it can't be determined """
+    try:
+        nBytes = os.sysconf('SC_PHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    except (AttributeError, ValueError, OSError):
+        nBytes = None
+    try:
+        import resource
+        nFiles = resource.getrlimit(resource.RLIMIT_NOFILE)[0]
+        if nFiles == resource.RLIM_INFINITY: nFiles = None
+    except (ImportError, ValueError):
+        nFiles = None
+    return nBytes, nFiles
+
 def GetSeqsInfo(inputDirectory_list, speciesToUse, nSpAll):
     seqStartingIndices = [0]
     nSeqs = 0
@@ -419,46 +504,141 @@ def HaveSupportValues(speciesTreeFN_ids):
         pass
     return qHaveSupport
 
+_illegalNewickCharsRE = re.compile("[" + newick._ILEGAL_NEWICK_CHARS + "]")
+
+def RenamedTreeText(treeFN, idsMap, qSupport, qFixNegatives=False, inFormat=None, label=None):
+    """
+    The newick text RenameTreeTaxa writes for the tree file, created directly from the tree's arrays (from the tree
+    cache or a single pass over the text, see newick.read_newick_arrays) without creating the TreeNodes. Returns None if
+    the tree can't be read in this way, e.g. it has NHX data or is in a format that needs the full newick parser.
+    """
+    cache = tree_cache.GetTreeCache(os.path.dirname(treeFN))
+    arrays = cache.Arrays(treeFN)
+    if arrays is None:
+        with open(treeFN, 'rU') as infile:
+            nw = infile.read()
+        try:
+            arrays = newick.read_newick_arrays(nw)
+        except newick.NewickError:
+            return None
+    parents, names, dists, supports, formats = arrays
+    errors = newick.array_format_errors(formats)
+    qHaveSupport = False
+    if inFormat != None:
+        format = inFormat
+    elif formats & (1 << 2):
+        format = 2
+        qHaveSupport = True
+    elif errors & (1 << 2):
+        format = 0
+    else:
+        return None
+    if not (formats & (1 << format)): return None
+    n = len(parents)
+    children = [[] for _ in xrange(n)]
+    for i in xrange(1, n):
+        children[parents[i]].append(i)
+    # the node attributes as in the tree read in the format
+    qInternalNames = newick._FAST_FORMATS[format][1][0] == "name"
+    dists = [tree.DEFAULT_DIST if d != d else d for d in dists]
+    for i in xrange(n):
+        if children[i] and not qInternalNames: names[i] = None
+        elif not children[i]: names[i] = idsMap[names[i] if names[i] != None else tree.DEFAULT_NAME]
+    if qFixNegatives or label != None:
+        levelorder = [0]
+        for i in levelorder:
+            levelorder.extend(children[i])
+    if qFixNegatives:
+        sliver = sum([dists[i] for i in levelorder[1:]]) * 1e-6
+        dists = [sliver if d < 0.0 else d for d in dists]
+    rootName = names[0] if names[0] != None else tree.DEFAULT_NAME
+    if label != None:
+        iNode = 1
+        for i in levelorder[1:]:
+            if children[i]:
+                names[i] = label + ("%d" % iNode)
+                iNode += 1
+        outFormat, rootText = 3, label + "0"
+    elif rootName == "N0" or rootName == "n0":
+        outFormat, rootText = 3, rootName
+    elif qSupport or qHaveSupport:
+        outFormat, rootText = 2, ""
+    else:
+        outFormat, rootText = 5, ""
+    def Close(j):
+        if outFormat == 2:
+            support = supports[j] if (not qInternalNames and supports[j] == supports[j]) else tree.DEFAULT_SUPPORT
+            return ")%g:%g" % (support, dists[j])
+        elif outFormat == 3:
+            return ")%s:%g" % (_illegalNewickCharsRE.sub("_", str(names[j] if names[j] != None else tree.DEFAULT_NAME)), dists[j])
+        else:
+            return "):%g" % dists[j]
+    # write it as tree.write would, in preorder closing each internal node once its last child has been written
+    text = ["("]
+    stack = [0]
+    for i in xrange(1, n):
+        while stack[-1] != parents[i]:
+            text.append(Close(stack.pop()))
+        if children[parents[i]][0] != i: text.append(",")
+        if children[i]:
+            text.append("(")
+            stack.append(i)
+        else:
+            text.append("%s:%g" % (_illegalNewickCharsRE.sub("_", str(names[i])), dists[i]))
+    while len(stack) > 1:
+        text.append(Close(stack.pop()))
+    text.append(")" + rootText + ";")
+    return "".join(text)
+
 def RenameTreeTaxa(treeFN_or_tree, newTreeFilename, idsMap, qSupport, qFixNegatives=False, inFormat=None, label=None):
+    """
+    Writes the tree with its leaves renamed using idsMap. Nothing is written for a tree file that doesn't exist or is 
+    empty, e.g. for an orthogroup too small to have a tree. A leaf that isn't in idsMap raises a KeyError.
+    """
+    text = RenameTreeTaxa_Text(treeFN_or_tree, idsMap, qSupport, qFixNegatives, inFormat, label)
+    if text != None:
+        with AtomicWrite(newTreeFilename) as outfile:
+            outfile.write(text)
+
+def RenameTreeTaxa_Text(treeFN_or_tree, idsMap, qSupport, qFixNegatives=False, inFormat=None, label=None):
+    """ The text RenameTreeTaxa writes for the tree, or None if there is no tree in the file """
     if label != None: qSupport = False
-    try:
-        if type(treeFN_or_tree) == tree.TreeNode:
-            t = treeFN_or_tree
+    qHaveSupport = False
+    if type(treeFN_or_tree) == tree.TreeNode:
+        t = treeFN_or_tree
+    else:
+        if (not os.path.exists(treeFN_or_tree)) or os.stat(treeFN_or_tree).st_size == 0: return None
+        text = RenamedTreeText(treeFN_or_tree, idsMap, qSupport, qFixNegatives, inFormat, label)
+        if text != None: return text
+        if inFormat == None:
+            try:
+                t = tree_cache.ReadTree(treeFN_or_tree, format=2)
+                qHaveSupport = True
+            except newick.NewickError:
+                t = tree_cache.ReadTree(treeFN_or_tree)
         else:
-            qHaveSupport = False
-            if inFormat == None:
-                try:
-                    t = tree.Tree(treeFN_or_tree, format=2)
-                    qHaveSupport = True
-                except:
-                    t = tree.Tree(treeFN_or_tree)
-            else:
-                t = tree.Tree(treeFN_or_tree, format=inFormat)
-        for node in t.get_leaves():
-            node.name = idsMap[node.name]
-        if qFixNegatives:
-            tree_length = sum([n.dist for n in t.traverse() if n != t])
-            sliver = tree_length * 1e-6
-        iNode = 1
-        for n in t.traverse():
-            if qFixNegatives and n.dist < 0.0: n.dist = sliver
-            if label != None:
-                if (not n.is_leaf()) and (not n.is_root()):
-                    n.name = label + ("%d" % iNode)
-                    iNode += 1
+            t = tree_cache.ReadTree(treeFN_or_tree, format=inFormat)
+    for node in t.get_leaves():
+        node.name = idsMap[node.name]
+    if qFixNegatives:
+        tree_length = sum([n.dist for n in t.traverse() if n != t])
+        sliver = tree_length * 1e-6
+    iNode = 1
+    for n in t.traverse():
+        if qFixNegatives and n.dist < 0.0: n.dist = sliver
         if label != None:
-            with open(newTreeFilename, 'wb') as outfile:
-                outfile.write(t.write(format=3)[:-1] + label + "0;")  # internal + terminal branch lengths, leaf names, node names. (tree library won't label root node)
-        elif t.name == "N0" or t.name == "n0":
-            with open(newTreeFilename, 'wb') as outfile:
-                outfile.write(t.write(format=3)[:-1] + t.name + ";")  # internal + terminal branch lengths, leaf names, node names. (tree library won't label root node)
-        else:
-            if qSupport or qHaveSupport:
-                t.write(outfile = newTreeFilename, format=2)  
-            else:
-                t.write(outfile = newTreeFilename, format=5)  
-    except:
-        pass
+            if (not n.is_leaf()) and (not n.is_root()):
+                n.name = label + ("%d" % iNode)
+                iNode += 1
+    if label != None:
+        text = t.write(format=3)[:-1] + label + "0;"  # internal + terminal branch lengths, leaf names, node names. (tree library won't label root node)
+    elif t.name == "N0" or t.name == "n0":
+        text = t.write(format=3)[:-1] + t.name + ";"  # internal + terminal branch lengths, leaf names, node names. (tree library won't label root node)
+    elif qSupport or qHaveSupport:
+        text = t.write(format=2)
+    else:
+        text = t.write(format=5)
+    return text
     
 """
 Find results of previous run    